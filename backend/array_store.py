@@ -0,0 +1,147 @@
+"""
+Memory-mapped array files shared by all API workers.
+
+A store file is: magic, uint64 header length, JSON header (metadata plus
+dtype/shape/offset of every array), then each array 64-byte aligned.
+Readers mmap the file read-only and get zero-copy NumPy views, so every
+uvicorn/gunicorn worker that opens the same file shares one copy of the
+pages through the OS page cache.
+
+load_or_build() makes sure only one worker builds a missing or stale file:
+the others wait on its flock and then map the result.
+"""
+
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads within a process
+    fcntl = None
+
+STORE_MAGIC = b"ARRSTOR1"
+_ALIGN = 64
+_process_lock = threading.Lock()
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_arrays(path, arrays, meta):
+    """Write arrays + JSON-serializable meta to path via a temp file and rename."""
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    specs, offset = {}, 0
+    for name, a in arrays.items():
+        specs[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset += _aligned(a.nbytes)
+    header = json.dumps({"meta": meta, "arrays": specs}).encode("utf-8")
+    data_start = _aligned(len(STORE_MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(STORE_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, a in arrays.items():
+                f.seek(data_start + specs[name]["offset"])
+                f.write(a.tobytes())
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_arrays(path):
+    """
+    Map a store file read-only. Returns (arrays, meta); each array keeps the
+    mapping alive through its .base, so nothing needs closing.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise ValueError(f"{path} is not an array store file")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = _aligned(len(STORE_MAGIC) + 8 + header_len)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        a = np.frombuffer(mm, dtype=dtype, count=count, offset=data_start + spec["offset"])
+        arrays[name] = a.reshape(spec["shape"])
+    return arrays, header["meta"]
+
+
+class FileLock:
+    """
+    Thread lock plus an exclusive flock on lock_path, so threads of this
+    process and other worker processes queue behind the holder.
+    """
+
+    def __init__(self, lock_path, thread_lock):
+        self.path = lock_path
+        self.thread_lock = thread_lock
+        self.fd = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.thread_lock.release()
+
+
+def build_lock(path):
+    """Exclusive lock on <path>.lock, held while one worker (re)builds path."""
+    return FileLock(path + ".lock", _process_lock)
+
+
+def _try_read(path, is_current):
+    if not os.path.exists(path):
+        return None
+    try:
+        arrays, meta = read_arrays(path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable array store {path} ({e})")
+        return None
+    return (arrays, meta) if is_current(meta) else None
+
+
+def load_or_build(path, is_current, build):
+    """
+    Map path if is_current(meta) accepts it. Otherwise take the build lock,
+    call build() -> (arrays, meta), publish the file and map it. If the file
+    cannot be written the freshly built (private) arrays are returned.
+    """
+    found = _try_read(path, is_current)
+    if found is not None:
+        return found
+    with build_lock(path):
+        # another worker may have finished the build while we waited
+        found = _try_read(path, is_current)
+        if found is not None:
+            return found
+        arrays, meta = build()
+        try:
+            write_arrays(path, arrays, meta)
+        except OSError as e:
+            print(f"Warning: could not write array store {path} ({e})")
+            return arrays, meta
+    return read_arrays(path)
@@ -0,0 +1,236 @@
+"""
+Benchmarks for SubsidyFraudDetector on synthetic application sets.
+
+Usage:
+    python benchmark_fraud_detector.py [n_rows ...]     (default: 10000 100000 1000000)
+
+The row-by-row feature extraction, DataFrame-filter crop-norm lookup and
+per-row fraud reasons the detector used to ship are kept here (legacy_*),
+both as the reference for the parity tests and to show what replaced them.
+legacy_extract_features is quadratic, so it is only timed on the smaller sets.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import joblib
+
+import numpy as np
+import pandas as pd
+
+from fraud_detector import SubsidyFraudDetector
+
+CROPS = ["Paddy", "Wheat", "Maize", "Cotton", "Sugarcane", "Groundnut", "Soybean", "Potato",
+         "Red Gram", "Dragonfruit"]
+STATES = ["Bihar", "Punjab", "Kerala", "Odisha", "Gujarat", "Assam", "Tamil Nadu", "Haryana"]
+# the legacy loop is O(n^2); skip it above this many rows
+LEGACY_MAX_ROWS = 20000
+
+
+def synthetic_applications(n, seed=0):
+    """n applications over 8 states / ~400 districts with a few ghost-farmer outliers."""
+    rng = np.random.default_rng(seed)
+    state = rng.choice(STATES, n)
+    district = np.char.add(np.char.add(state, "-D"), rng.integers(0, 50, n).astype(str))
+    land = np.round(rng.lognormal(1.0, 0.8, n), 2)
+    outliers = rng.random(n) < 0.01
+    land[outliers] = np.round(rng.uniform(100, 500, outliers.sum()), 2)
+    return pd.DataFrame({
+        "application_id": [f"APP{i:07d}" for i in range(n)],
+        "total_land_acres": land,
+        "crop_type": rng.choice(CROPS, n),
+        "district": district,
+        "state": state,
+    })
+
+
+def legacy_get_crop_norm(crop_norms, crop_name):
+    """The original get_crop_norm: DataFrame filter, then an iterrows() substring scan."""
+    crop_normalized = crop_name.lower().strip()
+    match = crop_norms[crop_norms['crop_normalized'] == crop_normalized]
+    if not match.empty:
+        return {
+            'fertilizer_per_acre': float(match.iloc[0]['fertilizer_kg_per_acre']),
+            'seed_per_acre': float(match.iloc[0]['seed_kg_per_acre'])
+        }
+    for _, row in crop_norms.iterrows():
+        if crop_normalized in row['crop_normalized'] or row['crop_normalized'] in crop_normalized:
+            return {
+                'fertilizer_per_acre': float(row['fertilizer_kg_per_acre']),
+                'seed_per_acre': float(row['seed_kg_per_acre'])
+            }
+    return {
+        'fertilizer_per_acre': crop_norms['fertilizer_kg_per_acre'].mean(),
+        'seed_per_acre': crop_norms['seed_kg_per_acre'].mean()
+    }
+
+
+def legacy_extract_features(detector, applications_df):
+    """The original iterrows() implementation of extract_features."""
+    if applications_df.empty:
+        return pd.DataFrame()
+    features = []
+    for idx, app in applications_df.iterrows():
+        norms = legacy_get_crop_norm(detector.crop_norms, app['crop_type'])
+        expected_fertilizer = norms['fertilizer_per_acre'] * app['total_land_acres']
+        feature_dict = {
+            'application_id': app['application_id'],
+            'land_acres': app['total_land_acres'],
+            'expected_fertilizer_total': expected_fertilizer,
+            'land_size_category': detector._categorize_land_size(app['total_land_acres']),
+        }
+        district_count = len(applications_df[applications_df['district'] == app['district']])
+        feature_dict['district_application_density'] = district_count
+        district_apps = applications_df[applications_df['district'] == app['district']]
+        district_avg_land = district_apps['total_land_acres'].mean()
+        feature_dict['land_deviation_from_district_avg'] = abs(app['total_land_acres'] - district_avg_land)
+        state_count = len(applications_df[applications_df['state'] == app['state']])
+        feature_dict['state_application_count'] = state_count
+        feature_dict['is_large_holding'] = 1 if app['total_land_acres'] > 100 else 0
+        feature_dict['is_small_holding'] = 1 if app['total_land_acres'] < 0.5 else 0
+        features.append(feature_dict)
+    return pd.DataFrame(features)
+
+
+def legacy_generate_fraud_reasons(row):
+    """The original per-row _generate_fraud_reasons, run through results.apply(axis=1)."""
+    reasons = []
+    if row['land_acres'] > 100:
+        reasons.append(f"Unusually large land holding ({row['land_acres']:.1f} acres)")
+    elif row['land_acres'] < 0.5:
+        reasons.append(f"Extremely small land holding ({row['land_acres']:.1f} acres)")
+    if row['district_density'] > 50:
+        reasons.append(f"High application density in district ({row['district_density']} applications)")
+    if row['land_deviation'] > 20:
+        reasons.append(f"Land size significantly different from district average (±{row['land_deviation']:.1f} acres)")
+    if row['is_anomaly']:
+        reasons.append("Statistical anomaly detected by ML model")
+    return reasons if reasons else ['No specific indicators']
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_extract_features(detector, sizes):
+    print("extract_features")
+    for n in sizes:
+        apps = synthetic_applications(n)
+        _, fast = _timed(detector.extract_features, apps)
+        line = f"  {n:>9,} rows  vectorized {fast:8.3f} s"
+        if n <= LEGACY_MAX_ROWS:
+            _, slow = _timed(legacy_extract_features, detector, apps)
+            line += f"   iterrows {slow:8.2f} s  ({slow / fast:,.0f}x)"
+        print(line)
+
+
+def bench_crop_norms(detector, n=20000):
+    print("crop norm lookups")
+    crops = synthetic_applications(n)["crop_type"]
+    _, legacy = _timed(lambda: [legacy_get_crop_norm(detector.crop_norms, c) for c in crops])
+    _, compiled = _timed(lambda: [detector.get_crop_norm(c) for c in crops])
+    _, series = _timed(detector.resolve_norms, crops)
+    print(f"  {n:>9,} crops  DataFrame filter {legacy:7.3f} s   get_crop_norm {compiled:7.4f} s"
+          f"   resolve_norms {series:7.4f} s")
+
+
+def bench_check_eligibility(detector, n=100000):
+    print("check_eligibility")
+    apps = synthetic_applications(n)
+    qty = apps["total_land_acres"].to_numpy() * 40
+    _, batch = _timed(detector.check_eligibility_batch, apps["crop_type"], apps["total_land_acres"], qty)
+    sample = min(n, 10000)
+    _, scalar = _timed(lambda: [detector.check_eligibility(c, l, q) for c, l, q in
+                                zip(apps["crop_type"][:sample], apps["total_land_acres"][:sample], qty[:sample])])
+    print(f"  {n:>9,} checks  batch {batch:7.3f} s   per-call {scalar * n / sample:7.3f} s (extrapolated)")
+
+
+def bench_fraud_reasons(detector, n=100000):
+    print("fraud reasons")
+    apps = synthetic_applications(n)
+    detector.train(apps)
+    results = detector.predict_anomalies(apps)
+    _, codes = _timed(detector._fraud_reason_codes, results)
+    _, legacy = _timed(lambda: results.apply(legacy_generate_fraud_reasons, axis=1))
+    _, top = _timed(detector.describe_fraud_reasons, results.nlargest(10, "anomaly_score"))
+    print(f"  {n:>9,} rows  reason bitmask {codes:7.4f} s   describe top 10 {top:7.4f} s"
+          f"   apply(axis=1) {legacy:7.3f} s")
+
+
+def bench_fraud_statistics(detector, n=500000, chunksize=50000):
+    """Peak traced memory of get_fraud_statistics, whole frame vs chunked."""
+    print("fraud statistics")
+    apps = synthetic_applications(n)
+    detector.train(apps.iloc[:50000])
+    for label, kwargs in (("whole frame", {}), (f"chunks of {chunksize:,}", {"chunksize": chunksize})):
+        _, seconds = _timed(lambda: detector.get_fraud_statistics(apps, **kwargs))
+        # traced separately: tracemalloc slows allocation-heavy code down
+        tracemalloc.start()
+        detector.get_fraud_statistics(apps, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {n:>9,} rows  {label:>18}  {seconds:7.2f} s   peak {peak / 2 ** 20:7.1f} MiB")
+
+
+# loads a model in a fresh interpreter and prints the RSS it added, in MiB
+_RSS_PROBE = """
+import sys
+from fraud_detector import SubsidyFraudDetector
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * 4096 / 2 ** 20
+
+detector = SubsidyFraudDetector(crop_norms_path='data/crop_norms.csv')
+before = rss()
+detector.load_model(sys.argv[1], mmap=sys.argv[2] == 'mmap')
+print(rss() - before)
+"""
+
+
+def _load_rss(path, mode):
+    out = subprocess.run([sys.executable, "-c", _RSS_PROBE, path, mode], capture_output=True, text=True,
+                         check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def bench_model_artifacts(detector, n=200000, max_samples=20000):
+    """Load time and RSS of one worker: legacy single pickle vs model directory."""
+    print("model artifacts")
+    detector.train(synthetic_applications(n), max_samples=max_samples, n_jobs=-1)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "fraud_detection_model.pkl")
+        joblib.dump({"isolation_forest": detector.isolation_forest, "scaler": detector.scaler,
+                     "crop_norms": detector.crop_norms, "district_stats": detector.district_stats,
+                     "state_stats": detector.state_stats}, legacy)
+        directory = os.path.join(tmp, "fraud_detection_model")
+        detector.save_model(directory)
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        print(f"  max_samples={max_samples}  pickle {os.path.getsize(legacy) / 2 ** 20:.1f} MiB"
+              f"   directory {size / 2 ** 20:.1f} MiB")
+        for label, path, mode in (("pickle", legacy, "copy"), ("directory", directory, "copy"),
+                                  ("directory+mmap", directory, "mmap")):
+            target = SubsidyFraudDetector(crop_norms_path="data/crop_norms.csv")
+            times = [_timed(target.load_model, path, mode == "mmap")[1] for _ in range(5)]
+            print(f"  {label:>15}  load {sorted(times)[2]:7.3f} s   worker RSS +{_load_rss(path, mode):6.1f} MiB")
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+    detector = SubsidyFraudDetector(crop_norms_path="data/crop_norms.csv")
+    bench_extract_features(detector, sizes)
+    bench_crop_norms(detector)
+    bench_check_eligibility(detector)
+    bench_fraud_reasons(detector)
+    bench_fraud_statistics(detector)
+    bench_model_artifacts(detector)
+
+
+if __name__ == "__main__":
+    main()
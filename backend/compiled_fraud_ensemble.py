@@ -0,0 +1,269 @@
+"""
+Compiled Fraud Ensemble
+
+Flattens the fitted fraud models (feature scaler, IsolationForest and the
+XGBoost / GradientBoosting fraud classifier) into the NumPy node arrays
+of compiled_quota_model, with the trees of both ensembles in one set of
+arrays. One apply_trees descent gives every tree's leaf, so a row's
+anomaly score and fraud probability come out of a single traversal,
+instead of decision_function + predict + predict_proba each walking the
+trees again behind sklearn/xgboost per-call overhead.
+
+Leaf values are precomputed per ensemble:
+- IsolationForest -> path length (node depth + average path length of the
+  samples left in the leaf), averaged into sklearn's score_samples
+- classifier -> raw margin contribution (learning rate already applied),
+  summed onto the initial margin and passed through the logistic link
+
+    python compiled_fraud_ensemble.py ../Hackathon_Nitro/models
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+from compiled_quota_model import apply_trees, flatten_trees
+
+# apply_trees costs grow with rows x trees; from about this many rows on, the
+# models' own compiled tree code scores a batch faster
+MAX_COMPILED_ROWS = 256
+
+
+def _average_path_length(n_samples):
+    """sklearn.ensemble._iforest._average_path_length, elementwise."""
+    n = np.asarray(n_samples, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class _XGBoostTree:
+    """One tree of an XGBoost JSON dump, shaped like sklearn's Tree for flatten_trees."""
+
+    def __init__(self, tree):
+        self.children_left = np.asarray(tree["left_children"], dtype=np.int64)
+        self.children_right = np.asarray(tree["right_children"], dtype=np.int64)
+        self.node_count = len(self.children_left)
+        is_leaf = self.children_left == -1
+        self.feature = np.where(is_leaf, -2, np.asarray(tree["split_indices"], dtype=np.int64))
+        # XGBoost goes left on x < t in float32; apply_trees goes left on x <= threshold
+        t = np.asarray(tree["split_conditions"], dtype=np.float32)
+        self.threshold = np.where(is_leaf, t, np.nextafter(t, np.float32(-np.inf))).astype(np.float64)
+        self.missing_go_to_left = np.asarray(tree["default_left"], dtype=bool)
+        # leaf values sit in split_conditions, learning rate already applied
+        self.value = np.where(is_leaf, t, 0.0).astype(np.float64).reshape(-1, 1, 1)
+        self.n_node_samples = np.zeros(self.node_count)
+        self.max_depth = int(_tree_depth(self.children_left, self.children_right))
+
+
+def _tree_depth(children_left, children_right):
+    depth = np.zeros(len(children_left), dtype=np.int64)
+    for node in range(len(children_left)):
+        if children_left[node] != -1:
+            depth[children_left[node]] = depth[node] + 1
+            depth[children_right[node]] = depth[node] + 1
+    return depth.max() if len(depth) else 0
+
+
+class CompiledFraudEnsemble:
+    """
+    NumPy-only replacement for scaler.transform + isolation_forest.decision_function
+    (+ classifier.predict_proba[:, 1]) on the same rows.
+    """
+
+    def __init__(self, nodes, n_anomaly_trees, anomaly, classifier=None, scaler=None):
+        # nodes: flatten_trees arrays, IsolationForest trees first; value holds leaf
+        #   path lengths for those trees and margin contributions for the rest
+        # anomaly: {"offset", "c_max_samples"}; classifier: {"init"} or None
+        # scaler: (mean, scale) arrays or None
+        self.nodes = nodes
+        self.n_anomaly_trees = n_anomaly_trees
+        self.anomaly = anomaly
+        self.classifier = classifier
+        self.scaler = scaler
+        self.n_features = anomaly["n_features"]
+        self.has_classifier = classifier is not None
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the ensemble expects {self.n_features}")
+        if self.scaler is None:
+            return X
+        mean, scale = self.scaler
+        return (X - mean) / scale
+
+    def evaluate(self, X):
+        """
+        Unscaled feature rows -> (decision, fraud_probability), as
+        isolation_forest.decision_function and classifier.predict_proba[:, 1]
+        would give them on the scaled rows. fraud_probability is None without
+        a classifier. Anomalies are rows with decision < 0.
+        """
+        values = self.nodes["value"][apply_trees(self.transform(X), self.nodes)]
+        k = self.n_anomaly_trees
+        path_length = values[:, :k].mean(axis=1)
+        score_samples = -(2.0 ** (-path_length / self.anomaly["c_max_samples"]))
+        decision = score_samples - self.anomaly["offset"]
+        if not self.has_classifier:
+            return decision, None
+        margin = self.classifier["init"] + values[:, k:].sum(axis=1)
+        return decision, 1.0 / (1.0 + np.exp(-margin))
+
+    def evaluate_one(self, x):
+        """evaluate for one feature vector; returns floats (probability None without a classifier)."""
+        decision, proba = self.evaluate(x)
+        return float(decision[0]), (None if proba is None else float(proba[0]))
+
+
+# ---------- compiling ----------
+def compile_fraud_ensemble(isolation_forest, scaler=None, classifier=None):
+    """
+    Compile a fitted IsolationForest, with the StandardScaler its input goes
+    through and an optional binary XGBClassifier / GradientBoostingClassifier
+    scored on the same scaled rows. Raises NotImplementedError for models it
+    does not know how to flatten, so callers can keep the original objects.
+    """
+    if type(isolation_forest).__name__ != "IsolationForest":
+        raise NotImplementedError(f"unsupported anomaly model {type(isolation_forest).__name__}")
+    trees = [e.tree_ for e in isolation_forest.estimators_]
+    n_features = int(isolation_forest.n_features_in_)
+
+    classifier_spec, classifier_trees = None, []
+    if classifier is not None:
+        classifier_spec, classifier_trees = _compile_classifier(classifier)
+
+    nodes = flatten_trees(trees + classifier_trees)
+    n_anomaly_nodes = int(nodes["roots"][len(trees)]) if classifier_trees else len(nodes["value"])
+
+    # IsolationForest leaves hold their path length; trees fitted on a feature
+    # subset index into it, so map back to the full feature vector
+    nodes["value"][:n_anomaly_nodes] = (nodes["depth"][:n_anomaly_nodes]
+                                        + _average_path_length(nodes["n_node_samples"][:n_anomaly_nodes]))
+    if isolation_forest._max_features != n_features:
+        ends = list(nodes["roots"][1:len(trees)]) + [n_anomaly_nodes]
+        for start, end, features in zip(nodes["roots"], ends, isolation_forest.estimators_features_):
+            is_split = nodes["left"][start:end] != -1
+            nodes["feature"][start:end][is_split] = np.asarray(features)[nodes["feature"][start:end][is_split]]
+
+    anomaly = {"offset": float(isolation_forest.offset_),
+               "c_max_samples": float(_average_path_length([isolation_forest.max_samples_])[0]),
+               "n_features": n_features}
+    return CompiledFraudEnsemble(nodes, len(trees), anomaly, classifier_spec, _compile_scaler(scaler, n_features))
+
+
+def _compile_scaler(scaler, n_features):
+    if scaler is None:
+        return None
+    if type(scaler).__name__ != "StandardScaler":
+        raise NotImplementedError(f"unsupported scaler {type(scaler).__name__}")
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+    return np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+def _compile_classifier(classifier):
+    kind = type(classifier).__name__
+    if kind == "GradientBoostingClassifier":
+        if classifier.estimators_.shape[1] != 1:
+            raise NotImplementedError("only binary GradientBoostingClassifier is supported")
+        if classifier.init_ == "zero":
+            init = 0.0
+        elif hasattr(classifier.init_, "class_prior_"):
+            prior = float(classifier.init_.class_prior_[1])
+            init = float(np.log(prior / (1.0 - prior)))
+        else:
+            raise NotImplementedError("GradientBoosting with a custom init estimator")
+        trees = [e.tree_ for e in classifier.estimators_[:, 0]]
+        # fold the learning rate into the leaves
+        trees = [_ScaledTree(tree, classifier.learning_rate) for tree in trees]
+        return {"init": init}, trees
+    if kind == "XGBClassifier":
+        learner = json.loads(bytes(classifier.get_booster().save_raw("json")))["learner"]
+        if learner["objective"]["name"] != "binary:logistic":
+            raise NotImplementedError(f"unsupported XGBoost objective {learner['objective']['name']}")
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree":
+            raise NotImplementedError(f"unsupported XGBoost booster {booster['name']}")
+        trees = booster["model"]["trees"]
+        if any(t.get("categories_nodes") for t in trees):
+            raise NotImplementedError("XGBoost categorical splits are not supported")
+        # predict_proba stops at the best iteration when early stopping was used
+        best_iteration = _best_iteration(classifier)
+        if best_iteration is not None:
+            indptr = booster["model"]["iteration_indptr"]
+            trees = trees[:indptr[best_iteration + 1]]
+        base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        init = float(np.log(base_score / (1.0 - base_score)))
+        return {"init": init}, [_XGBoostTree(t) for t in trees]
+    raise NotImplementedError(f"unsupported classifier {kind}")
+
+
+def _best_iteration(classifier):
+    try:
+        return classifier.best_iteration
+    except AttributeError:  # only defined when early stopping was used
+        return None
+
+
+class _ScaledTree:
+    """A sklearn Tree with its values multiplied by a learning rate, for flatten_trees."""
+
+    def __init__(self, tree, factor):
+        self._tree = tree
+        self.value = tree.value * factor
+
+    def __getattr__(self, name):
+        return getattr(self._tree, name)
+
+
+def main():
+    """Compile the Hackathon_Nitro models, check parity and compare single-row latency."""
+    from pathlib import Path
+
+    import joblib
+
+    models_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "../Hackathon_Nitro/models")
+    isolation_forest = joblib.load(models_dir / "isolation_forest.pkl")
+    scaler = joblib.load(models_dir / "feature_scaler.pkl")
+    xgb_path = models_dir / "xgboost_model.pkl"
+    classifier = joblib.load(xgb_path) if xgb_path.exists() else None
+    compiled = compile_fraud_ensemble(isolation_forest, scaler, classifier)
+
+    rng = np.random.default_rng(0)
+    X = scaler.mean_ + scaler.scale_ * rng.standard_normal((5000, compiled.n_features))
+    X_scaled = scaler.transform(X)
+    decision, proba = compiled.evaluate(X)
+    print(f"max |decision - sklearn|: {np.abs(decision - isolation_forest.decision_function(X_scaled)).max():.3g}")
+    if classifier is not None:
+        print(f"max |probability - classifier|: {np.abs(proba - classifier.predict_proba(X_scaled)[:, 1]).max():.3g}")
+
+    def original(rows):
+        rows_scaled = scaler.transform(rows)
+        isolation_forest.decision_function(rows_scaled)
+        isolation_forest.predict(rows_scaled)
+        if classifier is not None:
+            classifier.predict_proba(rows_scaled)
+
+    row = X[:1]
+    for label, fn in [("original models", lambda: original(row)),
+                      ("compiled evaluate", lambda: compiled.evaluate(row))]:
+        start = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{label:22s} {(time.perf_counter() - start) / 200 * 1e6:9.1f} us/row")
+    for label, fn in [("original batch", lambda: original(X)),
+                      ("compiled batch", lambda: compiled.evaluate(X))]:
+        start = time.perf_counter()
+        fn()
+        print(f"{label:22s} {(time.perf_counter() - start) / len(X) * 1e6:9.1f} us/row")
+
+
+if __name__ == "__main__":
+    main()
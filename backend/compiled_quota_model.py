@@ -0,0 +1,322 @@
+"""
+Compiled Max-Qty Model
+
+Extracts a fitted sklearn quota pipeline (ColumnTransformer + regressor)
+into plain NumPy arrays so one row or a batch can be scored without
+pandas or sklearn:
+- OneHotEncoder -> per-column category lookup tables
+- StandardScaler -> mean/scale vectors
+- linear models -> coef/intercept
+- DecisionTree / RandomForest / ExtraTrees / GradientBoosting regressors
+  -> flat node arrays (feature, threshold, children, leaf value)
+
+The compiled model is saved as an .npz file that loads with NumPy alone,
+which also sidesteps the sklearn version mismatch that kept
+max_qty_model.pkl disabled: export once where the pickle loads, serve
+the .npz anywhere.
+
+    python compiled_quota_model.py max_qty_model.pkl max_qty_model.npz
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# final estimators by how they are compiled
+_LINEAR = {"LinearRegression", "Ridge", "Lasso", "ElasticNet", "SGDRegressor", "HuberRegressor"}
+_TREE = {"DecisionTreeRegressor", "ExtraTreeRegressor"}
+_FOREST = {"RandomForestRegressor", "ExtraTreesRegressor"}
+_BOOSTING = {"GradientBoostingRegressor"}
+
+
+def flatten_trees(trees):
+    """
+    Concatenate fitted sklearn Tree objects (estimator.tree_) into one set
+    of node arrays. Child indices are global; leaves have left == -1.
+
+    Returns dict with feature, threshold, left, right, missing_left,
+    value (first output of each node), n_node_samples, depth, roots and
+    max_depth.
+    """
+    feature, threshold, left, right, missing_left = [], [], [], [], []
+    value, n_node_samples, depth, roots = [], [], [], []
+    offset, max_depth = 0, 0
+    for tree in trees:
+        n = tree.node_count
+        roots.append(offset)
+        is_leaf = tree.children_left == -1
+        feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(tree.threshold.astype(np.float64))
+        left.append(np.where(is_leaf, -1, tree.children_left + offset).astype(np.int32))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset).astype(np.int32))
+        mgl = getattr(tree, "missing_go_to_left", None)
+        missing_left.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+        value.append(tree.value[:, 0, 0].astype(np.float64))
+        n_node_samples.append(tree.n_node_samples.astype(np.float64))
+        depth.append(_node_depths(tree.children_left, tree.children_right))
+        max_depth = max(max_depth, int(tree.max_depth))
+        offset += n
+    return {
+        "feature": np.concatenate(feature) if feature else np.zeros(0, np.int32),
+        "threshold": np.concatenate(threshold) if threshold else np.zeros(0),
+        "left": np.concatenate(left) if left else np.zeros(0, np.int32),
+        "right": np.concatenate(right) if right else np.zeros(0, np.int32),
+        "missing_left": np.concatenate(missing_left) if missing_left else np.zeros(0, bool),
+        "value": np.concatenate(value) if value else np.zeros(0),
+        "n_node_samples": np.concatenate(n_node_samples) if n_node_samples else np.zeros(0),
+        "depth": np.concatenate(depth) if depth else np.zeros(0),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": max_depth,
+    }
+
+
+def _node_depths(children_left, children_right):
+    depth = np.zeros(len(children_left), dtype=np.float64)
+    for node in range(len(children_left)):
+        if children_left[node] != -1:
+            depth[children_left[node]] = depth[node] + 1
+            depth[children_right[node]] = depth[node] + 1
+    return depth
+
+
+def apply_trees(X, nodes, roots=None):
+    """
+    Leaf index of every (row, tree) pair: one vectorized descent step per
+    tree level. X is (n_rows, n_features); returns (n_rows, n_trees) int.
+    Compares in float32 like sklearn's tree code.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    roots = nodes["roots"] if roots is None else roots
+    node = np.broadcast_to(roots, (X.shape[0], len(roots))).copy()
+    rows = np.arange(X.shape[0])[:, None]
+    left, right = nodes["left"], nodes["right"]
+    for _ in range(nodes["max_depth"]):
+        child_left = left[node]
+        active = child_left != -1
+        if not active.any():
+            break
+        x = X[rows, nodes["feature"][node]]
+        go_left = np.where(np.isnan(x), nodes["missing_left"][node], x <= nodes["threshold"][node])
+        node = np.where(active, np.where(go_left, child_left, right[node]), node)
+    return node
+
+
+class CompiledQuotaModel:
+    """NumPy-only replacement for the quota model_pipe.predict."""
+
+    def __init__(self, categorical, numeric, estimator):
+        # categorical: list of (column, categories, unknown_ok, output offset)
+        # numeric: list of (column, mean, scale, output offset)
+        self.categorical = categorical
+        self.numeric = numeric
+        self.estimator = estimator
+        self.n_features = estimator["n_features"]
+        self._lookup = [
+            (col, {c: i for i, c in enumerate(cats)}, unknown_ok, offset)
+            for col, cats, unknown_ok, offset in categorical
+        ]
+
+    # ---------- scoring ----------
+    def transform(self, X):
+        """
+        Encoded feature matrix. X is any mapping of column -> values: a
+        dict of lists/arrays, a pandas DataFrame, or a single-row dict of
+        scalars.
+        """
+        n = len(np.atleast_1d(X[self.numeric[0][0]] if self.numeric else X[self.categorical[0][0]]))
+        out = np.zeros((n, self.n_features), dtype=np.float64)
+        rows = np.arange(n)
+        for col, lookup, unknown_ok, offset in self._lookup:
+            values = np.atleast_1d(np.asarray(X[col], dtype=object))
+            idx = np.fromiter((lookup.get(v, -1) for v in values), dtype=np.int64, count=n)
+            if not unknown_ok and (idx < 0).any():
+                raise ValueError(f"Found unknown categories in column '{col}'")
+            hit = idx >= 0
+            out[rows[hit], offset + idx[hit]] = 1.0
+        for col, mean, scale, offset in self.numeric:
+            out[:, offset] = (np.atleast_1d(np.asarray(X[col], dtype=np.float64)) - mean) / scale
+        return out
+
+    def predict(self, X):
+        return self.predict_encoded(self.transform(X))
+
+    def predict_one(self, row: dict):
+        return float(self.predict(row)[0])
+
+    def predict_encoded(self, Z):
+        est = self.estimator
+        if est["kind"] == "linear":
+            return Z @ est["coef"] + est["intercept"]
+        leaves = apply_trees(Z, est["nodes"])
+        values = est["nodes"]["value"][leaves]
+        if est["kind"] == "forest":
+            return values.mean(axis=1)
+        return est["init"] + est["learning_rate"] * values.sum(axis=1)
+
+    # ---------- persistence ----------
+    def save(self, path):
+        arrays = {}
+        spec = {"version": FORMAT_VERSION, "categorical": [], "numeric": [], "estimator": {}}
+        for i, (col, cats, unknown_ok, offset) in enumerate(self.categorical):
+            arrays[f"cat{i}"] = np.asarray(cats, dtype=str)
+            spec["categorical"].append([col, unknown_ok, offset])
+        for col, mean, scale, offset in self.numeric:
+            spec["numeric"].append([col, float(mean), float(scale), offset])
+        for key, value in self.estimator.items():
+            if key == "nodes":
+                for name, a in value.items():
+                    if name == "max_depth":
+                        spec["estimator"]["max_depth"] = a
+                    else:
+                        arrays["nodes." + name] = a
+            elif isinstance(value, np.ndarray):
+                arrays["est." + key] = value
+            else:
+                spec["estimator"][key] = value
+        np.savez(path, spec=np.asarray(json.dumps(spec)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            spec = json.loads(str(data["spec"]))
+            if spec.get("version") != FORMAT_VERSION:
+                raise ValueError(f"unsupported compiled model version {spec.get('version')}")
+            categorical = [
+                (col, data[f"cat{i}"].tolist(), unknown_ok, offset)
+                for i, (col, unknown_ok, offset) in enumerate(spec["categorical"])
+            ]
+            numeric = [tuple(item) for item in spec["numeric"]]
+            estimator = dict(spec["estimator"])
+            nodes = {k[len("nodes."):]: data[k] for k in data.files if k.startswith("nodes.")}
+            if nodes:
+                nodes["max_depth"] = estimator.pop("max_depth")
+                estimator["nodes"] = nodes
+            for k in data.files:
+                if k.startswith("est."):
+                    estimator[k[len("est."):]] = data[k]
+        return cls(categorical, numeric, estimator)
+
+
+# ---------- compiling ----------
+def compile_pipeline(pipe):
+    """
+    Compile a fitted Pipeline([ColumnTransformer, regressor]). Raises
+    NotImplementedError for steps it does not know how to flatten, so
+    callers can fall back to the sklearn object.
+    """
+    steps = getattr(pipe, "steps", None)
+    if not steps or len(steps) != 2:
+        raise NotImplementedError("expected Pipeline([ColumnTransformer, regressor])")
+    pre, model = steps[0][1], steps[1][1]
+    categorical, numeric, n_features = _compile_column_transformer(pre)
+    estimator = _compile_estimator(model)
+    estimator["n_features"] = n_features
+    return CompiledQuotaModel(categorical, numeric, estimator)
+
+
+def _compile_column_transformer(pre):
+    if type(pre).__name__ != "ColumnTransformer":
+        raise NotImplementedError(f"unsupported preprocessor {type(pre).__name__}")
+    categorical, numeric, offset = [], [], 0
+    for name, trans, columns in pre.transformers_:
+        if isinstance(trans, str) and trans == "drop" or len(columns) == 0:
+            continue
+        columns = list(columns)
+        if any(not isinstance(c, str) for c in columns):
+            raise NotImplementedError("columns must be selected by name")
+        kind = trans if isinstance(trans, str) else type(trans).__name__
+        if kind == "FunctionTransformer" and trans.func is None:
+            # sklearn >= 1.6 stores remainder="passthrough" as an identity FunctionTransformer
+            kind = "passthrough"
+        if kind == "OneHotEncoder":
+            if trans.drop is not None or getattr(trans, "_infrequent_enabled", False):
+                raise NotImplementedError("OneHotEncoder drop/infrequent categories are not supported")
+            unknown_ok = trans.handle_unknown != "error"
+            for col, cats in zip(columns, trans.categories_):
+                categorical.append((col, list(cats), unknown_ok, offset))
+                offset += len(cats)
+        elif kind == "StandardScaler":
+            mean = trans.mean_ if trans.with_mean else np.zeros(len(columns))
+            scale = trans.scale_ if trans.with_std else np.ones(len(columns))
+            for col, m, s in zip(columns, mean, scale):
+                numeric.append((col, float(m), float(s), offset))
+                offset += 1
+        elif kind == "passthrough":
+            for col in columns:
+                numeric.append((col, 0.0, 1.0, offset))
+                offset += 1
+        else:
+            raise NotImplementedError(f"unsupported transformer {kind}")
+    return categorical, numeric, offset
+
+
+def _compile_estimator(model):
+    kind = type(model).__name__
+    if kind in _LINEAR:
+        return {"kind": "linear",
+                "coef": np.asarray(model.coef_, dtype=np.float64).ravel(),
+                "intercept": float(np.ravel(model.intercept_)[0])}
+    if kind in _TREE:
+        return {"kind": "forest", "nodes": flatten_trees([model.tree_])}
+    if kind in _FOREST:
+        return {"kind": "forest", "nodes": flatten_trees([e.tree_ for e in model.estimators_])}
+    if kind in _BOOSTING:
+        if model.init_ == "zero":
+            init = 0.0
+        elif hasattr(model.init_, "constant_"):
+            init = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise NotImplementedError("GradientBoosting with a custom init estimator")
+        return {"kind": "boosting", "init": init, "learning_rate": float(model.learning_rate),
+                "nodes": flatten_trees([e.tree_ for e in model.estimators_[:, 0]])}
+    raise NotImplementedError(f"unsupported estimator {kind}")
+
+
+def _sample_rows(compiled, n, seed=0):
+    """Random rows over the categories and numeric ranges the model was fitted on."""
+    rng = np.random.default_rng(seed)
+    X = {}
+    for col, cats, _, _ in compiled.categorical:
+        X[col] = np.asarray(cats, dtype=object)[rng.integers(0, len(cats), n)]
+    for col, mean, scale, _ in compiled.numeric:
+        X[col] = mean + scale * rng.standard_normal(n)
+    return X
+
+
+def main():
+    """Compile a pickled pipeline, check parity and compare single-row latency."""
+    import joblib
+    import pandas as pd
+
+    if len(sys.argv) < 3:
+        print("usage: python compiled_quota_model.py max_qty_model.pkl max_qty_model.npz")
+        return
+    pipe = joblib.load(sys.argv[1])
+    compiled = compile_pipeline(pipe)
+    compiled.save(sys.argv[2])
+    compiled = CompiledQuotaModel.load(sys.argv[2])
+
+    X_df = pd.DataFrame(_sample_rows(compiled, 5000))
+    diff = np.abs(compiled.predict(X_df) - pipe.predict(X_df)).max()
+    print(f"Saved {sys.argv[2]}; max |compiled - sklearn| over {len(X_df)} rows: {diff:.3g}")
+
+    row = X_df.iloc[0].to_dict()
+    for label, fn in [("sklearn pipe.predict", lambda: pipe.predict(pd.DataFrame([row]))),
+                      ("compiled predict_one", lambda: compiled.predict_one(row))]:
+        start = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{label:22s} {(time.perf_counter() - start) / 200 * 1e6:9.1f} us/row")
+    for label, fn in [("sklearn batch", lambda: pipe.predict(X_df)),
+                      ("compiled batch", lambda: compiled.predict(X_df))]:
+        start = time.perf_counter()
+        fn()
+        print(f"{label:22s} {(time.perf_counter() - start) / len(X_df) * 1e6:9.1f} us/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -38,6 +38,15 @@ class Application(Base):
     reviewed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Latest fraud score; fraud_model_version says which published model produced it
+    fraud_score = Column(Float, nullable=True)
+    fraud_is_anomaly = Column(Boolean, nullable=True)
+    fraud_risk_level = Column(String(10), nullable=True, index=True)
+    fraud_reason_codes = Column(Integer, nullable=True)
+    fraud_district_density = Column(Integer, nullable=True)
+    fraud_land_deviation = Column(Float, nullable=True)
+    fraud_model_version = Column(Integer, nullable=True)
+    fraud_scored_at = Column(DateTime, nullable=True)
 
 class User(Base):
     __tablename__ = "users"
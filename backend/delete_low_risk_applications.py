@@ -30,7 +30,8 @@ def delete_non_high_risk_applications():
         
         # Initialize ML fraud detector
         print("\n🔄 Initializing ML fraud detector...")
-        ml_detector = get_ml_integrated_detector()
+        # wait for the models: rules-only results must not drive deletions
+        ml_detector = get_ml_integrated_detector(wait=True)
         
         high_risk_apps = []
         to_delete = []
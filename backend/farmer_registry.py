@@ -0,0 +1,258 @@
+"""
+Columnar Farmer Registry
+
+Holds farmer_registry_*.csv as compact NumPy columns instead of an
+object-dtype DataFrame:
+- aadhaar as int64 keys, with a sorted copy for O(log n) lookups
+- state, district, crop, irrigation and soil as int32 codes into interned
+  category lists
+- land size as float32
+
+The columns (and the sorted lookup index) are persisted to a binary
+sidecar next to the CSV (<csv>.bin, see array_store). The next start, and
+every other worker, memory-maps that file instead of parsing the CSV, as
+long as the CSV's (size, mtime) fingerprint still matches.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from array_store import load_or_build, read_arrays, write_arrays
+
+REG_COLUMNS = [
+    "aadhaar", "farmer_id", "state", "district", "land_size_acres",
+    "usual_crop", "irrigation_type", "soil_type"
+]
+CATEGORICAL_COLUMNS = ["state", "district", "usual_crop", "irrigation_type", "soil_type"]
+
+CACHE_VERSION = 1
+
+
+def file_fingerprint(path):
+    """(size, mtime_ns) of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class FarmerRecord:
+    """One registry row, materialized on lookup. `row` is its position in the registry."""
+    __slots__ = tuple(REG_COLUMNS) + ("row",)
+
+    def __init__(self, row, *values):
+        self.row = row
+        for name, value in zip(REG_COLUMNS, values):
+            setattr(self, name, value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in REG_COLUMNS}
+
+
+class FarmerRegistry:
+    """
+    Read-only columnar registry.
+
+    Arrays may be regular NumPy arrays or zero-copy views over the mmapped
+    cache file; callers should treat them as immutable.
+    """
+
+    def __init__(self, aadhaar, farmer_id, land_size_acres, codes, categories,
+                 sort_order=None, sorted_keys=None, fingerprint=None):
+        self.aadhaar = aadhaar
+        self.farmer_id = farmer_id
+        self.land_size_acres = land_size_acres
+        self.codes = codes
+        self.categories = categories
+        if sort_order is None:
+            # stable sort: on duplicate Aadhaar numbers the first row wins
+            sort_order = np.argsort(aadhaar, kind="stable")
+            sorted_keys = aadhaar[sort_order]
+        self.sort_order = sort_order
+        self.sorted_keys = sorted_keys
+        self.fingerprint = fingerprint
+        # trailing NaN so code -1 (missing value) decodes to NaN
+        self._decode = {
+            name: np.array(list(cats) + [np.nan], dtype=object)
+            for name, cats in categories.items()
+        }
+
+    # ---------- construction ----------
+    @classmethod
+    def from_frame(cls, df, fingerprint=None):
+        """Build from a DataFrame with REG_COLUMNS (as read from the CSV)."""
+        aadhaar = pd.to_numeric(df["aadhaar"], errors="coerce")
+        bad = int(aadhaar.isna().sum())
+        if bad:
+            print(f"Warning: {bad} registry rows have a non-numeric Aadhaar and cannot be looked up.")
+        aadhaar = aadhaar.fillna(-1).to_numpy(dtype=np.int64)
+        # UTF-8, as record() and to_frame() decode it: to_numpy(dtype=np.bytes_) alone is ASCII-only
+        farmer_id = df["farmer_id"].fillna("").astype(str).str.encode("utf-8").to_numpy(dtype=np.bytes_)
+        land = pd.to_numeric(df["land_size_acres"], errors="coerce").fillna(0.0).to_numpy(dtype=np.float32)
+
+        codes, categories = {}, {}
+        for name in CATEGORICAL_COLUMNS:
+            col_codes, uniques = pd.factorize(df[name])
+            codes[name] = col_codes.astype(np.int32)
+            categories[name] = [str(u) for u in uniques]
+        return cls(aadhaar, farmer_id, land, codes, categories, fingerprint=fingerprint)
+
+    @classmethod
+    def from_csv(cls, path):
+        if not os.path.exists(path):
+            print(f"Warning: registry file not found at {path}")
+            return cls.from_frame(pd.DataFrame(columns=REG_COLUMNS))
+        fingerprint = file_fingerprint(path)
+        return cls.from_frame(pd.read_csv(path, dtype={"aadhaar": str}), fingerprint)
+
+    @classmethod
+    def load(cls, csv_path, cache_path=None):
+        """
+        Map the binary cache if it matches csv_path, otherwise parse the CSV
+        and (re)write the cache. Only one worker rebuilds; the rest wait and
+        map its file, so every worker ends up on the same shared pages.
+        """
+        cache_path = cache_path or csv_path + ".bin"
+        fingerprint = file_fingerprint(csv_path)
+        if fingerprint is None:
+            return cls.from_csv(csv_path)
+
+        def is_current(meta):
+            return meta.get("version") == CACHE_VERSION and meta.get("fingerprint") == list(fingerprint)
+
+        def build():
+            registry = cls.from_csv(csv_path)
+            return registry._arrays(), registry._meta()
+
+        arrays, meta = load_or_build(cache_path, is_current, build)
+        return cls._from_arrays(arrays, meta)
+
+    # ---------- binary cache ----------
+    def _arrays(self):
+        arrays = {
+            "aadhaar": self.aadhaar,
+            "farmer_id": self.farmer_id,
+            "land_size_acres": self.land_size_acres,
+            "sort_order": self.sort_order,
+            "sorted_keys": self.sorted_keys,
+        }
+        for name in CATEGORICAL_COLUMNS:
+            arrays["codes." + name] = self.codes[name]
+        return arrays
+
+    def _meta(self):
+        return {
+            "version": CACHE_VERSION,
+            "fingerprint": list(self.fingerprint) if self.fingerprint else None,
+            "categories": self.categories,
+        }
+
+    @classmethod
+    def _from_arrays(cls, arrays, meta):
+        fingerprint = tuple(meta["fingerprint"]) if meta["fingerprint"] else None
+        return cls(
+            arrays["aadhaar"], arrays["farmer_id"], arrays["land_size_acres"],
+            {name: arrays["codes." + name] for name in CATEGORICAL_COLUMNS},
+            meta["categories"], arrays["sort_order"], arrays["sorted_keys"], fingerprint,
+        )
+
+    def write_cache(self, path):
+        write_arrays(path, self._arrays(), self._meta())
+
+    @classmethod
+    def read_cache(cls, path):
+        """Memory-map a cache written by write_cache; arrays are zero-copy views."""
+        arrays, meta = read_arrays(path)
+        if meta.get("version") != CACHE_VERSION:
+            raise ValueError(f"unsupported registry cache version {meta.get('version')}")
+        return cls._from_arrays(arrays, meta)
+
+    # ---------- lookups ----------
+    def __len__(self):
+        return len(self.aadhaar)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._arrays().values())
+
+    def find(self, aadhaar):
+        """Row position of aadhaar, or -1."""
+        key = str(aadhaar).strip()
+        # isdigit alone also accepts digits like '²' or '٣' that int() rejects or maps
+        if not (key.isascii() and key.isdigit()) or len(key) > 18:
+            return -1
+        key = int(key)
+        i = int(np.searchsorted(self.sorted_keys, key))
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+            return int(self.sort_order[i])
+        return -1
+
+    def find_many(self, aadhaar_list):
+        """Vectorized find: row positions aligned with aadhaar_list, -1 where missing."""
+        keys = [str(a).strip() for a in aadhaar_list]
+        valid = np.array([k.isascii() and k.isdigit() and len(k) <= 18 for k in keys], dtype=bool)
+        keys = np.array([int(k) if ok else -1 for k, ok in zip(keys, valid)], dtype=np.int64)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self.sorted_keys) == 0:
+            return rows
+        pos = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        hit = valid & (self.sorted_keys[pos] == keys)
+        rows[hit] = self.sort_order[pos[hit]]
+        return rows
+
+    def record(self, row):
+        """FarmerRecord for row position `row`."""
+        values = {
+            "aadhaar": str(int(self.aadhaar[row])),
+            "farmer_id": self.farmer_id[row].decode("utf-8"),
+            "land_size_acres": round(float(self.land_size_acres[row]), 6),
+        }
+        for name in CATEGORICAL_COLUMNS:
+            values[name] = self._decode[name][self.codes[name][row]]
+        return FarmerRecord(row, *(values[name] for name in REG_COLUMNS))
+
+    def get(self, aadhaar):
+        """FarmerRecord for aadhaar, or None."""
+        row = self.find(aadhaar)
+        return None if row < 0 else self.record(row)
+
+    def to_frame(self):
+        """Registry as a DataFrame with REG_COLUMNS (object columns decoded from codes)."""
+        frame = {
+            "aadhaar": self.aadhaar.astype(str),
+            "farmer_id": np.char.decode(self.farmer_id, "utf-8") if len(self) else np.array([], dtype=object),
+            # float32 -> float64 without exposing representation noise (2.71 not 2.7100000381)
+            "land_size_acres": np.round(self.land_size_acres.astype(np.float64), 6),
+        }
+        for name in CATEGORICAL_COLUMNS:
+            frame[name] = self._decode[name][self.codes[name]]
+        return pd.DataFrame(frame, columns=REG_COLUMNS)
+
+
+def main():
+    """Build the cache for a registry CSV and compare load time / memory with pandas."""
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__) or ".", "farmer_registry_10000.csv")
+
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path, dtype={"aadhaar": str})
+    csv_seconds = time.perf_counter() - start
+    csv_bytes = int(df.memory_usage(deep=True).sum())
+
+    FarmerRegistry.load(csv_path)  # writes <csv>.bin if missing or stale
+    start = time.perf_counter()
+    registry = FarmerRegistry.load(csv_path)
+    cache_seconds = time.perf_counter() - start
+
+    print(f"Rows: {len(registry)}")
+    print(f"pd.read_csv:        {csv_seconds * 1000:9.1f} ms  {csv_bytes / 2**20:8.1f} MB")
+    print(f"mmapped cache load: {cache_seconds * 1000:9.1f} ms  {registry.nbytes / 2**20:8.1f} MB (shared page cache)")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ agricultural subsidy applications, including:
 - Dealer-level fraud patterns
 - Statistical anomalies in fertilizer/seed requirements
 
-Based on Isolation Forest and statistical methods for detecting outliers.
+Based on Isolation Forest and statistical methods for detecting outliers;
+StreamingFraudDetector swaps in Half-Space Trees for online scoring.
 """
 
 import pandas as pd
@@ -17,8 +18,98 @@ import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime
+import heapq
 import joblib
+import json
 import os
+import shutil
+import sklearn
+
+from compiled_fraud_ensemble import MAX_COMPILED_ROWS, compile_fraud_ensemble
+
+# most distinct unmatched crop names remembered by the norm resolver
+MAX_NORM_MEMO = 10000
+
+# features the scaler and Isolation Forest are fitted on
+NUMERICAL_FEATURES = [
+    'land_acres',
+    'expected_fertilizer_total',
+    'district_application_density',
+    'land_deviation_from_district_avg',
+    'state_application_count',
+    'is_large_holding',
+    'is_small_holding'
+]
+
+# on-disk layout written by save_model; bump when it changes incompatibly
+MODEL_FORMAT_VERSION = 1
+
+# trees grown between progress reports when train() is given a progress callback
+TRAIN_PROGRESS_TREES = 10
+
+# fraud reason bits stored in the reason_codes column of predict_anomalies
+REASON_LARGE_HOLDING = 1
+REASON_SMALL_HOLDING = 2
+REASON_HIGH_DISTRICT_DENSITY = 4
+REASON_LAND_DEVIATION = 8
+REASON_ML_ANOMALY = 16
+
+
+def _round_like_python(values, ndigits):
+    """
+    np.round that agrees with Python's round() (what the scalar methods use),
+    i.e. rounds the exact binary value, so 2.675 -> 2.67 because the double
+    is just below the half. Not decimal banker's rounding. np.round scales
+    by 10**ndigits first, which can tip values sitting near a half the other
+    way; those few are re-rounded in Python.
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    with np.errstate(invalid='ignore'):
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+def _replace_empty_dir(src, dst):
+    """Rename directory src over the empty directory dst."""
+    try:
+        # POSIX rename replaces an empty directory in one step
+        os.replace(src, dst)
+    except OSError:
+        # Windows does not rename over directories
+        os.rmdir(dst)
+        os.replace(src, dst)
+
+
+def _accumulate_aggregates(applications_df, district_stats, state_stats):
+    """Fold applications into per-district and per-state running-stat dicts."""
+    if applications_df.empty:
+        return
+    for column, stats in (('district', district_stats), ('state', state_stats)):
+        groups = applications_df.groupby(column, sort=False)['total_land_acres']
+        batch = pd.DataFrame({
+            'size': groups.size(),
+            'count': groups.count(),
+            'mean': groups.mean(),
+            'm2': groups.var(ddof=0) * groups.count(),
+        })
+        for key, size, count, mean, m2 in batch.itertuples():
+            _merge_running_stats(stats.setdefault(key, [0, 0, 0.0, 0.0]), size, count, mean, m2)
+
+
+def _merge_running_stats(entry, size, count, mean, m2):
+    """Fold a batch (size rows, count non-null land values, mean, M2) into entry in place."""
+    entry[0] += int(size)
+    if count == 0:
+        return
+    n = entry[1] + count
+    delta = mean - entry[2]
+    entry[2] += delta * count / n
+    entry[3] += m2 + delta * delta * entry[1] * count / n
+    entry[1] = int(n)
 
 
 class SubsidyFraudDetector:
@@ -32,13 +123,22 @@ class SubsidyFraudDetector:
     4. Deviation from standard fertilizer/seed requirements
     """
     
+    # anomaly model kind, recorded in saved model manifests
+    DETECTOR = 'isolation_forest'
+    
     def __init__(self, crop_norms_path='data/crop_norms.csv'):
         """Initialize the fraud detector with crop norms data."""
         self.crop_norms_path = crop_norms_path
         self.crop_norms = self._load_crop_norms()
+        self._compile_crop_norms()
         self.isolation_forest = None
         self.scaler = StandardScaler()
+        # (forest, scaler, n_trees, CompiledFraudEnsemble) for small batches
+        self._compiled = None
         self.trained = False
+        # FraudModelStore version this model was published as, if any
+        self.model_version = None
+        self.reset_aggregates()
         
     def _load_crop_norms(self):
         """Load crop-specific fertilizer and seed norms."""
@@ -56,33 +156,69 @@ class SubsidyFraudDetector:
                 'crop_normalized': ['paddy', 'wheat', 'cotton', 'sugarcane']
             })
     
+    def _compile_crop_norms(self):
+        """
+        Compile crop_norms into dict lookups. Call again whenever crop_norms
+        is replaced (load_model does).
+        """
+        names = self.crop_norms['crop_normalized'].tolist()
+        rates = list(zip(self.crop_norms['fertilizer_kg_per_acre'].astype(float),
+                         self.crop_norms['seed_kg_per_acre'].astype(float)))
+        # exact matches; the first row wins on duplicates
+        self._norms_exact = {}
+        for name, rate in zip(names, rates):
+            self._norms_exact.setdefault(name, rate)
+        # partial matches are scanned in file order, as before
+        self._norms_partial = list(zip(names, rates))
+        self._norms_default = (self.crop_norms['fertilizer_kg_per_acre'].mean(),
+                               self.crop_norms['seed_kg_per_acre'].mean())
+        # resolved partial matches / fallbacks, by normalized crop name
+        self._norms_memo = {}
+    
+    def _resolve_norm(self, crop_normalized):
+        """(fertilizer_per_acre, seed_per_acre) for a normalized crop name."""
+        rate = self._norms_exact.get(crop_normalized)
+        if rate is not None:
+            return rate
+        rate = self._norms_memo.get(crop_normalized)
+        if rate is not None:
+            return rate
+        # Try partial match, else the average over all crops
+        rate = next(
+            (r for name, r in self._norms_partial if crop_normalized in name or name in crop_normalized),
+            self._norms_default
+        )
+        if len(self._norms_memo) >= MAX_NORM_MEMO:
+            self._norms_memo.clear()
+        self._norms_memo[crop_normalized] = rate
+        return rate
+    
     def get_crop_norm(self, crop_name):
         """Get expected fertilizer and seed requirements for a crop."""
-        crop_normalized = crop_name.lower().strip()
-        
-        # Try exact match first
-        match = self.crop_norms[self.crop_norms['crop_normalized'] == crop_normalized]
-        
-        if not match.empty:
-            return {
-                'fertilizer_per_acre': float(match.iloc[0]['fertilizer_kg_per_acre']),
-                'seed_per_acre': float(match.iloc[0]['seed_kg_per_acre'])
-            }
-        
-        # Try partial match
-        for _, row in self.crop_norms.iterrows():
-            if crop_normalized in row['crop_normalized'] or row['crop_normalized'] in crop_normalized:
-                return {
-                    'fertilizer_per_acre': float(row['fertilizer_kg_per_acre']),
-                    'seed_per_acre': float(row['seed_kg_per_acre'])
-                }
-        
-        # Return average if no match found
+        fertilizer, seed = self._resolve_norm(crop_name.lower().strip())
         return {
-            'fertilizer_per_acre': self.crop_norms['fertilizer_kg_per_acre'].mean(),
-            'seed_per_acre': self.crop_norms['seed_kg_per_acre'].mean()
+            'fertilizer_per_acre': fertilizer,
+            'seed_per_acre': seed
         }
     
+    def resolve_norms(self, crops):
+        """
+        get_crop_norm for a whole crop column: one lookup per distinct crop.
+        Missing crops get the average norms.
+        
+        Returns:
+            DataFrame with fertilizer_per_acre and seed_per_acre, aligned with crops
+        """
+        crops = pd.Series(crops)
+        rates = {
+            crop: self._resolve_norm(crop.lower().strip()) if isinstance(crop, str) else self._norms_default
+            for crop in crops.unique()
+        }
+        return pd.DataFrame({
+            'fertilizer_per_acre': crops.map({c: r[0] for c, r in rates.items()}).astype(float),
+            'seed_per_acre': crops.map({c: r[1] for c, r in rates.items()}).astype(float)
+        }, index=crops.index)
+    
 
     def calculate_allowed_quantity(self, crop_type, land_size_acres, subsidy_type='fertilizer'):
         """
@@ -167,6 +303,79 @@ class SubsidyFraudDetector:
             'rate_per_acre': allowed['rate_per_acre'],
             'fraud_indicators': fraud_indicators if fraud_indicators else None
         }
+
+    def check_eligibility_batch(self, crop_type, land_size_acres=None, requested_qty=None,
+                                subsidy_type='fertilizer'):
+        """
+        Vectorized check_eligibility for many requests at once.
+        
+        Args:
+            crop_type: crop names (array/Series), or a DataFrame with crop_type,
+                land_size_acres, requested_qty and optionally subsidy_type columns
+            land_size_acres: land sizes, aligned with crop_type
+            requested_qty: requested quantities (kg), aligned with crop_type
+            subsidy_type: 'fertilizer', 'seed', or an array of them per request
+            
+        Returns:
+            DataFrame with approved, reason, risk_flag, allowed_qty, requested_qty,
+            qty_ratio, rate_per_acre and fraud_indicators (list or None) per request
+        """
+        if isinstance(crop_type, pd.DataFrame):
+            frame = crop_type
+            crop_type = frame['crop_type']
+            land_size_acres = frame['land_size_acres']
+            requested_qty = frame['requested_qty']
+            subsidy_type = frame['subsidy_type'] if 'subsidy_type' in frame else subsidy_type
+        crops = pd.Series(crop_type)
+        index = crops.index
+        n = len(crops)
+        land = np.asarray(land_size_acres, dtype=float)
+        requested = np.asarray(requested_qty, dtype=float)
+        kinds = np.broadcast_to(np.asarray(subsidy_type, dtype=object), (n,))
+        is_fertilizer = kinds == 'fertilizer'
+        if not (is_fertilizer | (kinds == 'seed')).all():
+            raise ValueError("subsidy_type must be 'fertilizer' or 'seed'")
+        
+        norms = self.resolve_norms(crops)
+        rate = np.where(is_fertilizer, norms['fertilizer_per_acre'].to_numpy(), norms['seed_per_acre'].to_numpy())
+        allowed = _round_like_python(land * rate, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            qty_ratio = np.where(allowed > 0, requested / allowed, np.inf)
+        
+        # Determine approval status (10% tolerance above the allowed quantity)
+        within = requested <= allowed
+        tolerated = ~within & (requested <= allowed * 1.1)
+        approved = within | tolerated
+        reason = np.select([within, tolerated], ['APPROVED', 'APPROVED_WITH_TOLERANCE'], 'ABOVE_MAX_LIMIT')
+        risk_flag = np.select([within, tolerated], ['NORMAL', 'LOW'], 'HIGH')
+        
+        # Additional fraud indicators: only the flagged rows get formatted messages
+        high = qty_ratio > 1.5
+        over = ~high & (qty_ratio > 1.0)
+        low = (qty_ratio < 0.2) & (requested > 0)
+        indicators = np.full(n, None, dtype=object)
+        for i in np.flatnonzero(high | over | low):
+            found = []
+            if high[i]:
+                found.append(f"Requested {qty_ratio[i]:.1f}x the allowed limit - HIGH RISK")
+            elif over[i]:
+                found.append(f"Requested {qty_ratio[i]:.2f}x the allowed limit "
+                             f"({requested[i]:.0f}kg vs {allowed[i]:.0f}kg allowed)")
+            if low[i]:
+                found.append("Suspiciously low request (possible ghost farmer pattern)")
+            indicators[i] = found
+        
+        return pd.DataFrame({
+            'approved': approved,
+            'reason': reason,
+            'risk_flag': risk_flag,
+            'allowed_qty': allowed,
+            'requested_qty': requested,
+            'qty_ratio': _round_like_python(qty_ratio, 3),
+            'rate_per_acre': rate,
+            'fraud_indicators': indicators
+        }, index=index)
+    
     def extract_features(self, applications_df):
         """
         Extract features from applications for anomaly detection.
@@ -181,41 +390,55 @@ class SubsidyFraudDetector:
         if applications_df.empty:
             return pd.DataFrame()
         
-        features = []
+        apps = applications_df.reset_index(drop=True)
         
-        for idx, app in applications_df.iterrows():
-            # Get crop norms
-            norms = self.get_crop_norm(app['crop_type'])
-            expected_fertilizer = norms['fertilizer_per_acre'] * app['total_land_acres']
-            
-            # Calculate feature values
-            feature_dict = {
-                'application_id': app['application_id'],
-                'land_acres': app['total_land_acres'],
-                'expected_fertilizer_total': expected_fertilizer,
-                'land_size_category': self._categorize_land_size(app['total_land_acres']),
-            }
-            
-            # Geographic clustering: count applications from same district
-            district_count = len(applications_df[applications_df['district'] == app['district']])
-            feature_dict['district_application_density'] = district_count
-            
-            # Calculate district average land size
-            district_apps = applications_df[applications_df['district'] == app['district']]
-            district_avg_land = district_apps['total_land_acres'].mean()
-            feature_dict['land_deviation_from_district_avg'] = abs(app['total_land_acres'] - district_avg_land)
-            
-            # State-level statistics
-            state_count = len(applications_df[applications_df['state'] == app['state']])
-            feature_dict['state_application_count'] = state_count
-            
+        # Geographic clustering and district/state statistics in one groupby pass each
+        # (applications without a district/state match nothing, as with the old row filters)
+        district_groups = apps.groupby('district', sort=False)['total_land_acres']
+        district_count = district_groups.transform('size').fillna(0).astype('int64')
+        district_avg_land = district_groups.transform('mean')
+        state_count = apps.groupby('state', sort=False)['state'].transform('size').fillna(0).astype('int64')
+        return self._assemble_features(apps, district_count, district_avg_land, state_count)
+    
+    def _assemble_features(self, apps, district_count, district_avg_land, state_count):
+        """Feature frame for apps (RangeIndex) given its district/state statistics."""
+        land = apps['total_land_acres']
+        # Crop norms: one lookup per distinct crop instead of per application
+        fertilizer_per_acre = self.resolve_norms(apps['crop_type'])['fertilizer_per_acre']
+        return pd.DataFrame({
+            'application_id': apps['application_id'],
+            'land_acres': land,
+            'expected_fertilizer_total': fertilizer_per_acre * land,
+            'land_size_category': self._categorize_land_sizes(land),
+            'district_application_density': district_count,
+            'land_deviation_from_district_avg': (land - district_avg_land).abs(),
+            'state_application_count': state_count,
             # Check for unrealistic land holdings (outlier detection)
-            feature_dict['is_large_holding'] = 1 if app['total_land_acres'] > 100 else 0
-            feature_dict['is_small_holding'] = 1 if app['total_land_acres'] < 0.5 else 0
-            
-            features.append(feature_dict)
-        
-        return pd.DataFrame(features)
+            'is_large_holding': (land > 100).astype('int64'),
+            'is_small_holding': (land < 0.5).astype('int64'),
+        })
+    
+    # ---------- running district/state aggregates ----------
+    def reset_aggregates(self):
+        """Forget all district/state aggregates."""
+        # key -> [applications, land values seen, mean land, M2 (sum of squared deviations)]
+        self.district_stats = {}
+        self.state_stats = {}
+    
+    def update_aggregates(self, applications_df):
+        """
+        Add applications to the per-district and per-state aggregates.
+        Each group in the batch is folded in with Chan et al.'s parallel
+        form of Welford's update, so the cost is O(1) per application.
+        """
+        _accumulate_aggregates(applications_df, self.district_stats, self.state_stats)
+    
+    def district_land_std(self, district):
+        """Population std of land size in a district so far, or NaN."""
+        entry = self.district_stats.get(district)
+        if entry is None or entry[1] == 0:
+            return float('nan')
+        return float(np.sqrt(entry[3] / entry[1]))
     
     def _categorize_land_size(self, acres):
         """Categorize land size into bins."""
@@ -228,37 +451,41 @@ class SubsidyFraudDetector:
         else:
             return 4  # Large farmer
     
-    def train(self, applications_df, contamination=0.1):
+    def _categorize_land_sizes(self, acres):
+        """Vectorized _categorize_land_size over a Series."""
+        categories = np.select([acres < 2, acres < 5, acres < 10], [1, 2, 3], default=4)
+        return pd.Series(categories.astype('int64'), index=acres.index)
+    
+    def train(self, applications_df, contamination=0.1, n_estimators=100, max_samples='auto',
+              n_jobs=None, progress=None):
         """
         Train the Isolation Forest model on historical applications.
         
         Args:
             applications_df: DataFrame with application data
             contamination: Expected proportion of outliers (default 10%)
+            n_estimators: Number of trees
+            max_samples: Rows drawn per tree ('auto' = min(256, n), an int, or a fraction);
+                larger populations train in about the same time at the default
+            n_jobs: Cores used to build trees (-1 = all cores, None = one)
+            progress: Optional callable(stage, fraction) called as training advances;
+                when given, trees are grown in steps of TRAIN_PROGRESS_TREES
         """
         if applications_df.empty:
             print("No training data available.")
             return
         
+        report = progress or (lambda stage, fraction: None)
+        
         # Extract features
+        report('features', 0.0)
         features_df = self.extract_features(applications_df)
         
         if features_df.empty:
             print("No features extracted.")
             return
         
-        # Select numerical features for training
-        numerical_features = [
-            'land_acres',
-            'expected_fertilizer_total',
-            'district_application_density',
-            'land_deviation_from_district_avg',
-            'state_application_count',
-            'is_large_holding',
-            'is_small_holding'
-        ]
-        
-        X = features_df[numerical_features].fillna(0)
+        X = features_df[NUMERICAL_FEATURES].fillna(0)
         
         # Standardize features
         X_scaled = self.scaler.fit_transform(X)
@@ -267,11 +494,27 @@ class SubsidyFraudDetector:
         self.isolation_forest = IsolationForest(
             contamination=contamination,
             random_state=42,
-            n_estimators=100
+            n_estimators=n_estimators,
+            max_samples=max_samples,
+            n_jobs=n_jobs
         )
-        self.isolation_forest.fit(X_scaled)
+        if progress is None:
+            self.isolation_forest.fit(X_scaled)
+        else:
+            # warm_start adds trees to the same seeded sequence, so the forest
+            # matches a single fit with n_estimators trees
+            self.isolation_forest.set_params(warm_start=True)
+            for grown in range(TRAIN_PROGRESS_TREES, n_estimators + TRAIN_PROGRESS_TREES, TRAIN_PROGRESS_TREES):
+                self.isolation_forest.set_params(n_estimators=min(grown, n_estimators))
+                self.isolation_forest.fit(X_scaled)
+                report('trees', min(grown, n_estimators) / n_estimators)
+            self.isolation_forest.set_params(warm_start=False)
         self.trained = True
         
+        # Running aggregates start from the training set; score_new extends them
+        self.reset_aggregates()
+        self.update_aggregates(applications_df)
+        
         print(f"Model trained on {len(X)} applications.")
         print(f"Expected anomaly rate: {contamination * 100}%")
     
@@ -280,7 +523,8 @@ class SubsidyFraudDetector:
         Detect anomalies in applications.
         
         Returns:
-            DataFrame with application_id, anomaly_score, is_anomaly, risk_level, and reasons
+            DataFrame with application_id, anomaly_score, is_anomaly, risk_level, and
+            reason_codes (REASON_* bits; see describe_fraud_reasons)
         """
         if not self.trained:
             print("Model not trained. Training on provided data...")
@@ -291,29 +535,82 @@ class SubsidyFraudDetector:
         
         # Extract features
         features_df = self.extract_features(applications_df)
+        return self._score_features(features_df, applications_df)
+    
+    def score_new(self, applications_df):
+        """
+        Score applications that arrived since training, without retraining.
         
-        numerical_features = [
-            'land_acres',
-            'expected_fertilizer_total',
-            'district_application_density',
-            'land_deviation_from_district_avg',
-            'state_application_count',
-            'is_large_holding',
-            'is_small_holding'
-        ]
-        
-        X = features_df[numerical_features].fillna(0)
-        X_scaled = self.scaler.transform(X)
+        District/state density and district land averages come from the
+        running aggregates, which these rows are added to first (so each
+        application must be passed in only once). Cost is proportional to
+        the new rows only.
+        
+        Returns:
+            DataFrame in the same format as predict_anomalies
+        """
+        if not self.trained:
+            raise ValueError("Model not trained; call train() or load_model() first.")
+        if applications_df.empty:
+            return pd.DataFrame()
         
-        # Predict anomalies (-1 for anomalies, 1 for normal)
-        predictions = self.isolation_forest.predict(X_scaled)
+        self.update_aggregates(applications_df)
+        features_df = self._features_from_aggregates(applications_df, self.district_stats, self.state_stats)
+        return self._score_features(features_df, applications_df)
+    
+    def _features_from_aggregates(self, applications_df, district_stats, state_stats):
+        """Feature frame whose district/state statistics come from running-stat dicts."""
+        apps = applications_df.reset_index(drop=True)
+        district_count = apps['district'].map(lambda d: district_stats[d][0] if d in district_stats else 0)
+        district_avg_land = apps['district'].map(lambda d: district_stats[d][2] if d in district_stats else np.nan)
+        state_count = apps['state'].map(lambda s: state_stats[s][0] if s in state_stats else 0)
+        return self._assemble_features(
+            apps, district_count.astype('int64'), district_avg_land.astype(float), state_count.astype('int64')
+        )
+    
+    def _anomaly_scores(self, X):
+        """
+        Anomaly scores (higher = more anomalous) and is_anomaly flags for a
+        NUMERICAL_FEATURES frame, from the fitted scaler + Isolation Forest.
+        """
+        # One pass over the forest: predict() is decision_function < 0, i.e.
+        # score_samples - offset_ < 0, so derive it instead of scoring twice
+        compiled = self._compiled_forest() if len(X) < MAX_COMPILED_ROWS else None
+        if compiled is not None:
+            # score_new / snapshot rescoring: skip sklearn's per-call overhead
+            decision, _ = compiled.evaluate(X.to_numpy(dtype=float))
+            return -(decision + self.isolation_forest.offset_), decision < 0
+        X_scaled = self.scaler.transform(X)
         scores = self.isolation_forest.score_samples(X_scaled)
+        # Invert so higher = more anomalous
+        return -scores, scores - self.isolation_forest.offset_ < 0
+    
+    def _compiled_forest(self):
+        """
+        The scaler + forest compiled to node arrays, recompiled when either is
+        replaced; None (also cached) when they cannot be compiled, e.g. a
+        scaler other than StandardScaler.
+        """
+        forest, scaler = self.isolation_forest, self.scaler
+        cached = self._compiled
+        if cached is None or cached[0] is not forest or cached[1] is not scaler or cached[2] != len(forest.estimators_):
+            try:
+                compiled = compile_fraud_ensemble(forest, scaler)
+            except NotImplementedError:
+                compiled = None
+            self._compiled = cached = (forest, scaler, len(forest.estimators_), compiled)
+        return cached[3]
+    
+    def _score_features(self, features_df, applications_df):
+        """Score extracted features into the predict_anomalies result frame."""
+        X = features_df[NUMERICAL_FEATURES].fillna(0)
+        anomaly_score, is_anomaly = self._anomaly_scores(X)
         
         # Create results DataFrame
         results = pd.DataFrame({
             'application_id': features_df['application_id'],
-            'anomaly_score': -scores,  # Invert so higher = more anomalous
-            'is_anomaly': predictions == -1,
+            'anomaly_score': anomaly_score,
+            'is_anomaly': is_anomaly,
             'land_acres': features_df['land_acres'],
             'district_density': features_df['district_application_density'],
             'land_deviation': features_df['land_deviation_from_district_avg']
@@ -322,10 +619,8 @@ class SubsidyFraudDetector:
         # Add risk level categorization
         results['risk_level'] = results['anomaly_score'].apply(self._calculate_risk_level)
         
-        # Generate fraud reasons
-        results['fraud_indicators'] = results.apply(
-            lambda row: self._generate_fraud_reasons(row, applications_df), axis=1
-        )
+        # Reason bits only; describe_fraud_reasons turns them into text on demand
+        results['reason_codes'] = self._fraud_reason_codes(results)
         
         return results.sort_values('anomaly_score', ascending=False)
     
@@ -340,38 +635,69 @@ class SubsidyFraudDetector:
         else:
             return 'NORMAL'
     
-    def _generate_fraud_reasons(self, row, applications_df):
-        """Generate human-readable fraud indicators."""
+    def _fraud_reason_codes(self, results):
+        """Bitmask of REASON_* flags per result row, from boolean masks over its columns."""
+        land = results['land_acres']
+        codes = np.where(land > 100, REASON_LARGE_HOLDING,
+                         np.where(land < 0.5, REASON_SMALL_HOLDING, 0))
+        codes |= np.where(results['district_density'] > 50, REASON_HIGH_DISTRICT_DENSITY, 0)
+        codes |= np.where(results['land_deviation'] > 20, REASON_LAND_DEVIATION, 0)
+        codes |= np.where(results['is_anomaly'], REASON_ML_ANOMALY, 0)
+        return codes.astype('uint8')
+    
+    def describe_fraud_reasons(self, results):
+        """
+        Human-readable fraud indicators for the given predict_anomalies rows
+        (pass only the rows being returned), as a Series of lists aligned to results.
+        """
+        return pd.Series(
+            [self.describe_reason_codes(code, land, density, deviation)
+             for code, land, density, deviation in zip(results['reason_codes'], results['land_acres'],
+                                                       results['district_density'], results['land_deviation'])],
+            index=results.index, dtype=object
+        )
+    
+    def describe_reason_codes(self, code, land_acres, district_density, land_deviation):
+        """Generate human-readable fraud indicators for one reason bitmask."""
         reasons = []
-        
-        # Check land size anomalies
-        if row['land_acres'] > 100:
-            reasons.append(f"Unusually large land holding ({row['land_acres']:.1f} acres)")
-        elif row['land_acres'] < 0.5:
-            reasons.append(f"Extremely small land holding ({row['land_acres']:.1f} acres)")
-        
-        # Check geographic clustering
-        if row['district_density'] > 50:
-            reasons.append(f"High application density in district ({row['district_density']} applications)")
-        
-        # Check land deviation
-        if row['land_deviation'] > 20:
-            reasons.append(f"Land size significantly different from district average (±{row['land_deviation']:.1f} acres)")
-        
-        # General anomaly flag
-        if row['is_anomaly']:
+        if code & REASON_LARGE_HOLDING:
+            reasons.append(f"Unusually large land holding ({land_acres:.1f} acres)")
+        elif code & REASON_SMALL_HOLDING:
+            reasons.append(f"Extremely small land holding ({land_acres:.1f} acres)")
+        if code & REASON_HIGH_DISTRICT_DENSITY:
+            reasons.append(f"High application density in district ({district_density} applications)")
+        if code & REASON_LAND_DEVIATION:
+            reasons.append(f"Land size significantly different from district average (±{land_deviation:.1f} acres)")
+        if code & REASON_ML_ANOMALY:
             reasons.append("Statistical anomaly detected by ML model")
-        
         return reasons if reasons else ['No specific indicators']
     
-    def get_fraud_statistics(self, applications_df):
+    def get_fraud_statistics(self, applications_df, chunksize=None, top_k=10):
         """
         Generate fraud statistics and insights.
         
+        Args:
+            applications_df: DataFrame with application data
+            chunksize: Score this many rows at a time (see get_fraud_statistics_streaming)
+                instead of materializing results for the whole frame
+            top_k: Number of riskiest applications to return
+        
         Returns:
             Dictionary with fraud statistics
         """
+        if chunksize is not None:
+            if not self.trained:
+                print("Model not trained. Training on provided data...")
+                self.train(applications_df)
+            return self.get_fraud_statistics_streaming(
+                lambda: (applications_df.iloc[start:start + chunksize]
+                         for start in range(0, len(applications_df), chunksize)),
+                top_k=top_k
+            )
+        
         results = self.predict_anomalies(applications_df)
+        top = results.nlargest(top_k, 'anomaly_score')
+        top = top.assign(fraud_indicators=self.describe_fraud_reasons(top))
         
         stats = {
             'total_applications': len(applications_df),
@@ -380,39 +706,491 @@ class SubsidyFraudDetector:
             'high_risk_count': int((results['risk_level'] == 'HIGH').sum()),
             'medium_risk_count': int((results['risk_level'] == 'MEDIUM').sum()),
             'low_risk_count': int((results['risk_level'] == 'LOW').sum()),
-            'top_risk_applications': results.nlargest(10, 'anomaly_score')[
+            'top_risk_applications': top[
                 ['application_id', 'anomaly_score', 'risk_level', 'fraud_indicators']
             ].to_dict('records')
         }
         
         return stats
     
-    def save_model(self, filepath='fraud_detection_model.pkl'):
-        """Save trained model to disk."""
+    def get_fraud_statistics_streaming(self, read_chunks, top_k=10):
+        """
+        get_fraud_statistics over applications read in chunks. Peak memory
+        depends on the chunk size, the number of districts and states, and
+        top_k, not on the total number of applications.
+        
+        Args:
+            read_chunks: Zero-argument callable returning an iterable of application
+                DataFrames, e.g. lambda: pd.read_csv(path, chunksize=50000). It is
+                called twice: once to gather district/state statistics, once to score.
+            top_k: Number of riskiest applications to return
+        
+        Returns:
+            Dictionary in the same format as get_fraud_statistics
+        """
+        if not self.trained:
+            raise ValueError("Model not trained; call train() or load_model() first.")
+        
+        # Pass 1: district/state density and average land over all applications
+        district_stats, state_stats = {}, {}
+        for chunk in read_chunks():
+            _accumulate_aggregates(chunk, district_stats, state_stats)
+        
+        # Pass 2: score each chunk, keep counts and a min-heap of the top_k rows
+        # (ties go to the earlier row, like nlargest)
+        total = flagged = 0
+        risk_counts = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
+        heap = []
+        for chunk in read_chunks():
+            if chunk.empty:
+                continue
+            results = self._score_features(
+                self._features_from_aggregates(chunk, district_stats, state_stats), chunk
+            )
+            for level, count in results['risk_level'].value_counts().items():
+                if level in risk_counts:
+                    risk_counts[level] += int(count)
+            flagged += int(results['is_anomaly'].sum())
+            for position, row in results.nlargest(top_k, 'anomaly_score').iterrows():
+                entry = (row['anomaly_score'], -(total + position), row.to_dict())
+                if len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+            total += len(chunk)
+        
+        top = pd.DataFrame([record for *_, record in sorted(heap, key=lambda e: e[:2], reverse=True)],
+                           columns=['application_id', 'anomaly_score', 'risk_level', 'land_acres',
+                                    'district_density', 'land_deviation', 'reason_codes'])
+        top['fraud_indicators'] = self.describe_fraud_reasons(top)
+        
+        return {
+            'total_applications': total,
+            'flagged_anomalies': flagged,
+            'anomaly_percentage': float(flagged / total * 100) if total else 0.0,
+            'high_risk_count': risk_counts['HIGH'],
+            'medium_risk_count': risk_counts['MEDIUM'],
+            'low_risk_count': risk_counts['LOW'],
+            'top_risk_applications': top[
+                ['application_id', 'anomaly_score', 'risk_level', 'fraud_indicators']
+            ].to_dict('records')
+        }
+    
+    def save_model(self, filepath='fraud_detection_model'):
+        """
+        Save trained model to disk as a model directory:
+        
+            manifest.json     format version, library versions, parameters
+            forest.joblib     Isolation Forest, arrays stored uncompressed
+            scaler.joblib     fitted StandardScaler
+            aggregates.joblib district/state keys and running stats as arrays
+            crop_norms.csv    crop norms the model was trained with
+        
+        The directory is built under a temporary name and renamed into place,
+        replacing any model already at filepath.
+        """
         if not self.trained:
             print("Model not trained yet.")
             return
         
-        model_data = {
-            'isolation_forest': self.isolation_forest,
-            'scaler': self.scaler,
-            'crop_norms': self.crop_norms
-        }
-        joblib.dump(model_data, filepath)
+        tmp_dir = f"{filepath}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            # compress=0 keeps arrays raw in the file, so load can mmap them
+            joblib.dump(self._estimator(), os.path.join(tmp_dir, 'forest.joblib'), compress=0)
+            joblib.dump(self.scaler, os.path.join(tmp_dir, 'scaler.joblib'), compress=0)
+            joblib.dump(self._aggregate_arrays(), os.path.join(tmp_dir, 'aggregates.joblib'), compress=0)
+            self.crop_norms[['crop', 'fertilizer_kg_per_acre', 'seed_kg_per_acre']].to_csv(
+                os.path.join(tmp_dir, 'crop_norms.csv'), index=False
+            )
+            manifest = {
+                'format_version': MODEL_FORMAT_VERSION,
+                'created_at': datetime.utcnow().isoformat(),
+                'sklearn_version': sklearn.__version__,
+                'numpy_version': np.__version__,
+                'features': NUMERICAL_FEATURES,
+                'detector': self.DETECTOR,
+                'params': self._estimator_params(),
+                'files': {name: os.path.getsize(os.path.join(tmp_dir, name)) for name in sorted(os.listdir(tmp_dir))},
+            }
+            # manifest last: a directory without one was never finished
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            
+            old_dir = f"{filepath}.old{os.getpid()}"
+            if os.path.isdir(filepath) and not os.listdir(filepath):
+                # an empty directory reserving the name (FraudModelStore.publish)
+                _replace_empty_dir(tmp_dir, filepath)
+            else:
+                if os.path.exists(filepath):
+                    os.replace(filepath, old_dir)
+                os.replace(tmp_dir, filepath)
+                shutil.rmtree(old_dir, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
         print(f"Model saved to {filepath}")
     
-    def load_model(self, filepath='fraud_detection_model.pkl'):
-        """Load trained model from disk."""
+    def load_model(self, filepath='fraud_detection_model', mmap=True):
+        """
+        Load trained model from disk: a model directory written by
+        save_model, or a single-file joblib pickle from older versions.
+        With mmap=True the arrays in the model files are memory-mapped
+        read-only instead of read into memory.
+        """
         if not os.path.exists(filepath):
             print(f"Model file {filepath} not found.")
             return
         
+        if not os.path.isdir(filepath):
+            if self.DETECTOR != 'isolation_forest':
+                raise ValueError(f"{filepath} is a single-file Isolation Forest model.")
+            self._load_legacy_model(filepath)
+            print(f"Model loaded from {filepath}")
+            return
+        
+        with open(os.path.join(filepath, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['format_version'] > MODEL_FORMAT_VERSION:
+            raise ValueError(f"{filepath} has model format {manifest['format_version']}; "
+                             f"this code reads up to {MODEL_FORMAT_VERSION}.")
+        if manifest['sklearn_version'] != sklearn.__version__:
+            print(f"Warning: {filepath} was saved with scikit-learn {manifest['sklearn_version']}, "
+                  f"running {sklearn.__version__}.")
+        # directories from before the detector key are Isolation Forests
+        if manifest.get('detector', 'isolation_forest') != self.DETECTOR:
+            raise ValueError(f"{filepath} holds a {manifest.get('detector')} model, "
+                             f"not {self.DETECTOR}.")
+        mmap_mode = 'r' if mmap else None
+        self._set_estimator(joblib.load(os.path.join(filepath, 'forest.joblib'), mmap_mode=mmap_mode))
+        self.scaler = joblib.load(os.path.join(filepath, 'scaler.joblib'), mmap_mode=mmap_mode)
+        self._restore_aggregates(joblib.load(os.path.join(filepath, 'aggregates.joblib')))
+        self.crop_norms = pd.read_csv(os.path.join(filepath, 'crop_norms.csv'))
+        self.crop_norms['crop_normalized'] = self.crop_norms['crop'].str.lower().str.strip()
+        self._compile_crop_norms()
+        self.trained = True
+        print(f"Model loaded from {filepath}")
+    
+    def _estimator(self):
+        """The fitted anomaly model save_model writes to forest.joblib."""
+        return self.isolation_forest
+    
+    def _set_estimator(self, estimator):
+        self.isolation_forest = estimator
+    
+    def _estimator_params(self):
+        """Model parameters recorded in the manifest."""
+        return {
+            'contamination': self.isolation_forest.contamination,
+            'n_estimators': self.isolation_forest.n_estimators,
+            'max_samples': self.isolation_forest.max_samples,
+        }
+    
+    def _load_legacy_model(self, filepath):
+        """Load the single joblib blob save_model used to write."""
         model_data = joblib.load(filepath)
         self.isolation_forest = model_data['isolation_forest']
         self.scaler = model_data['scaler']
         self.crop_norms = model_data['crop_norms']
+        self._compile_crop_norms()
+        # models saved before running aggregates existed start with empty ones
+        self.district_stats = model_data.get('district_stats', {})
+        self.state_stats = model_data.get('state_stats', {})
         self.trained = True
-        print(f"Model loaded from {filepath}")
+    
+    def _aggregate_arrays(self):
+        """district_stats/state_stats as key lists and (n, 4) float arrays, for saving."""
+        arrays = {}
+        for name, stats in (('district', self.district_stats), ('state', self.state_stats)):
+            arrays[f'{name}_keys'] = list(stats)
+            arrays[f'{name}_stats'] = np.array(list(stats.values()), dtype=float).reshape(-1, 4)
+        return arrays
+    
+    def _restore_aggregates(self, arrays):
+        """Inverse of _aggregate_arrays."""
+        self.reset_aggregates()
+        for name, stats in (('district', self.district_stats), ('state', self.state_stats)):
+            for key, (size, count, mean, m2) in zip(arrays[f'{name}_keys'], arrays[f'{name}_stats'].tolist()):
+                stats[key] = [int(size), int(count), mean, m2]
+
+class HalfSpaceTrees:
+    """
+    Streaming Half-Space Trees (Tan, Ting & Liu, 2011).
+    
+    Each tree splits a randomly perturbed workspace around the feature
+    bounds in half, depth times, on random features. Nodes count how many
+    points of the latest window passed through them (l); the counts of the
+    last reference_windows complete windows, summed, are the reference
+    mass (r). A point scores r * 2**depth at the node where it stops (a
+    leaf, or the first node with too little reference mass); sparse
+    regions score low. Each complete window replaces the oldest one in the
+    reference, so the model follows the stream with fixed memory:
+    reference_windows + 2 (n_trees, 2**(depth+1) - 1) count arrays, plus
+    the reference windows' points, which are rescored after every window to
+    calibrate the threshold and rank().
+    """
+    
+    def __init__(self, n_trees=25, depth=10, window_size=256, size_limit=None, random_state=42,
+                 reference_windows=4):
+        self.n_trees = n_trees
+        self.depth = depth
+        self.window_size = window_size
+        # per window of reference mass, nodes with less than this end the descent
+        self.size_limit = size_limit if size_limit is not None else 0.1 * window_size
+        self.random_state = random_state
+        self.reference_windows = reference_windows
+        self.threshold = None
+        self.contamination = 0.1
+    
+    def fit(self, X, contamination=0.1):
+        """Build the trees around X's bounds, stream X in, and calibrate the threshold."""
+        X = np.asarray(X, dtype=float)
+        rng = np.random.default_rng(self.random_state)
+        self.lower = X.min(axis=0)
+        span = X.max(axis=0) - self.lower
+        self.span = np.where(span > 0, span, 1.0)
+        self.contamination = contamination
+        
+        n_features = X.shape[1]
+        n_internal = 2 ** self.depth - 1
+        self.split_feature = rng.integers(0, n_features, (self.n_trees, n_internal))
+        self.split_value = np.empty((self.n_trees, n_internal))
+        for tree in range(self.n_trees):
+            # workspace: [s - r, s + r] per feature with s ~ U(0, 1), r = 2 max(s, 1 - s)
+            s = rng.random(n_features)
+            half = 2 * np.maximum(s, 1 - s)
+            lows = np.empty((n_internal, n_features))
+            highs = np.empty((n_internal, n_features))
+            lows[0], highs[0] = s - half, s + half
+            for node in range(n_internal):
+                q = self.split_feature[tree, node]
+                mid = (lows[node, q] + highs[node, q]) / 2
+                self.split_value[tree, node] = mid
+                for child, side in ((2 * node + 1, 'left'), (2 * node + 2, 'right')):
+                    if child < n_internal:
+                        lows[child], highs[child] = lows[node], highs[node]
+                        if side == 'left':
+                            highs[child, q] = mid
+                        else:
+                            lows[child, q] = mid
+        
+        n_nodes = 2 ** (self.depth + 1) - 1
+        # ring of the last reference_windows complete windows: counts, sizes and points
+        self.window_counts = np.zeros((self.reference_windows, self.n_trees, n_nodes), dtype=np.int64)
+        self.window_sizes = np.zeros(self.reference_windows, dtype=np.int64)
+        self.window_points = np.zeros((self.reference_windows, self.window_size, n_features))
+        self.reference = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        self.latest = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        self.reference_size = 0
+        self.calibration = np.zeros(0)
+        self.windows = 0
+        self._window = np.empty((self.window_size, n_features))
+        self._filled = 0
+        
+        self.learn(X)
+        if self.windows == 0:
+            # shorter than one window: the training points are the reference
+            self._roll_window()
+        return self
+    
+    def _normalize(self, X):
+        return (np.asarray(X, dtype=float) - self.lower) / self.span
+    
+    def _paths(self, Xn):
+        """Node index per (point, tree) at every depth 0..depth."""
+        trees = np.arange(self.n_trees)
+        rows = np.arange(len(Xn))[:, None]
+        node = np.zeros((len(Xn), self.n_trees), dtype=np.int64)
+        paths = [node]
+        for _ in range(self.depth):
+            go_right = Xn[rows, self.split_feature[trees, node]] > self.split_value[trees, node]
+            node = 2 * node + 1 + go_right
+            paths.append(node)
+        return paths
+    
+    def score(self, X):
+        """
+        Raw anomaly scores in (0, 1], higher = more anomalous. The HST mass
+        r * 2**k is taken as log2(r + 1) + k, an effective path length,
+        and mapped like Isolation Forest's 2**(-h / c) with c = log2 of the
+        reference size. How high is unusual depends on the data; see rank().
+        """
+        paths = self._paths(self._normalize(X))
+        trees = np.arange(self.n_trees)
+        limit = self.size_limit * self.reference_size / self.window_size
+        length = np.zeros((len(paths[0]), self.n_trees))
+        done = np.zeros(length.shape, dtype=bool)
+        for k, node in enumerate(paths):
+            r = self.reference[trees, node]
+            stop = ~done & ((r < limit) | (k == self.depth))
+            length[stop] = np.log2(r[stop] + 1.0) + k
+            done |= stop
+        return 2.0 ** -(length.mean(axis=1) / np.log2(max(self.reference_size, 2)))
+    
+    def rank(self, scores):
+        """Fraction of the reference windows' points scoring below each raw score, in [0, 1]."""
+        if not len(self.calibration):
+            return np.full(len(scores), 0.5)
+        below = np.searchsorted(self.calibration, scores, side='left')
+        at_or_below = np.searchsorted(self.calibration, scores, side='right')
+        return (below + at_or_below) / (2.0 * len(self.calibration))
+    
+    def learn(self, X):
+        """Add points to the latest window, rolling windows over as they fill. O(n_trees * depth) per point."""
+        X = np.asarray(X, dtype=float)
+        start = 0
+        while start < len(X):
+            stop = start + min(self.window_size - self._filled, len(X) - start)
+            segment = X[start:stop]
+            trees = np.broadcast_to(np.arange(self.n_trees), (len(segment), self.n_trees))
+            for node in self._paths(self._normalize(segment)):
+                np.add.at(self.latest, (trees, node), 1)
+            self._window[self._filled:self._filled + len(segment)] = segment
+            self._filled += len(segment)
+            if self._filled == self.window_size:
+                self._roll_window()
+            start = stop
+    
+    def _roll_window(self):
+        """
+        The latest window replaces the oldest reference window; recalibrate
+        the threshold on the points of all reference windows.
+        """
+        slot = self.windows % self.reference_windows
+        self.window_counts[slot] = self.latest
+        self.window_sizes[slot] = self._filled
+        self.window_points[slot, :self._filled] = self._window[:self._filled]
+        self.latest = np.zeros_like(self.latest)
+        self.reference = self.window_counts.sum(axis=0)
+        self.reference_size = int(self.window_sizes.sum())
+        self.windows += 1
+        self._filled = 0
+        points = np.concatenate([self.window_points[i, :n] for i, n in enumerate(self.window_sizes) if n])
+        if len(points):
+            self.calibration = np.sort(self.score(points))
+            self.threshold = np.quantile(self.calibration, 1 - self.contamination)
+    
+    def writable(self):
+        """Copy of self whose arrays are writable (a loaded model may be memory-mapped)."""
+        clone = HalfSpaceTrees.__new__(HalfSpaceTrees)
+        clone.__dict__ = {key: np.array(value) if isinstance(value, np.ndarray) else value
+                          for key, value in self.__dict__.items()}
+        return clone
+
+
+class StreamingFraudDetector(SubsidyFraudDetector):
+    """
+    SubsidyFraudDetector backed by Half-Space Trees instead of an Isolation
+    Forest. score_new() scores arriving applications and then learns them,
+    in O(1) per application with fixed memory, so the model keeps up with a
+    sliding window of recent applications without retraining. Results have
+    the predict_anomalies format; anomaly_score is the HST score's rank
+    among recent applications, mapped onto the Isolation Forest's range so
+    the same risk bands apply (higher = more anomalous).
+    """
+    
+    DETECTOR = 'half_space_trees'
+    
+    def __init__(self, crop_norms_path='data/crop_norms.csv', n_trees=25, depth=10, window_size=256,
+                 random_state=42):
+        super().__init__(crop_norms_path)
+        self.hst = HalfSpaceTrees(n_trees=n_trees, depth=depth, window_size=window_size,
+                                  random_state=random_state)
+    
+    def train(self, applications_df, contamination=0.1, progress=None):
+        """
+        Build the trees and stream the applications through them in order.
+        
+        Args:
+            applications_df: DataFrame with application data
+            contamination: Expected proportion of outliers per window (default 10%)
+            progress: Optional callable(stage, fraction), as for SubsidyFraudDetector.train
+        """
+        if applications_df.empty:
+            print("No training data available.")
+            return
+        
+        report = progress or (lambda stage, fraction: None)
+        report('features', 0.0)
+        # features as score_new would have seen them, one window at a time, so
+        # the reference windows match what arriving applications look like
+        self.reset_aggregates()
+        chunks = []
+        step = self.hst.window_size
+        for start in range(0, len(applications_df), step):
+            chunk = applications_df.iloc[start:start + step]
+            self.update_aggregates(chunk)
+            features_df = self._features_from_aggregates(chunk, self.district_stats, self.state_stats)
+            chunks.append(self._hst_features(features_df[NUMERICAL_FEATURES].fillna(0)))
+            report('features', min(start + step, len(applications_df)) / len(applications_df))
+        X = pd.concat(chunks, ignore_index=True)
+        self.hst.fit(X, contamination=contamination)
+        report('trees', 1.0)
+        self.trained = True
+        
+        print(f"Streaming model trained on {len(X)} applications "
+              f"({self.hst.windows} windows of {self.hst.window_size}).")
+    
+    def score_new(self, applications_df):
+        """
+        Score applications that arrived since training, then learn them.
+        
+        Returns:
+            DataFrame in the same format as predict_anomalies
+        """
+        if not self.trained:
+            raise ValueError("Model not trained; call train() or load_model() first.")
+        if applications_df.empty:
+            return pd.DataFrame()
+        
+        self.update_aggregates(applications_df)
+        features_df = self._features_from_aggregates(applications_df, self.district_stats, self.state_stats)
+        results = self._score_features(features_df, applications_df)
+        self.hst.learn(self._hst_features(features_df[NUMERICAL_FEATURES].fillna(0)))
+        return results
+    
+    def _hst_features(self, X):
+        """
+        NUMERICAL_FEATURES with the district/state counts as shares of all
+        applications seen. The raw counts only grow, so new applications would
+        land beyond everything in the reference windows; the shares stay put.
+        Shares are of the applications this detector has seen (trained on or
+        scored with score_new), so score frames drawn from those.
+        """
+        total = max(sum(entry[0] for entry in self.state_stats.values()), 1)
+        X = X.copy()
+        for column in ('district_application_density', 'state_application_count'):
+            X[column] = X[column] / total
+        return X
+    
+    def _anomaly_scores(self, X):
+        scores = self.hst.score(self._hst_features(X))
+        return self._isolation_forest_scale(self.hst.rank(scores)), scores > self.hst.threshold
+    
+    def _isolation_forest_scale(self, rank):
+        """
+        Map ranks among the reference points onto the range Isolation Forest
+        scores fall in, so the same risk bands apply: the lower half of normal
+        points LOW, the rest MEDIUM, the contamination quantile at 0.5 (Isolation
+        Forest's own anomaly boundary) and the top half of the flagged ones HIGH.
+        """
+        flagged_from = 1 - self.hst.contamination
+        return np.interp(rank, [0.0, min(0.5, flagged_from / 2), flagged_from, 1.0], [0.3, 0.4, 0.5, 0.7])
+    
+    def _estimator(self):
+        return self.hst
+    
+    def _set_estimator(self, estimator):
+        self.hst = estimator.writable()
+    
+    def _estimator_params(self):
+        return {
+            'contamination': self.hst.contamination,
+            'n_trees': self.hst.n_trees,
+            'depth': self.hst.depth,
+            'window_size': self.hst.window_size,
+            'reference_windows': self.hst.reference_windows,
+        }
 
 
 def main():
@@ -0,0 +1,348 @@
+"""
+Materialized fraud-analysis results for the government dashboard.
+
+FraudAnalysisSnapshot keeps every application's score, risk level and
+reason codes from one SubsidyFraudDetector, plus the district/state counts
+its features are computed from, so /api/fraud-analysis can be answered
+from memory instead of rescoring the whole table on every poll.
+
+A new or removed application changes the density features of everything
+in its district, which is rescored at once, and the state count of
+everything in its state. States are only marked stale on writes and
+rescored once before the next read, so a burst of inserts costs one pass
+over each state touched instead of one per insert. Results live in
+preallocated column arrays updated in place. Status changes do not touch
+any feature and leave the snapshot as is. A different detector (retrain,
+rollback) needs rebuild().
+
+Each change bumps `version`; `etag` combines it with a per-process token,
+so a dashboard that sends it back in If-None-Match can be answered with
+304 until something actually changed. The statistics payload is computed
+once per version and cached. Rescored rows are handed to on_rescore in
+order, after the snapshot lock is released, so a slow consumer (the
+database write) does not hold up dashboard reads.
+"""
+import threading
+import uuid
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_TOP_K = 10
+
+# per-application columns kept from SubsidyFraudDetector._score_features
+RESULT_DTYPES = {'anomaly_score': np.float64, 'is_anomaly': bool, 'risk_level': object, 'land_acres': np.float64,
+                 'district_density': np.int64, 'land_deviation': np.float64, 'reason_codes': np.int64}
+RESULT_COLUMNS = list(RESULT_DTYPES)
+
+
+def fraud_score_record(detector, application_id, anomaly_score, is_anomaly, risk_level, reason_codes,
+                       land_acres, district_density, land_deviation):
+    """Per-application fraud score response, from stored or snapshot values."""
+    return {
+        "application_id": application_id,
+        "risk_level": risk_level,
+        "anomaly_score": round(float(anomaly_score), 3),
+        "is_anomaly": bool(is_anomaly),
+        "fraud_indicators": detector.describe_reason_codes(int(reason_codes), land_acres,
+                                                           int(district_density), land_deviation),
+        "details": {
+            "land_acres": float(land_acres),
+            "district_density": int(district_density),
+            "land_deviation": round(float(land_deviation), 2)
+        }
+    }
+
+
+class FraudAnalysisSnapshot:
+    """
+    Fraud-analysis results for a set of applications, kept current as they change.
+
+    Args:
+        top_k: number of riskiest applications listed in statistics()
+        on_rescore: optional callable(results) given the RESULT_COLUMNS frame
+            (indexed by application_id, scoring model in attrs['model_version'])
+            of every batch of rescored rows, e.g. to persist them
+    """
+
+    def __init__(self, top_k=DEFAULT_TOP_K, on_rescore=None):
+        self.top_k = top_k
+        self.on_rescore = on_rescore
+        self.detector = None
+        self.version = 0
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.RLock()
+        # on_rescore batches waiting to be handed over, oldest first
+        self._unreported = deque()
+        self._report_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # application_id -> (total_land_acres, crop_type, district, state)
+        self._apps = {}
+        self._by_district = defaultdict(set)
+        self._by_state = defaultdict(set)
+        # district -> [applications, non-null land values, land sum]
+        self._district_totals = defaultdict(lambda: [0, 0, 0.0])
+        self._state_counts = defaultdict(int)
+        # states whose applications still need rescoring for a changed state count
+        self._stale_states = set()
+        # results: application_id -> slot in the column arrays; freed slots are reused
+        self._slots = {}
+        self._free = []
+        self._ids = np.empty(0, dtype=object)
+        self._live = np.zeros(0, dtype=bool)
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in RESULT_DTYPES.items()}
+        self._payload = None
+
+    @property
+    def etag(self):
+        return f'"{self._token}-{self.version}"'
+
+    def __len__(self):
+        return len(self._apps)
+
+    # ---------- changes ----------
+    def rebuild(self, detector, applications):
+        """Score every application (iterable of dicts) with a trained detector."""
+        with self._lock:
+            self._reset()
+            self.detector = detector
+            for record in applications:
+                self._add(record)
+            self._rescore(list(self._apps))
+            self._bump()
+        self._report()
+
+    def upsert(self, record):
+        """Add an application (dict with application_id and the feature fields) or replace it."""
+        with self._lock:
+            affected = set()
+            if record['application_id'] in self._apps:
+                affected |= self._district_of(record['application_id'])
+                self._discard(record['application_id'])
+            self._add(record)
+            affected |= self._district_of(record['application_id'])
+            self._rescore(affected)
+            self._bump()
+        self._report()
+
+    def remove(self, application_id):
+        """Drop an application; unknown ids are ignored."""
+        with self._lock:
+            if application_id not in self._apps:
+                return
+            affected = self._district_of(application_id)
+            self._discard(application_id)
+            affected.discard(application_id)
+            self._free_slot(application_id)
+            self._rescore(affected)
+            self._bump()
+        self._report()
+
+    def invalidate(self):
+        """Forget the detector, so the next current-snapshot check rebuilds."""
+        with self._lock:
+            self.detector = None
+
+    def _add(self, record):
+        app_id = record['application_id']
+        land = record.get('total_land_acres')
+        district, state = record.get('district'), record.get('state')
+        self._apps[app_id] = (land, record.get('crop_type'), district, state)
+        # applications without a district/state are never counted, as in extract_features
+        if not pd.isna(district):
+            self._by_district[district].add(app_id)
+            totals = self._district_totals[district]
+            totals[0] += 1
+            if not pd.isna(land):
+                totals[1] += 1
+                totals[2] += land
+        if not pd.isna(state):
+            self._by_state[state].add(app_id)
+            self._state_counts[state] += 1
+            self._stale_states.add(state)
+
+    def _discard(self, app_id):
+        land, _, district, state = self._apps.pop(app_id)
+        if not pd.isna(district):
+            self._by_district[district].discard(app_id)
+            totals = self._district_totals[district]
+            totals[0] -= 1
+            if not pd.isna(land):
+                totals[1] -= 1
+                totals[2] -= land
+            if totals[0] == 0:
+                del self._district_totals[district], self._by_district[district]
+        if not pd.isna(state):
+            self._by_state[state].discard(app_id)
+            self._state_counts[state] -= 1
+            self._stale_states.add(state)
+            if self._state_counts[state] == 0:
+                del self._state_counts[state], self._by_state[state]
+                self._stale_states.discard(state)
+
+    def _district_of(self, app_id):
+        """The application plus everything sharing its district."""
+        district = self._apps[app_id][2]
+        ids = {app_id}
+        if not pd.isna(district):
+            ids |= self._by_district.get(district, set())
+        return ids
+
+    def _refresh(self):
+        """Rescore the applications of states whose count changed since the last read."""
+        if self._stale_states:
+            stale = set()
+            for state in self._stale_states:
+                stale |= self._by_state.get(state, set())
+            self._stale_states.clear()
+            self._rescore(stale)
+
+    def _rescore(self, app_ids):
+        """Recompute results for app_ids from the current totals."""
+        if not app_ids:
+            return
+        app_ids = list(app_ids)
+        apps = pd.DataFrame.from_records([self._apps[i] for i in app_ids],
+                                         columns=['total_land_acres', 'crop_type', 'district', 'state'])
+        apps.insert(0, 'application_id', app_ids)
+        # per distinct district/state of the batch, then vectorized lookups
+        totals = self._district_totals
+        districts = [d for d in apps['district'].unique() if d in totals]
+        district_count = apps['district'].map({d: totals[d][0] for d in districts}).fillna(0)
+        district_avg_land = apps['district'].map(
+            {d: totals[d][2] / totals[d][1] for d in districts if totals[d][1]}
+        )
+        states = [s for s in apps['state'].unique() if s in self._state_counts]
+        state_count = apps['state'].map({s: self._state_counts[s] for s in states}).fillna(0)
+        features = self.detector._assemble_features(
+            apps, district_count.astype('int64'), district_avg_land.astype(float), state_count.astype('int64')
+        )
+        scored = self.detector._score_features(features, apps).set_index('application_id')[RESULT_COLUMNS]
+        slots = np.fromiter((self._slot(app_id) for app_id in scored.index), dtype=np.int64, count=len(scored))
+        for name in RESULT_COLUMNS:
+            self._columns[name][slots] = scored[name].to_numpy()
+        if self.on_rescore is not None:
+            # reported after the lock is released, when the detector may have changed
+            scored.attrs['model_version'] = self.detector.model_version
+            self._unreported.append(scored)
+
+    def _slot(self, app_id):
+        slot = self._slots.get(app_id)
+        if slot is None:
+            if not self._free:
+                self._grow()
+            slot = self._free.pop()
+            self._slots[app_id] = slot
+            self._ids[slot] = app_id
+            self._live[slot] = True
+        return slot
+
+    def _grow(self):
+        size = len(self._ids)
+        new_size = max(2 * size, 1024)
+        self._ids = np.resize(self._ids, new_size)
+        self._live = np.concatenate([self._live, np.zeros(new_size - size, dtype=bool)])
+        for name, column in self._columns.items():
+            self._columns[name] = np.concatenate([column, np.zeros(new_size - size, dtype=column.dtype)])
+        self._free.extend(range(new_size - 1, size - 1, -1))
+
+    def _free_slot(self, app_id):
+        slot = self._slots.pop(app_id, None)
+        if slot is not None:
+            self._live[slot] = False
+            self._ids[slot] = None
+            self._free.append(slot)
+
+    def _bump(self):
+        self.version += 1
+        self._payload = None
+
+    def _report(self):
+        """Hand rescored batches to on_rescore, in order, without holding the snapshot lock."""
+        if self.on_rescore is None:
+            return
+        with self._report_lock:
+            while True:
+                with self._lock:
+                    if not self._unreported:
+                        return
+                    batch = self._unreported.popleft()
+                self.on_rescore(batch)
+
+    # ---------- reads ----------
+    def results(self):
+        """Current results as a RESULT_COLUMNS frame indexed by application_id."""
+        with self._lock:
+            self._refresh()
+            frame = self._frame()
+        self._report()
+        return frame
+
+    def _frame(self):
+        live = np.flatnonzero(self._live)
+        return pd.DataFrame({name: self._columns[name][live] for name in RESULT_COLUMNS},
+                            index=pd.Index(self._ids[live], name='application_id'))
+
+    def result(self, application_id):
+        """
+        One application's fraud score as the /api/fraud-analysis/{application_id}
+        body, or None if it is not in the snapshot.
+        """
+        with self._lock:
+            self._refresh()
+            slot = self._slots.get(application_id)
+            if slot is None:
+                record = None
+            else:
+                row = {name: self._columns[name][slot] for name in RESULT_COLUMNS}
+                record = fraud_score_record(self.detector, application_id, row['anomaly_score'], row['is_anomaly'],
+                                            row['risk_level'], row['reason_codes'], row['land_acres'],
+                                            row['district_density'], row['land_deviation'])
+        self._report()
+        return record
+
+    def statistics(self):
+        """
+        Statistics in the get_fraud_statistics format (plain Python types),
+        computed once per version.
+        """
+        with self._lock:
+            if self._payload is None:
+                self._refresh()
+                self._payload = self._compute_statistics()
+            payload = self._payload
+        self._report()
+        return payload
+
+    def _compute_statistics(self):
+        live = np.flatnonzero(self._live)
+        total = len(live)
+        scores = self._columns['anomaly_score'][live]
+        levels = self._columns['risk_level'][live]
+        flagged = int(self._columns['is_anomaly'][live].sum())
+        # riskiest first; ties keep slot order
+        top = live[np.argsort(-scores, kind='stable')[:self.top_k]]
+        top_frame = pd.DataFrame({name: self._columns[name][top] for name in RESULT_COLUMNS})
+        top_frame.insert(0, 'application_id', self._ids[top])
+        indicators = self.detector.describe_fraud_reasons(top_frame) if total else []
+        return {
+            'total_applications': total,
+            'flagged_anomalies': flagged,
+            'anomaly_percentage': float(flagged / total * 100) if total else 0.0,
+            'high_risk_count': int((levels == 'HIGH').sum()),
+            'medium_risk_count': int((levels == 'MEDIUM').sum()),
+            'low_risk_count': int((levels == 'LOW').sum()),
+            'top_risk_applications': [
+                {
+                    'application_id': app_id,
+                    'anomaly_score': float(score),
+                    'risk_level': level,
+                    'fraud_indicators': reasons,
+                }
+                for app_id, score, level, reasons in zip(top_frame['application_id'], top_frame['anomaly_score'],
+                                                         top_frame['risk_level'], indicators)
+            ],
+        }
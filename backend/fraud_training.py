@@ -0,0 +1,276 @@
+"""
+Background training and versioned publishing for SubsidyFraudDetector
+and StreamingFraudDetector.
+
+FraudModelStore keeps trained detectors as numbered model directories
+(fraud_model_v0001/, ...; see SubsidyFraudDetector.save_model) in one
+directory, plus a CURRENT file naming the one to serve. A publisher
+claims the next number by creating its (empty) directory, so concurrent
+publishers (the API and a training process) never pick the same one. The
+model is written under a temporary name and renamed over the claim before
+CURRENT is switched to it (also by rename), so a reader sees either the
+old model or the complete new one, never a partial one. Old versions are
+kept, so rolling back is a rewrite of CURRENT.
+
+TrainingJob runs the detector's train() in a separate process, so a
+large fit neither blocks the API's event loop nor competes with it for the
+GIL. The child reports (stage, fraction) progress over a queue, publishes
+the model to the store and sends back its version; a thread in the parent
+follows the queue and hands the published version to on_published.
+"""
+
+import inspect
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from datetime import datetime
+from queue import Empty
+
+from fraud_detector import StreamingFraudDetector, SubsidyFraudDetector
+
+ARTIFACT_PREFIX = "fraud_model_v"
+CURRENT_FILE = "CURRENT"
+# detector classes by the `detector` key save_model writes to the manifest
+DETECTOR_CLASSES = {cls.DETECTOR: cls for cls in (SubsidyFraudDetector, StreamingFraudDetector)}
+
+
+def _replace_atomically(path, write):
+    """Call write(tmp_path), then rename tmp_path over path."""
+    # unique per writer: publishers may be other processes or other threads
+    tmp_path = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class FraudModelStore:
+    """Numbered fraud-model artifacts in `directory`, with CURRENT naming the served one."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"{ARTIFACT_PREFIX}{version:04d}")
+
+    def _numbers(self):
+        """Version numbers with a directory, published or only claimed, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith(ARTIFACT_PREFIX):
+                number = name[len(ARTIFACT_PREFIX):]
+                if number.isdigit():
+                    found.append(int(number))
+        return sorted(found)
+
+    def versions(self):
+        """Published versions, oldest first."""
+        # the manifest is written last, so claimed or unfinished versions have none
+        return [v for v in self._numbers() if os.path.exists(os.path.join(self._path(v), "manifest.json"))]
+
+    def current_version(self):
+        """Version named by CURRENT, or None if nothing has been published."""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def publish(self, detector):
+        """
+        Save a trained detector as the next version and make it current.
+        Returns the version.
+        """
+        if not detector.trained:
+            raise ValueError("Only a trained detector can be published.")
+        os.makedirs(self.directory, exist_ok=True)
+        version = self._claim_version()
+        try:
+            # save_model builds the directory under a temporary name and renames it over the claim
+            detector.save_model(self._path(version))
+        except BaseException:
+            if os.path.isdir(self._path(version)) and not os.listdir(self._path(version)):
+                os.rmdir(self._path(version))
+            raise
+        detector.model_version = version
+        self._set_current(version)
+        return version
+
+    def _claim_version(self):
+        """Reserve the next version number by creating its directory (atomic: one creator wins)."""
+        while True:
+            numbers = self._numbers()
+            version = numbers[-1] + 1 if numbers else 1
+            try:
+                os.mkdir(self._path(version))
+                return version
+            except FileExistsError:
+                continue
+
+    def rollback(self, version):
+        """Make an already published version current again."""
+        if version not in self.versions():
+            raise ValueError(f"Fraud model version {version} does not exist.")
+        self._set_current(version)
+
+    def _set_current(self, version):
+        def write_current(tmp_path):
+            with open(tmp_path, "w") as f:
+                f.write(f"{version}\n")
+        _replace_atomically(os.path.join(self.directory, CURRENT_FILE), write_current)
+
+    def load(self, version=None, crop_norms_path='data/crop_norms.csv'):
+        """
+        Detector for `version` (default: current), of the class its manifest
+        names, with its arrays memory-mapped. Returns None if there is no
+        such version.
+        """
+        if version is None:
+            version = self.current_version()
+        if version is None or not os.path.exists(self._path(version)):
+            return None
+        with open(os.path.join(self._path(version), "manifest.json")) as f:
+            # directories from before the detector key are Isolation Forests
+            kind = json.load(f).get("detector", SubsidyFraudDetector.DETECTOR)
+        if kind not in DETECTOR_CLASSES:
+            raise ValueError(f"Fraud model version {version} holds an unknown {kind} model.")
+        detector = DETECTOR_CLASSES[kind](crop_norms_path=crop_norms_path)
+        detector.load_model(self._path(version))
+        detector.model_version = version
+        return detector
+
+
+def _training_worker(applications_df, kind, crop_norms_path, store_dir, train_kwargs, queue):
+    """Child-process entry point: train, publish, and report over queue."""
+    try:
+        detector = DETECTOR_CLASSES[kind](crop_norms_path=crop_norms_path)
+        detector.train(applications_df, progress=lambda stage, fraction: queue.put(("progress", stage, fraction)),
+                       **train_kwargs)
+        if not detector.trained:
+            raise ValueError("no features could be extracted from the applications")
+        queue.put(("progress", "publishing", 1.0))
+        queue.put(("done", FraudModelStore(store_dir).publish(detector)))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class TrainingJob:
+    """
+    One fraud detector training run in a child process.
+
+    Args:
+        applications_df: applications to train on (pickled to the child)
+        store: FraudModelStore the trained model is published to
+        crop_norms_path: crop norms the child's detector loads
+        on_published: optional callable(version), called in the parent once
+            the new version is current
+        detector: DETECTOR key of the class to train, 'isolation_forest'
+            (SubsidyFraudDetector) or 'half_space_trees' (StreamingFraudDetector)
+        **train_kwargs: passed to the detector's train (contamination, plus
+            n_estimators, max_samples and n_jobs for isolation_forest)
+
+    Raises:
+        ValueError: for an unknown detector, or an option its train does not take
+    """
+
+    def __init__(self, applications_df, store, crop_norms_path='data/crop_norms.csv',
+                 on_published=None, detector=SubsidyFraudDetector.DETECTOR, **train_kwargs):
+        if detector not in DETECTOR_CLASSES:
+            raise ValueError(f"Unknown detector {detector!r}; expected one of {sorted(DETECTOR_CLASSES)}.")
+        accepted = inspect.signature(DETECTOR_CLASSES[detector].train).parameters
+        unsupported = sorted(set(train_kwargs) - set(accepted))
+        if unsupported:
+            raise ValueError(f"{detector} training does not take {', '.join(unsupported)}.")
+        self.job_id = uuid.uuid4().hex[:12]
+        self.detector = detector
+        self.store = store
+        self.on_published = on_published
+        self.train_kwargs = train_kwargs
+        self.rows = len(applications_df)
+        self.state = "pending"
+        self.stage = None
+        self.progress = 0.0
+        self.version = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        # spawn: never fork a process that is running server threads
+        ctx = multiprocessing.get_context("spawn")
+        self._queue = ctx.Queue()
+        self._process = ctx.Process(
+            target=_training_worker,
+            args=(applications_df, detector, crop_norms_path, store.directory, train_kwargs, self._queue),
+            name=f"fraud-train-{self.job_id}",
+            daemon=True,
+        )
+
+    def start(self):
+        self.started_at = datetime.utcnow().isoformat()
+        self.state = "running"
+        self._process.start()
+        threading.Thread(target=self._follow, name=f"fraud-train-{self.job_id}-monitor", daemon=True).start()
+        return self
+
+    def _follow(self):
+        """Apply the child's messages until it finishes or dies."""
+        while True:
+            try:
+                message = self._queue.get(timeout=1.0)
+            except Empty:
+                if not self._process.is_alive():
+                    self._finish("failed", error=f"training process exited with code {self._process.exitcode}")
+                    return
+                continue
+            kind = message[0]
+            if kind == "progress":
+                with self._lock:
+                    self.stage, self.progress = message[1], message[2]
+            elif kind == "done":
+                self._finish("published", version=message[1])
+                return
+            else:
+                self._finish("failed", error=message[1])
+                return
+
+    def _finish(self, state, version=None, error=None):
+        self._process.join()
+        # serving switches over before the job reports itself published
+        if version is not None and self.on_published is not None:
+            try:
+                self.on_published(version)
+            except Exception as e:
+                print(f"Warning: could not load published fraud model v{version} ({e}).")
+        with self._lock:
+            self.state = state
+            self.version = version
+            self.error = error
+            self.finished_at = datetime.utcnow().isoformat()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns True if it has."""
+        return self._done.wait(timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "state": self.state,
+                "stage": self.stage,
+                "progress": round(self.progress, 3),
+                "rows": self.rows,
+                "detector": self.detector,
+                "version": self.version,
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "options": self.train_kwargs,
+            }
@@ -1,18 +1,33 @@
 # main.py
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 import pandas as pd
 import joblib
 import numpy as np
 import os
+import json
+import threading
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
+from transaction_journal import TransactionJournal, TX_COLUMNS
+from transaction_index import TransactionIndex
+from quota_ledger import QuotaLedger, season_of
+from farmer_registry import FarmerRegistry, file_fingerprint
+from array_store import load_or_build
+from compiled_quota_model import CompiledQuotaModel, compile_pipeline
+from prediction_cache import LRUCache
 
 APP_DIR = os.path.dirname(__file__) or "."
 REG_PATH = os.path.join(APP_DIR, "farmer_registry_10000.csv")
 MODEL_PATH = os.path.join(APP_DIR, "max_qty_model.pkl")
+# NumPy export of max_qty_model.pkl (see compiled_quota_model.py); preferred when present
+COMPILED_MODEL_PATH = os.path.join(APP_DIR, "max_qty_model.npz")
 TRANSACTIONS_CSV = os.path.join(APP_DIR, "transaction_log.csv")
+# mmapped quota table shared by all workers, keyed by registry + model fingerprints
+QUOTA_CACHE_PATH = REG_PATH + ".quota.bin"
+# per-farmer seasonal totals rebuilt from the journal, plus its watermark
+LEDGER_SNAPSHOT_PATH = os.path.join(APP_DIR, "transaction_log.ledger.bin")
 
 app = FastAPI(title="Agri Subsidy - Max Qty Prediction API")
 
@@ -24,40 +39,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---------- Load registry ----------
-if not os.path.exists(REG_PATH):
-    print(f"Warning: registry file not found at {REG_PATH}")
-    farmer_reg = pd.DataFrame(columns=[
-        "aadhaar","farmer_id","state","district","land_size_acres",
-        "usual_crop","irrigation_type","soil_type"
-    ])
-else:
-    farmer_reg = pd.read_csv(REG_PATH, dtype={"aadhaar": str})
+# upper limit on Aadhaar numbers resolved by one /get_farmers/ call
+MAX_BULK_LOOKUP = 10000
+# upper limit on rows scored by one /predict_max_qty/batch call
+MAX_BATCH_PREDICT = 10000
+# override (not-in-registry) predictions kept per model, and for how long
+PREDICTION_CACHE_SIZE = 4096
+PREDICTION_CACHE_TTL_SECONDS = 600.0
+# upper limit on rows returned by one /transactions call
+MAX_TRANSACTION_QUERY = 1000
+# how often (seconds) the reload watcher re-stats the registry and model files
+RELOAD_POLL_SECONDS = 5.0
 
 # ---------- Load ML model ----------
-# Temporarily disabled due to sklearn version mismatch
-# if not os.path.exists(MODEL_PATH):
-#     raise FileNotFoundError(f"Model file not found at {MODEL_PATH}. Place max_qty_model.pkl here.")
-# model_pipe = joblib.load(MODEL_PATH)
-model_pipe = None  # Disabled temporarily
-
-# ---------- Ensure transaction log exists ----------
-if not os.path.exists(TRANSACTIONS_CSV):
-    pd.DataFrame(columns=[
-        "timestamp","transaction_id","aadhaar","farmer_id","state","district",
-        "crop","requested_qty_kg","predicted_max_kg","rule_max_kg","approved"
-    ]).to_csv(TRANSACTIONS_CSV, index=False)
+def load_model_pipe(path: str = None, compiled_path: str = None):
+    """
+    Load the quota model, preferring the NumPy-only max_qty_model.npz. A
+    pickled pipeline is compiled to the same fast form when possible and
+    served as-is otherwise. Returns None (rule-based fallback) when neither
+    file is usable, e.g. on an sklearn version mismatch.
+    """
+    # the same paths source_fingerprint watches
+    path = path or MODEL_PATH
+    compiled_path = compiled_path or COMPILED_MODEL_PATH
+    if os.path.exists(compiled_path):
+        try:
+            return CompiledQuotaModel.load(compiled_path)
+        except Exception as e:
+            print(f"Warning: could not load {compiled_path} ({e}); trying {path}.")
+    if not os.path.exists(path):
+        print(f"Warning: model file not found at {path}; using rule-based fallback.")
+        return None
+    try:
+        pipe = joblib.load(path)
+    except Exception as e:
+        print(f"Warning: could not load {path} ({e}); using rule-based fallback.")
+        return None
+    try:
+        return compile_pipeline(pipe)
+    except NotImplementedError as e:
+        print(f"Note: serving {path} through sklearn ({e}).")
+        return pipe
+
+# ---------- Transaction journal (creates the log if missing) ----------
+journal = TransactionJournal(TRANSACTIONS_CSV, TX_COLUMNS)
+# offset indexes over every journal segment, refreshed on each query
+transaction_index = TransactionIndex(journal)
+# cumulative requested/approved kg per (farmer, season); caps approvals at upper_bound
+quota_ledger = QuotaLedger(journal, LEDGER_SNAPSHOT_PATH)
+
+@app.on_event("shutdown")
+def close_journal():
+    journal.close()
+    quota_ledger.sync()
+    quota_ledger.save_snapshot()
 
 # ---------- Helper functions ----------
 def lookup_farmer(aadhaar: str):
-    aad = str(aadhaar)
-    rec = farmer_reg[farmer_reg['aadhaar'] == aad]
-    if rec.empty:
+    rec = current_snapshot().registry.get(aadhaar)
+    if rec is None:
         return None
-    row = rec.iloc[0].to_dict()
-    # ensure numeric land size
-    row['land_size_acres'] = float(row.get('land_size_acres', 0.0))
-    return row
+    # fresh dict per call so callers can't mutate the index
+    return rec.to_dict()
+
+# per-acre doses used by the rule-based bound
+RULE_DOSE_KG_PER_ACRE = {
+    "Paddy": 50, "Wheat":45, "Maize":30, "Cotton":20, "Groundnut":25,
+    "Soybean":20, "Sugarcane":80, "Potato":40, "Ragi":15, "Millet":15
+}
+# per-acre doses used to engineer model features - matches dataset generator
+FEATURE_DOSE_KG_PER_ACRE = {"Paddy":50,"Wheat":45,"Maize":30,"Cotton":20,"Groundnut":25,"Soybean":20,"Sugarcane":80}
+RABI_CROPS = ["Wheat","Potato","Barley"]
+# clamp predictions to [0, rule_max * UPPER_BOUND_FACTOR] (15% buffer)
+UPPER_BOUND_FACTOR = 1.15
 
 def compute_rule_max(land_acres: float, crop: str, default_dose: float = None):
     """
@@ -66,13 +120,15 @@ def compute_rule_max(land_acres: float, crop: str, default_dose: float = None):
     """
     # Try to infer recommended dose from pipeline training metadata if present
     # We don't have a direct map here; use simple fallback defaults
-    dose_lookup = {
-        "Paddy": 50, "Wheat":45, "Maize":30, "Cotton":20, "Groundnut":25,
-        "Soybean":20, "Sugarcane":80, "Potato":40, "Ragi":15, "Millet":15
-    }
-    dose = dose_lookup.get(crop, default_dose if default_dose is not None else 30)
+    dose = RULE_DOSE_KG_PER_ACRE.get(crop, default_dose if default_dose is not None else 30)
     return round(land_acres * dose, 2)
 
+def compute_rule_max_batch(land_acres, crops, default_dose: float = None):
+    """Vectorized compute_rule_max over aligned land and crop arrays."""
+    dose = pd.Series(crops, dtype=object).map(RULE_DOSE_KG_PER_ACRE)
+    dose = dose.fillna(default_dose if default_dose is not None else 30).to_numpy(dtype=float)
+    return np.round(np.asarray(land_acres, dtype=float) * dose, 2)
+
 def build_feature_row(farmer_row: dict):
     """
     Build a single-row (dict) matching the pipeline features used in training.
@@ -86,10 +142,7 @@ def build_feature_row(farmer_row: dict):
     land = float(farmer_row.get("land_size_acres", 0.0))
 
     # derive engineered features similar to training
-    recommended = None
-    # a small default mapping - matches dataset generator
-    dose_map = {"Paddy":50,"Wheat":45,"Maize":30,"Cotton":20,"Groundnut":25,"Soybean":20,"Sugarcane":80}
-    recommended = dose_map.get(crop_type, 30)
+    recommended = FEATURE_DOSE_KG_PER_ACRE.get(crop_type, 30)
 
     base_qty = land * recommended
     # past_usage is not in registry for simple mock; assume base*0.9
@@ -100,7 +153,7 @@ def build_feature_row(farmer_row: dict):
     # season heuristic
     if crop_type == "Paddy":
         season = "Kharif"
-    elif crop_type in ["Wheat","Potato","Barley"]:
+    elif crop_type in RABI_CROPS:
         season = "Rabi"
     else:
         season = "Kharif"
@@ -121,6 +174,278 @@ def build_feature_row(farmer_row: dict):
     }
     return row
 
+def build_feature_frame(farmers: pd.DataFrame):
+    """
+    Column-wise build_feature_row for many farmers at once.
+    `farmers` has registry-style columns (e.g. FarmerRegistry.to_frame()); returns a
+    DataFrame with the same columns, in the same order, as build_feature_row.
+    """
+    n = len(farmers)
+
+    def column(name, default):
+        if name in farmers:
+            return farmers[name].to_numpy()
+        return np.full(n, default, dtype=object)
+
+    if "usual_crop" in farmers:
+        crop_type = farmers["usual_crop"].astype(object)
+    else:
+        crop_type = pd.Series(column("crop", "Paddy"), dtype=object)
+    land = pd.to_numeric(pd.Series(column("land_size_acres", 0.0)), errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+    recommended = crop_type.map(FEATURE_DOSE_KG_PER_ACRE).fillna(30).to_numpy(dtype=np.int64)
+    base_qty = land * recommended
+    past_usage_per_acre = (base_qty * 0.9) / np.where(land > 0, land, 1.0)
+    season = np.where(crop_type.isin(RABI_CROPS), "Rabi", "Kharif")
+
+    return pd.DataFrame({
+        "state": column("state", ""),
+        "crop_type": crop_type.to_numpy(),
+        "season": season,
+        "irrigation_type": column("irrigation_type", "Rainfed"),
+        "soil_type": column("soil_type", "Loam"),
+        "land_size_acres": land,
+        "recommended_dose_kg_per_acre": recommended,
+        "past_usage_per_acre": past_usage_per_acre,
+        "base_qty": base_qty,
+        "yield_per_acre": np.zeros(n),
+        "land_sq": land ** 2
+    })
+
+def predict_quota(X_df: pd.DataFrame, model_pipe=None):
+    """
+    Score a feature frame in one call to model_pipe (or the rule fallback).
+    Returns (pred, pred_clamped, rule_max, upper_bound) arrays.
+    """
+    rule_max = compute_rule_max_batch(X_df["land_size_acres"], X_df["crop_type"])
+    if model_pipe is not None and len(X_df):
+        pred = np.asarray(model_pipe.predict(X_df), dtype=float)
+    else:
+        # Fallback to rule-based calculation when model is unavailable
+        pred = rule_max
+    upper_bound = np.maximum(rule_max * UPPER_BOUND_FACTOR, 0.0)
+    pred_clamped = np.round(np.clip(pred, 0.0, upper_bound), 2)
+    return pred, pred_clamped, rule_max, upper_bound
+
+def predict_quota_or_rules(X_df: pd.DataFrame, model_pipe=None):
+    """
+    predict_quota, with the rule fallback for rows model_pipe cannot score
+    (e.g. a category unseen in training). Also returns a bool array marking them.
+    """
+    try:
+        return (*predict_quota(X_df, model_pipe), np.zeros(len(X_df), dtype=bool))
+    except Exception as e:
+        print(f"Warning: model prediction failed ({e}); scoring the rows one at a time.")
+    parts, fallback = [], np.zeros(len(X_df), dtype=bool)
+    for k in range(len(X_df)):
+        row = X_df.iloc[[k]]
+        try:
+            parts.append(predict_quota(row, model_pipe))
+        except Exception:
+            parts.append(predict_quota(row, None))
+            fallback[k] = True
+    return (*(np.concatenate(arrays) for arrays in zip(*parts)), fallback)
+
+def predict_quota_one(feat: dict, model_pipe=None):
+    """predict_quota for one build_feature_row dict; skips pandas for compiled models."""
+    rule_max = compute_rule_max(feat["land_size_acres"], feat["crop_type"])
+    if model_pipe is None:
+        pred = rule_max
+    elif isinstance(model_pipe, CompiledQuotaModel):
+        pred = model_pipe.predict_one(feat)
+    else:
+        pred = float(model_pipe.predict(pd.DataFrame([feat]))[0])
+    upper_bound = max(rule_max * UPPER_BOUND_FACTOR, 0.0)
+    pred_clamped = round(float(np.clip(pred, 0.0, upper_bound)), 2)
+    return pred, pred_clamped, rule_max, upper_bound
+
+def farmer_row_from_request(req, registry: FarmerRegistry):
+    """Registry row for req.aadhaar, else a row built from the override fields."""
+    if req.aadhaar:
+        rec = registry.get(req.aadhaar)
+        if rec is not None:
+            return rec.to_dict()
+        # allow prediction using provided override fields
+        if not (req.state and req.crop_type and req.land_size_acres):
+            raise HTTPException(status_code=404, detail="Aadhaar not found; provide state, crop_type, land_size_acres to predict.")
+    elif not (req.state and req.crop_type and req.land_size_acres):
+        # Aadhaar not provided; require overrides
+        raise HTTPException(status_code=400, detail="Provide aadhaar or (state, crop_type, land_size_acres).")
+    return {
+        "state": req.state.strip(),
+        "usual_crop": req.crop_type.strip(),
+        "irrigation_type": (req.irrigation_type or "").strip() or "Rainfed",
+        "soil_type": (req.soil_type or "").strip() or "Loam",
+        "land_size_acres": round(float(req.land_size_acres), 6)
+    }
+
+def override_cache_key(farmer_row: dict):
+    """Prediction cache key for a normalized override row from farmer_row_from_request."""
+    return (farmer_row["state"], farmer_row["usual_crop"], farmer_row["irrigation_type"],
+            farmer_row["soil_type"], farmer_row["land_size_acres"])
+
+# ---------- Precomputed quota table ----------
+class QuotaTable:
+    """Quota outputs for every registry row, aligned by FarmerRecord.row."""
+    __slots__ = ("predicted", "predicted_clamped", "rule_max", "upper_bound")
+
+    def __init__(self, predicted, predicted_clamped, rule_max, upper_bound):
+        self.predicted = predicted
+        self.predicted_clamped = predicted_clamped
+        self.rule_max = rule_max
+        self.upper_bound = upper_bound
+
+    def quota(self, row: int):
+        return {
+            "predicted_max_qty_kg": float(self.predicted[row]),
+            "predicted_max_qty_kg_clamped": float(self.predicted_clamped[row]),
+            "rule_max_qty_kg": float(self.rule_max[row]),
+            "upper_bound_kg": float(self.upper_bound[row])
+        }
+
+def source_fingerprint():
+    model = (file_fingerprint(MODEL_PATH), file_fingerprint(COMPILED_MODEL_PATH))
+    return (file_fingerprint(REG_PATH), model)
+
+def score_registry(registry: FarmerRegistry, model_pipe=None):
+    """Score the whole registry in one vectorized pass."""
+    X_df = build_feature_frame(registry.to_frame())
+    try:
+        pred, pred_clamped, rule_max, upper_bound = predict_quota(X_df, model_pipe)
+    except Exception as e:
+        # a model that loads but cannot predict must not take the API down
+        print(f"Warning: model prediction failed ({e}); quota table uses rule-based fallback.")
+        pred, pred_clamped, rule_max, upper_bound = predict_quota(X_df, None)
+    return {
+        "predicted": np.round(pred, 2),
+        "predicted_clamped": pred_clamped,
+        "rule_max": rule_max,
+        "upper_bound": np.round(upper_bound, 2)
+    }
+
+def build_quota_table(registry: FarmerRegistry, model_pipe=None, fingerprint=None):
+    """
+    Quota table for registry. With a fingerprint the arrays come from the
+    shared QUOTA_CACHE_PATH file: the first worker scores the registry,
+    the others map its result.
+    """
+    if fingerprint is None:
+        arrays = score_registry(registry, model_pipe)
+    else:
+        # JSON round-trip so tuples compare equal to the lists stored in the header
+        key = json.loads(json.dumps(fingerprint))
+        arrays, _ = load_or_build(
+            QUOTA_CACHE_PATH,
+            lambda meta: meta.get("fingerprint") == key,
+            lambda: (score_registry(registry, model_pipe), {"fingerprint": key}),
+        )
+    return QuotaTable(arrays["predicted"], arrays["predicted_clamped"],
+                      arrays["rule_max"], arrays["upper_bound"])
+
+# ---------- Serving snapshot and hot reload ----------
+class ServingSnapshot:
+    """
+    Registry, model and quota table that belong together. Never mutated:
+    a reload builds a new snapshot and swaps the module reference, so a
+    request that grabbed one at its start sees a consistent view throughout.
+    prediction_cache holds override predictions of this snapshot's model
+    and is only ever filled, never invalidated, while the snapshot lives.
+    """
+    __slots__ = ("registry", "model_pipe", "quota", "fingerprint", "version", "loaded_at",
+                 "prediction_cache")
+
+    def __init__(self, registry, model_pipe, quota, fingerprint, version, prediction_cache=None):
+        self.registry = registry
+        self.model_pipe = model_pipe
+        self.quota = quota
+        self.fingerprint = fingerprint
+        self.version = version
+        self.prediction_cache = prediction_cache or LRUCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS)
+        self.loaded_at = datetime.utcnow().isoformat()
+
+def build_snapshot(fingerprint, previous: ServingSnapshot = None):
+    """Load what changed since `previous` (everything if None) and rebuild the quota table."""
+    if previous is not None and fingerprint[0] == previous.fingerprint[0]:
+        registry = previous.registry
+    else:
+        # columnar registry; mmaps farmer_registry_10000.csv.bin when it is up to date
+        registry = FarmerRegistry.load(REG_PATH)
+    if previous is not None and fingerprint[1] == previous.fingerprint[1]:
+        model_pipe = previous.model_pipe
+        # override predictions do not depend on the registry, keep them
+        prediction_cache = previous.prediction_cache
+    else:
+        model_pipe = load_model_pipe()
+        prediction_cache = None  # new model: start from an empty cache
+    quota = build_quota_table(registry, model_pipe, fingerprint)
+    version = previous.version + 1 if previous is not None else 1
+    return ServingSnapshot(registry, model_pipe, quota, fingerprint, version, prediction_cache)
+
+_snapshot = build_snapshot(source_fingerprint())
+
+def current_snapshot():
+    return _snapshot
+
+class ReloadWatcher:
+    """
+    Background thread that polls the registry and model fingerprints and
+    swaps in a freshly built snapshot off the request path. A change must
+    be seen on two consecutive polls before it is loaded, so a file that is
+    still being copied into place is not picked up half-written.
+    """
+
+    def __init__(self, interval: float = RELOAD_POLL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reload-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """One poll; returns True if a new snapshot was swapped in."""
+        global _snapshot
+        fingerprint = source_fingerprint()
+        if fingerprint == _snapshot.fingerprint:
+            self._pending = None
+            return False
+        if fingerprint != self._pending:
+            self._pending = fingerprint
+            return False
+        try:
+            new_snapshot = build_snapshot(fingerprint, _snapshot)
+        except Exception as e:
+            # keep serving the old snapshot; retried on the next poll
+            print(f"Warning: reload failed ({e}); keeping snapshot v{_snapshot.version}.")
+            return False
+        _snapshot = new_snapshot
+        self._pending = None
+        print(f"Reloaded registry/model as snapshot v{new_snapshot.version}.")
+        return True
+
+reload_watcher = ReloadWatcher()
+
+@app.on_event("startup")
+def start_reload_watcher():
+    reload_watcher.start()
+
+@app.on_event("shutdown")
+def stop_reload_watcher():
+    reload_watcher.stop()
+
 # ---------- API schemas ----------
 class PredictRequest(BaseModel):
     aadhaar: Optional[str] = None
@@ -131,6 +456,14 @@ class PredictRequest(BaseModel):
     soil_type: Optional[str] = None
     land_size_acres: Optional[float] = None
 
+class BulkLookupRequest(BaseModel):
+    aadhaar: List[str]
+
+class BatchPredictRequest(BaseModel):
+    aadhaar: List[str] = []
+    # override rows, same fields as /predict_max_qty/
+    rows: List[PredictRequest] = []
+
 class SubmitRequest(BaseModel):
     aadhaar: str
     requested_qty_kg: float
@@ -147,103 +480,158 @@ def get_farmer(aadhaar: str):
         raise HTTPException(status_code=404, detail="Aadhaar not found in registry.")
     return rec
 
+@app.post("/get_farmers/")
+def get_farmers(body: BulkLookupRequest):
+    if len(body.aadhaar) > MAX_BULK_LOOKUP:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_LOOKUP} Aadhaar numbers per request.")
+    registry = current_snapshot().registry
+    rows = registry.find_many(body.aadhaar)
+    farmers = [registry.record(int(row)).to_dict() for row in rows if row >= 0]
+    not_found = [a for a, row in zip(body.aadhaar, rows) if row < 0]
+    return {"count": len(farmers), "farmers": farmers, "not_found": not_found}
+
 @app.post("/predict_max_qty/")
 def predict_max(req: PredictRequest):
-    # Try registry if aadhaar provided
-    if req.aadhaar:
-        reg = lookup_farmer(req.aadhaar)
-        if reg is None:
-            # allow prediction using provided override fields
-            if not (req.state and req.crop_type and req.land_size_acres):
-                raise HTTPException(status_code=404, detail="Aadhaar not found; provide state, crop_type, land_size_acres to predict.")
-            farmer_row = {
-                "state": req.state,
-                "usual_crop": req.crop_type,
-                "irrigation_type": req.irrigation_type or "Rainfed",
-                "soil_type": req.soil_type or "Loam",
-                "land_size_acres": req.land_size_acres
-            }
-        else:
-            farmer_row = reg
-    else:
-        # Aadhaar not provided; require overrides
-        if not (req.state and req.crop_type and req.land_size_acres):
-            raise HTTPException(status_code=400, detail="Provide aadhaar or (state, crop_type, land_size_acres).")
-        farmer_row = {
-            "state": req.state,
-            "usual_crop": req.crop_type,
-            "irrigation_type": req.irrigation_type or "Rainfed",
-            "soil_type": req.soil_type or "Loam",
-            "land_size_acres": req.land_size_acres
-        }
+    snap = current_snapshot()
+    # Registry farmers: read the precomputed quota row
+    rec = snap.registry.get(req.aadhaar) if req.aadhaar else None
+    if rec is not None:
+        return {**snap.quota.quota(rec.row), "input_features": build_feature_row(rec.to_dict())}
+
+    farmer_row = farmer_row_from_request(req, snap.registry)
+    key = override_cache_key(farmer_row)
+    cached = snap.prediction_cache.get(key)
+    if cached is not None:
+        return {**cached, "input_features": dict(cached["input_features"])}
 
     # Build feature vector and predict
     feat = build_feature_row(farmer_row)
-    X_df = pd.DataFrame([feat])
-    
-    # Use model if available, otherwise use rule-based calculation
-    if model_pipe is not None:
-        pred = float(model_pipe.predict(X_df)[0])
-    else:
-        # Fallback to rule-based calculation when model is unavailable
-        rule_max = compute_rule_max(feat['land_size_acres'], feat['crop_type'])
-        pred = rule_max
-
-    # Compute rule-based max and clamp predicted value within a safe bound
-    rule_max = compute_rule_max(feat['land_size_acres'], feat['crop_type'])
-    # clamp to [0, rule_max * 1.15] (15% buffer)
-    upper_bound = max(rule_max * 1.15, 0.0)
-    lower_bound = 0.0
-    pred_clamped = round(float(np.clip(pred, lower_bound, upper_bound)), 2)
+    try:
+        pred, pred_clamped, rule_max, upper_bound = predict_quota_one(feat, snap.model_pipe)
+        fallback = False
+    except Exception as e:
+        # e.g. a crop or state the model never saw: answer with the rule instead of a 500
+        print(f"Warning: model prediction failed ({e}); using rule-based fallback.")
+        pred, pred_clamped, rule_max, upper_bound = predict_quota_one(feat, None)
+        fallback = True
 
-    return {
+    result = {
         "predicted_max_qty_kg": round(pred,2),
         "predicted_max_qty_kg_clamped": pred_clamped,
         "rule_max_qty_kg": rule_max,
         "upper_bound_kg": round(upper_bound,2),
         "input_features": feat
     }
+    if fallback:
+        result["fallback"] = "rule_based"
+    snap.prediction_cache.put(key, {**result, "input_features": dict(feat)})
+    return result
+
+@app.get("/predict_max_qty/cache_stats")
+def prediction_cache_stats():
+    snap = current_snapshot()
+    return {"snapshot_version": snap.version, **snap.prediction_cache.stats()}
+
+@app.post("/predict_max_qty/batch")
+def predict_max_batch(body: BatchPredictRequest):
+    requests = [PredictRequest(aadhaar=a) for a in body.aadhaar] + list(body.rows)
+    if len(requests) > MAX_BATCH_PREDICT:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PREDICT} rows per batch.")
+
+    snap = current_snapshot()
+    results = [None] * len(requests)
+    farmer_rows, positions, errors = [], [], []
+    for i, req in enumerate(requests):
+        row = snap.registry.find(req.aadhaar) if req.aadhaar else -1
+        if row >= 0:
+            results[i] = {"index": i, "aadhaar": req.aadhaar, **snap.quota.quota(row)}
+            continue
+        try:
+            farmer_rows.append(farmer_row_from_request(req, snap.registry))
+            positions.append(i)
+        except HTTPException as e:
+            errors.append({"index": i, "aadhaar": req.aadhaar, "detail": e.detail})
+
+    if farmer_rows:
+        X_df = build_feature_frame(pd.DataFrame(farmer_rows))
+        pred, pred_clamped, rule_max, upper_bound, fallback = predict_quota_or_rules(X_df, snap.model_pipe)
+        pred = np.round(pred, 2)
+        upper_bound = np.round(upper_bound, 2)
+        for k, i in enumerate(positions):
+            results[i] = {
+                "index": i,
+                "aadhaar": requests[i].aadhaar,
+                "predicted_max_qty_kg": float(pred[k]),
+                "predicted_max_qty_kg_clamped": float(pred_clamped[k]),
+                "rule_max_qty_kg": float(rule_max[k]),
+                "upper_bound_kg": float(upper_bound[k])
+            }
+            if fallback[k]:
+                results[i]["fallback"] = "rule_based"
+    results = [r for r in results if r is not None]
+
+    return {"count": len(results), "results": results, "errors": errors}
 
 @app.post("/submit_request/")
 def submit_request(body: SubmitRequest):
     # Validate
-    reg = lookup_farmer(body.aadhaar)
-    if reg is None:
+    snap = current_snapshot()
+    rec = snap.registry.get(body.aadhaar)
+    if rec is None:
         raise HTTPException(status_code=404, detail="Aadhaar not found; cannot submit.")
-    feat = build_feature_row(reg)
-    X_df = pd.DataFrame([feat])
-    
-    # Use model if available, otherwise use rule-based calculation
-    if model_pipe is not None:
-        pred = float(model_pipe.predict(X_df)[0])
-    else:
-        # Fallback to rule-based calculation when model is unavailable
-        rule_max = compute_rule_max(reg.get("land_size_acres", 2.0), body.crop)
-        pred = rule_max
-    rule_max = compute_rule_max(feat['land_size_acres'], feat['crop_type'])
-    upper_bound = max(rule_max * 1.15, 0.0)
-    approved = False
-    if 0 <= body.requested_qty_kg <= upper_bound:
-        approved = True
-
-    # Log transaction
-    tx = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "transaction_id": f"T{int(pd.Timestamp.utcnow().timestamp())}",
-        "aadhaar": body.aadhaar,
-        "farmer_id": reg.get("farmer_id","UNKNOWN"),
-        "state": reg.get("state"),
-        "district": reg.get("district"),
-        "crop": reg.get("usual_crop"),
-        "requested_qty_kg": body.requested_qty_kg,
-        "predicted_max_kg": round(pred,2),
-        "rule_max_kg": rule_max,
-        "approved": approved
+    reg = rec.to_dict()
+    pred = snap.quota.predicted[rec.row]
+    rule_max = float(snap.quota.rule_max[rec.row])
+    upper_bound = float(snap.quota.upper_bound[rec.row])
+    # upper_bound caps the farmer's approved total for the whole season, not each request
+    timestamp = datetime.utcnow().isoformat()
+    season = season_of(timestamp)
+    # the farmer stays locked (in every worker) until the row is in the journal
+    reservation = quota_ledger.reservation(body.aadhaar, season, body.requested_qty_kg, upper_bound)
+    with reservation as (approved, approved_before):
+        # Log transaction
+        tx = {
+            "timestamp": timestamp,
+            "transaction_id": f"T{int(pd.Timestamp.utcnow().timestamp())}",
+            "aadhaar": body.aadhaar,
+            "farmer_id": reg.get("farmer_id","UNKNOWN"),
+            "state": reg.get("state"),
+            "district": reg.get("district"),
+            "crop": reg.get("usual_crop"),
+            "requested_qty_kg": body.requested_qty_kg,
+            "predicted_max_kg": float(pred),
+            "rule_max_kg": rule_max,
+            "approved": approved
+        }
+        # Append to the journal; returns once the row is fsynced
+        journal.append(tx)
+
+    approved_total = approved_before + (body.requested_qty_kg if approved else 0.0)
+    return {
+        "approved": approved,
+        "transaction": tx,
+        "season": season,
+        "season_approved_kg": round(approved_total, 2),
+        "season_remaining_kg": round(max(upper_bound - approved_total, 0.0), 2)
     }
-    # Append to CSV
-    tx_df = pd.DataFrame([tx])
-    existing = pd.read_csv(TRANSACTIONS_CSV)
-    concat = pd.concat([existing, tx_df], ignore_index=True)
-    concat.to_csv(TRANSACTIONS_CSV, index=False)
 
-    return {"approved": approved, "transaction": tx}
+@app.get("/quota_ledger/")
+def get_quota_ledger(aadhaar: str):
+    """Cumulative requested/approved kg per season for one farmer."""
+    quota_ledger.sync()
+    return {"aadhaar": aadhaar, "seasons": quota_ledger.seasons(aadhaar)}
+
+@app.get("/transactions")
+def query_transactions(aadhaar: Optional[str] = None, farmer_id: Optional[str] = None,
+                       state: Optional[str] = None, district: Optional[str] = None,
+                       approved: Optional[bool] = None, since: Optional[str] = None,
+                       until: Optional[str] = None, limit: int = 100):
+    """Transactions matching all given filters, newest first. since/until are inclusive ISO timestamps."""
+    if not 0 < limit <= MAX_TRANSACTION_QUERY:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_TRANSACTION_QUERY}.")
+    filters = {"aadhaar": aadhaar, "farmer_id": farmer_id, "state": state, "district": district}
+    try:
+        count, rows = transaction_index.query(filters, since, until, approved, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid since/until timestamp ({e}).")
+    return {"count": count, "returned": len(rows), "transactions": rows}
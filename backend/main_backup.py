@@ -1,14 +1,19 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Optional, Literal, List
 from datetime import datetime
 import random
 import string
 import pandas as pd
 from fraud_detector import SubsidyFraudDetector
+from fraud_training import DETECTOR_CLASSES, FraudModelStore, TrainingJob
+from fraud_snapshot import FraudAnalysisSnapshot, fraud_score_record
+from ml_integrated_fraud_detector import get_ml_integrated_detector
 from sqlalchemy.orm import Session
-from database import get_db, init_db, Application, User
+from sqlalchemy import bindparam
+from database import get_db, init_db, engine, Application, User
 
 app = FastAPI(title="Farmer Portal API", version="1.0.0")
 
@@ -17,9 +22,59 @@ app = FastAPI(title="Farmer Portal API", version="1.0.0")
 async def startup_event():
     init_db()
     print("✅ Database initialized")
+    # load the ML models and reference data in the background; requests that
+    # arrive first are scored with the rules only
+    get_ml_integrated_detector()
 
-# Initialize fraud detector
-fraud_detector = SubsidyFraudDetector(crop_norms_path='data/crop_norms.csv')
+# Initialize fraud detector, serving the latest published model if there is one
+CROP_NORMS_PATH = 'data/crop_norms.csv'
+fraud_model_store = FraudModelStore('data/fraud_models')
+fraud_detector = (fraud_model_store.load(crop_norms_path=CROP_NORMS_PATH)
+                  or SubsidyFraudDetector(crop_norms_path=CROP_NORMS_PATH))
+def persist_fraud_scores(results):
+    """Store rescored rows in the fraud_* columns of their applications (one executemany)."""
+    table = Application.__table__
+    scored_at = datetime.utcnow()
+    model_version = results.attrs.get("model_version")
+    rows = [
+        {
+            "b_application_id": app_id,
+            "b_score": float(row.anomaly_score),
+            "b_is_anomaly": bool(row.is_anomaly),
+            "b_risk_level": row.risk_level,
+            "b_reason_codes": int(row.reason_codes),
+            "b_district_density": int(row.district_density),
+            "b_land_deviation": None if pd.isna(row.land_deviation) else float(row.land_deviation),
+        }
+        for app_id, row in zip(results.index, results.itertuples(index=False))
+    ]
+    statement = table.update().where(table.c.application_id == bindparam("b_application_id")).values(
+        fraud_score=bindparam("b_score"),
+        fraud_is_anomaly=bindparam("b_is_anomaly"),
+        fraud_risk_level=bindparam("b_risk_level"),
+        fraud_reason_codes=bindparam("b_reason_codes"),
+        fraud_district_density=bindparam("b_district_density"),
+        fraud_land_deviation=bindparam("b_land_deviation"),
+        fraud_model_version=model_version,
+        fraud_scored_at=scored_at
+    )
+    try:
+        with engine.begin() as conn:
+            conn.execute(statement, rows)
+    except Exception as e:
+        # the snapshot still has the scores; lookups fall back to it
+        print(f"Warning: could not store {len(rows)} fraud scores ({e}).")
+
+# /api/fraud-analysis results, kept current as applications change; every
+# rescored row is also written back to its application
+fraud_snapshot = FraudAnalysisSnapshot(on_rescore=persist_fraud_scores)
+# background training jobs by job_id; at most one runs at a time
+training_jobs = {}
+
+def use_published_fraud_model(version):
+    """Swap a published model in for serving (one reference assignment)."""
+    global fraud_detector
+    fraud_detector = fraud_model_store.load(version, crop_norms_path=CROP_NORMS_PATH)
 
 # CORS configuration to allow frontend to communicate
 app.add_middleware(
@@ -49,6 +104,15 @@ class EligibilityCheckRequest(BaseModel):
     requested_qty: float = Field(..., ge=0)
     subsidy_type: str = Field(default='fertilizer')
 
+class EligibilityBatchItem(BaseModel):
+    crop_type: str = Field(..., min_length=1)
+    land_size_acres: float = Field(..., gt=0)
+    fertilizer_qty: float = Field(default=0, ge=0, description="Requested fertilizer quantity in kg")
+    seed_qty: float = Field(default=0, ge=0, description="Requested seed quantity in kg")
+
+class EligibilityBatchRequest(BaseModel):
+    items: List[EligibilityBatchItem] = Field(..., max_length=10000)
+
 class ApplicationResponse(BaseModel):
     application_id: str
     farmer_name: str
@@ -117,6 +181,21 @@ async def create_application(application: ApplicationCreate, db: Session = Depen
         db.commit()
         db.refresh(db_application)
         
+        # rescore the new application's district and state in the dashboard snapshot
+        if fraud_snapshot.detector is not None:
+            try:
+                fraud_snapshot.upsert({
+                    "application_id": app_id,
+                    "total_land_acres": application.total_land_acres,
+                    "crop_type": application.crop_type,
+                    "district": application.district,
+                    "state": application.state
+                })
+            except Exception as e:
+                # the application is saved; rebuild the snapshot on the next analysis
+                print(f"Warning: fraud snapshot update failed ({e}); will rebuild.")
+                fraud_snapshot.invalidate()
+        
         return {
             "success": True,
             "message": "Application submitted successfully",
@@ -206,35 +285,41 @@ async def login(credentials: LoginRequest):
 @app.put("/api/applications/{application_id}/status")
 async def update_application_status(
     application_id: str,
-    status: Literal["Approved", "Pending", "Rejected"]
+    new_status: Literal["Approved", "Pending", "Rejected"] = Query(..., alias="status"),
+    db: Session = Depends(get_db)
 ):
     """Update application status (for department use)"""
     
-    if application_id not in applications_db:
+    application = db.query(Application).filter(Application.application_id == application_id).first()
+    if application is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Application not found"
         )
     
-    applications_db[application_id]["status"] = status
+    application.status = new_status
+    db.commit()
+    # status is not a fraud feature, so the fraud snapshot stays valid
     
     return {
         "success": True,
-        "message": f"Application status updated to {status}",
+        "message": f"Application status updated to {new_status}",
         "application_id": application_id
     }
 
 @app.delete("/api/applications/{application_id}")
-async def delete_application(application_id: str):
+async def delete_application(application_id: str, db: Session = Depends(get_db)):
     """Delete an application (admin use)"""
     
-    if application_id not in applications_db:
+    deleted = db.query(Application).filter(Application.application_id == application_id).delete()
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Application not found"
         )
-    
-    del applications_db[application_id]
+    db.commit()
+    # rescore the district and state it leaves in the dashboard snapshot
+    fraud_snapshot.remove(application_id)
     
     return {
         "success": True,
@@ -251,14 +336,52 @@ async def health_check():
     }
 
 # Fraud Detection Endpoints
+@app.get("/api/ml/readiness")
+async def get_ml_readiness():
+    """
+    Load state of each ML model and reference dataset. 503 until the models
+    are in (fraud scoring is rules-only until then), 200 once they are.
+    """
+    readiness = get_ml_integrated_detector().readiness()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if readiness["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=readiness
+    )
+
+# Application columns the fraud features are computed from
+FRAUD_FEATURE_COLUMNS = ('application_id', 'total_land_acres', 'crop_type', 'district', 'state')
+
+def fraud_feature_records(db: Session):
+    """Every application's fraud feature fields, as dicts."""
+    columns = [getattr(Application, name) for name in FRAUD_FEATURE_COLUMNS]
+    return [row._asdict() for row in db.query(*columns)]
+
+def current_fraud_snapshot(db: Session):
+    """fraud_snapshot, rebuilt from the database first if the served model has changed since it was built."""
+    if fraud_snapshot.detector is not fraud_detector:
+        fraud_snapshot.rebuild(fraud_detector, fraud_feature_records(db))
+    return fraud_snapshot
+
 @app.get("/api/fraud-analysis")
-async def get_fraud_analysis():
+async def get_fraud_analysis(request: Request, db: Session = Depends(get_db)):
     """
     Analyze all applications for fraud patterns.
     Returns statistics and flagged applications.
+    
+    Once a model is trained the result is served from the materialized
+    snapshot, with an ETag; a matching If-None-Match gets 304 Not Modified.
     """
     try:
-        if not applications_db:
+        if not fraud_detector.trained:
+            # first analysis trains the model on the current applications
+            records = fraud_feature_records(db)
+            if records:
+                return fraud_analysis_response(fraud_detector.get_fraud_statistics(pd.DataFrame(records)))
+            snapshot = None
+        else:
+            snapshot = current_fraud_snapshot(db)
+        
+        if snapshot is None or len(snapshot) == 0:
             return {
                 "message": "No applications to analyze",
                 "statistics": {
@@ -272,79 +395,67 @@ async def get_fraud_analysis():
                 "flagged_applications": []
             }
         
-        # Convert applications to DataFrame
-        apps_list = list(applications_db.values())
-        apps_df = pd.DataFrame(apps_list)
-        
-        # Perform fraud detection
-        stats = fraud_detector.get_fraud_statistics(apps_df)
-        
-        return {
-            "message": "Fraud analysis completed successfully",
-            "statistics": {
-                "total_applications": stats['total_applications'],
-                "flagged_anomalies": stats['flagged_anomalies'],
-                "anomaly_percentage": round(stats['anomaly_percentage'], 2),
-                "high_risk_count": stats['high_risk_count'],
-                "medium_risk_count": stats['medium_risk_count'],
-                "low_risk_count": stats['low_risk_count']
-            },
-            "flagged_applications": stats['top_risk_applications']
-        }
+        etag = snapshot.etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return JSONResponse(content=fraud_analysis_response(snapshot.statistics()), headers={"ETag": etag})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Fraud analysis failed: {str(e)}"
         )
 
+def fraud_analysis_response(stats):
+    """/api/fraud-analysis body for get_fraud_statistics-style stats."""
+    return {
+        "message": "Fraud analysis completed successfully",
+        "statistics": {
+            "total_applications": stats['total_applications'],
+            "flagged_anomalies": stats['flagged_anomalies'],
+            "anomaly_percentage": round(stats['anomaly_percentage'], 2),
+            "high_risk_count": stats['high_risk_count'],
+            "medium_risk_count": stats['medium_risk_count'],
+            "low_risk_count": stats['low_risk_count']
+        },
+        "flagged_applications": stats['top_risk_applications']
+    }
+
 @app.get("/api/fraud-analysis/{application_id}")
-async def get_application_fraud_score(application_id: str):
+async def get_application_fraud_score(application_id: str, db: Session = Depends(get_db)):
     """
     Get fraud risk score for a specific application.
+    
+    Reads the score stored on the application (indexed by application_id)
+    when it came from the model being served; otherwise it is taken from
+    the fraud snapshot, which rescoring writes back to the table.
     """
     try:
-        if not applications_db:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No applications found"
-            )
-        
-        if application_id not in applications_db:
+        application = db.query(Application).filter(Application.application_id == application_id).first()
+        if application is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Application not found"
             )
         
-        # Convert applications to DataFrame
-        apps_list = list(applications_db.values())
-        apps_df = pd.DataFrame(apps_list)
-        
-        # Get fraud predictions
-        results = fraud_detector.predict_anomalies(apps_df)
-        
-        # Find specific application result
-        app_result = results[results['application_id'] == application_id]
+        if (application.fraud_score is not None and fraud_detector.model_version is not None
+                and application.fraud_model_version == fraud_detector.model_version):
+            return fraud_score_record(
+                fraud_detector, application_id, application.fraud_score, application.fraud_is_anomaly,
+                application.fraud_risk_level, application.fraud_reason_codes, application.total_land_acres,
+                application.fraud_district_density,
+                application.fraud_land_deviation if application.fraud_land_deviation is not None else float('nan')
+            )
         
-        if app_result.empty:
+        if not fraud_detector.trained:
+            # first analysis trains the model on the current applications
+            fraud_detector.train(pd.DataFrame(fraud_feature_records(db)))
+        result = current_fraud_snapshot(db).result(application_id)
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Fraud score not available for this application"
             )
-        
-        result = app_result.iloc[0]
-        
-        return {
-            "application_id": application_id,
-            "risk_level": result['risk_level'],
-            "anomaly_score": round(float(result['anomaly_score']), 3),
-            "is_anomaly": bool(result['is_anomaly']),
-            "fraud_indicators": result['fraud_indicators'],
-            "details": {
-                "land_acres": float(result['land_acres']),
-                "district_density": int(result['district_density']),
-                "land_deviation": round(float(result['land_deviation']), 2)
-            }
-        }
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -414,37 +525,162 @@ async def check_eligibility(request: EligibilityCheckRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Eligibility check failed: {str(e)}"
         )
+
+
+@app.post("/api/check-eligibility/batch")
+async def check_eligibility_batch(request: EligibilityBatchRequest):
+    """
+    Fertilizer and seed eligibility for many (crop, land) pairs in one call.
+    Each item is checked for both subsidy types; a quantity left at 0 just
+    returns the allowed quantity.
+    """
+    try:
+        items = request.items
+        n = len(items)
+        if n == 0:
+            return {"count": 0, "results": []}
+        
+        crops = [item.crop_type for item in items]
+        land = [item.land_size_acres for item in items]
+        # fertilizer rows first, then seed rows, scored in one vectorized call
+        checks = fraud_detector.check_eligibility_batch(
+            crop_type=crops + crops,
+            land_size_acres=land + land,
+            requested_qty=[item.fertilizer_qty for item in items] + [item.seed_qty for item in items],
+            subsidy_type=['fertilizer'] * n + ['seed'] * n
+        )
+        records = checks.to_dict('records')
+        
+        results = []
+        for i, item in enumerate(items):
+            results.append({
+                "crop_type": item.crop_type,
+                "land_size_acres": item.land_size_acres,
+                "fertilizer": records[i],
+                "seed": records[n + i]
+            })
+        return {"count": n, "results": results}
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Batch eligibility check failed: {str(e)}"
+        )
+
 @app.post("/api/train-fraud-model")
-async def train_fraud_model(contamination: float = 0.1):
+async def train_fraud_model(contamination: float = 0.1, background: bool = False,
+                            max_samples: Optional[int] = None, n_jobs: int = -1,
+                            detector: str = SubsidyFraudDetector.DETECTOR,
+                            db: Session = Depends(get_db)):
     """
     Train/retrain the fraud detection model on current applications.
     Contamination is the expected proportion of outliers (default 10%).
+    detector picks the model: 'isolation_forest' (default) or
+    'half_space_trees' (StreamingFraudDetector). For the isolation forest,
+    max_samples caps the rows drawn per tree (default: sklearn's 'auto')
+    and n_jobs is the number of cores used (default: all); the streaming
+    detector takes neither.
+    
+    With background=true training runs in a separate process and this
+    returns a job id at once; poll /api/train-fraud-model/{job_id} for
+    progress. Either way the model is published as a new version and
+    served from then on. While a background job is running, both kinds of
+    request get 409, so its model cannot be overtaken by another one.
     """
     try:
-        if not applications_db:
+        if detector not in DETECTOR_CLASSES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"detector must be one of {sorted(DETECTOR_CLASSES)}"
+            )
+        if detector != SubsidyFraudDetector.DETECTOR and max_samples is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="max_samples applies to the isolation_forest detector only"
+            )
+        
+        if any(job.state == "running" for job in training_jobs.values()):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A training job is already running"
+            )
+        
+        records = fraud_feature_records(db)
+        if not records:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No applications available for training"
             )
         
-        # Convert applications to DataFrame
-        apps_list = list(applications_db.values())
-        apps_df = pd.DataFrame(apps_list)
+        apps_df = pd.DataFrame(records)
+        options = {"contamination": contamination}
+        if detector == SubsidyFraudDetector.DETECTOR:
+            options["max_samples"] = max_samples if max_samples is not None else 'auto'
+            options["n_jobs"] = n_jobs
         
-        # Train model
-        fraud_detector.train(apps_df, contamination=contamination)
+        if background:
+            job = TrainingJob(apps_df, fraud_model_store, crop_norms_path=CROP_NORMS_PATH,
+                              on_published=use_published_fraud_model, detector=detector,
+                              **options).start()
+            training_jobs[job.job_id] = job
+            return {
+                "success": True,
+                "message": f"Training on {len(apps_df)} applications started in the background",
+                "job_id": job.job_id,
+                "detector": detector,
+                "contamination_rate": contamination
+            }
+        
+        # Train model off to the side, then publish and swap it in
+        trained = DETECTOR_CLASSES[detector](crop_norms_path=CROP_NORMS_PATH)
+        trained.train(apps_df, **options)
+        version = fraud_model_store.publish(trained)
+        global fraud_detector
+        fraud_detector = trained
         
         return {
             "success": True,
             "message": f"Fraud detection model trained on {len(apps_df)} applications",
-            "contamination_rate": contamination
+            "detector": detector,
+            "contamination_rate": contamination,
+            "version": version
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Model training failed: {str(e)}"
         )
 
+@app.post("/api/fraud-model/rollback/{version}")
+async def rollback_fraud_model(version: int):
+    """Serve a previously published fraud model version again."""
+    try:
+        fraud_model_store.rollback(version)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    use_published_fraud_model(version)
+    return {
+        "success": True,
+        "message": f"Fraud detection model version {version} is now current",
+        "versions": fraud_model_store.versions()
+    }
+
+@app.get("/api/train-fraud-model/{job_id}")
+async def get_training_job(job_id: str):
+    """Progress of a background training job."""
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Training job not found"
+        )
+    return job.status()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -12,6 +12,8 @@ from typing import Dict, List, Tuple
 from datetime import datetime
 import json
 
+from compiled_fraud_ensemble import compile_fraud_ensemble
+
 class MLFraudDetector:
     """
     Advanced ML-based fraud detection using trained Isolation Forest and XGBoost models
@@ -28,6 +30,8 @@ class MLFraudDetector:
         self.xgb_model = None
         self.scaler = None
         self.metrics = None
+        # all three compiled into node arrays, scored in one traversal
+        self.compiled_ensemble = None
         
         # Load reference datasets
         self.farmers_df = None
@@ -62,6 +66,13 @@ class MLFraudDetector:
                 with open(metrics_path, 'r') as f:
                     self.metrics = json.load(f)
                 print("✓ Loaded Model Metrics")
+            
+            if self.isolation_forest is not None:
+                try:
+                    self.compiled_ensemble = compile_fraud_ensemble(self.isolation_forest, self.scaler, self.xgb_model)
+                    print("✓ Compiled models for single-pass scoring")
+                except Exception as e:
+                    print(f"Warning: Models not compiled, scoring with them directly - {str(e)}")
                 
         except Exception as e:
             print(f"Warning: Error loading models - {str(e)}")
@@ -199,27 +210,36 @@ class MLFraudDetector:
             numeric_cols = features_df.select_dtypes(include=[np.number]).columns.tolist()
             X = features_df[numeric_cols].fillna(0)
             
-            # Scale features
-            if self.scaler is not None:
-                try:
-                    X_scaled = self.scaler.transform(X)
-                except:
-                    # If scaler fails, use unscaled features
-                    X_scaled = X.values
+            compiled = self.compiled_ensemble
+            if compiled is not None and X.shape[1] == compiled.n_features:
+                # Scaling, Isolation Forest and XGBoost in one traversal
+                iso_score, xgb_proba = compiled.evaluate_one(X.to_numpy(dtype=float)[0])
+                result['isolation_score'] = iso_score
+                result['details']['isolation_anomaly'] = iso_score < 0
+                if xgb_proba is not None:
+                    result['xgb_probability'] = xgb_proba
             else:
-                X_scaled = X.values
+                # Scale features
+                if self.scaler is not None:
+                    try:
+                        X_scaled = self.scaler.transform(X)
+                    except:
+                        # If scaler fails, use unscaled features
+                        X_scaled = X.values
+                else:
+                    X_scaled = X.values
             
-            # Isolation Forest prediction
-            if self.isolation_forest is not None:
-                iso_score = self.isolation_forest.decision_function(X_scaled)[0]
-                iso_pred = self.isolation_forest.predict(X_scaled)[0]
-                result['isolation_score'] = float(iso_score)
-                result['details']['isolation_anomaly'] = bool(iso_pred == -1)
+                # Isolation Forest prediction
+                if self.isolation_forest is not None:
+                    iso_score = self.isolation_forest.decision_function(X_scaled)[0]
+                    iso_pred = self.isolation_forest.predict(X_scaled)[0]
+                    result['isolation_score'] = float(iso_score)
+                    result['details']['isolation_anomaly'] = bool(iso_pred == -1)
             
-            # XGBoost prediction
-            if self.xgb_model is not None:
-                xgb_proba = self.xgb_model.predict_proba(X_scaled)[0][1]
-                result['xgb_probability'] = float(xgb_proba)
+                # XGBoost prediction
+                if self.xgb_model is not None:
+                    xgb_proba = self.xgb_model.predict_proba(X_scaled)[0][1]
+                    result['xgb_probability'] = float(xgb_proba)
             
             # Determine risk level based on both models
             risk_score = 0
@@ -12,58 +12,171 @@ from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from compiled_fraud_ensemble import MAX_COMPILED_ROWS, compile_fraud_ensemble
 
 # Add Hackathon_Nitro to path
 HACKATHON_DIR = Path(__file__).parent.parent / "Hackathon_Nitro"
 sys.path.insert(0, str(HACKATHON_DIR))
 
+# Expected feature names from training (exact order matters)
+FEATURE_NAMES = [
+    'quantity_kg', 'subsidy_amount', 'geo_lat', 'geo_lon',
+    'claimed_land_area_ha', 'amount_paid_by_farmer', 'land_holding_ha',
+    'lat', 'lon', 'num_outlets', 'avg_monthly_txn', 'inventory_received_kg',
+    'suspicious_dealer', 'max_qty_per_ha', 'max_subsidy_amount',
+    'eligibility_land_min', 'eligibility_land_max', 'quantity_per_hectare',
+    'land_vs_claim_diff', 'farmer_total_transactions', 'farmer_total_quantity',
+    'dealer_total_farmers', 'dealer_total_transactions', 'dealer_total_quantity',
+    'invoice_duplicate_flag', 'allowed_quantity', 'quantity_vs_allowed',
+    'subsidy_vs_allowed', 'distance_farmer_to_dealer_km', 'txn_hour',
+    'txn_day', 'txn_month'
+]
+
+# Components warmed up in the background, by attribute name: (file, how to load it).
+# The prediction models are needed for ML scoring; the rest feed insights.
+MODEL_COMPONENTS = {
+    'isolation_forest': ("models/isolation_forest.pkl", joblib.load),
+    'scaler': ("models/feature_scaler.pkl", joblib.load),
+    'xgboost_model': ("models/xgboost_model.pkl", joblib.load),
+}
+DATA_COMPONENTS = {
+    'metrics': ("models/metrics_summary.json", lambda path: json.loads(Path(path).read_text())),
+    'farmers_df': ("farmers.csv", pd.read_csv),
+    'dealers_df': ("dealers.csv", pd.read_csv),
+    'scheme_rules_df': ("scheme_rules.csv", pd.read_csv),
+    'transactions_df': ("transactions.csv", pd.read_csv),
+}
+COMPONENTS = {**MODEL_COMPONENTS, **DATA_COMPONENTS}
+
 class MLIntegratedFraudDetector:
-    """Integrated ML fraud detection using Hackathon_Nitro models"""
+    """
+    Integrated ML fraud detection using Hackathon_Nitro models.
     
-    def __init__(self):
+    Models and reference data are components loaded on first use, or all at
+    once in the background by start_warm_up() (concurrently, one thread per
+    component). Until the models are in, predictions fall back to the
+    rules-only checks instead of waiting; readiness() reports each component.
+    """
+    
+    def __init__(self, warm_up: bool = True):
         self.models_dir = HACKATHON_DIR / "models"
         self.data_dir = HACKATHON_DIR
         self.models_loaded = False
-        self.load_models()
-        self.load_reference_data()
-        
-    def load_models(self):
-        """Load pre-trained ML models"""
-        try:
-            self.isolation_forest = joblib.load(self.models_dir / "isolation_forest.pkl")
-            self.scaler = joblib.load(self.models_dir / "feature_scaler.pkl")
-            
-            # Try to load XGBoost model
+        self.use_xgb = False
+        self.compiled_ensemble = None
+        # name -> {"state": pending|loading|ready|failed, "error", "seconds"}
+        self._status = {name: {"state": "pending", "error": None, "seconds": None} for name in COMPONENTS}
+        self._component_locks = {name: threading.Lock() for name in COMPONENTS}
+        self._warm_up_thread = None
+        self._warmed_up = threading.Event()
+        if warm_up:
+            self.start_warm_up()
+    
+    def __getattr__(self, name):
+        # Only reached for attributes not set yet: load a component on first use
+        if name in COMPONENTS and '_status' in self.__dict__:
+            self._load_component(name)
+            if name in self.__dict__:
+                return self.__dict__[name]
+            raise AttributeError(f"{name} could not be loaded: {self._status[name]['error']}")
+        raise AttributeError(name)
+    
+    def _load_component(self, name):
+        """Load one component unless it already is (or failed); safe to call from several threads."""
+        status = self._status[name]
+        with self._component_locks[name]:
+            if status["state"] in ("ready", "failed"):
+                return
+            status["state"] = "loading"
+            filename, loader = COMPONENTS[name]
+            started = time.perf_counter()
             try:
-                self.xgboost_model = joblib.load(self.models_dir / "xgboost_model.pkl")
-                self.use_xgb = True
-            except:
-                self.use_xgb = False
-                print("Warning: XGBoost model not found, using Isolation Forest only")
-            
-            # Load metrics summary
-            with open(self.models_dir / "metrics_summary.json", "r") as f:
-                self.metrics = json.load(f)
-            
+                setattr(self, name, loader(self.data_dir / filename))
+                status["state"] = "ready"
+            except Exception as e:
+                status["state"] = "failed"
+                status["error"] = str(e)
+            status["seconds"] = round(time.perf_counter() - started, 3)
+        if name in MODEL_COMPONENTS:
+            self._update_models_loaded()
+    
+    def _update_models_loaded(self):
+        """Switch to ML scoring once every model component has settled."""
+        states = {name: self._status[name]["state"] for name in MODEL_COMPONENTS}
+        if any(state in ("pending", "loading") for state in states.values()):
+            return
+        self.use_xgb = states['xgboost_model'] == "ready"
+        if states['isolation_forest'] == "ready" and states['scaler'] == "ready":
+            self.compile_models()
             self.models_loaded = True
-            print("✓ ML models loaded successfully")
-            
-        except Exception as e:
-            print(f"Error loading ML models: {str(e)}")
-            self.models_loaded = False
     
-    def load_reference_data(self):
-        """Load reference datasets"""
+    def compile_models(self):
+        """Flatten the loaded models into one CompiledFraudEnsemble; None keeps scoring with them directly"""
         try:
-            self.farmers_df = pd.read_csv(self.data_dir / "farmers.csv")
-            self.dealers_df = pd.read_csv(self.data_dir / "dealers.csv")
-            self.scheme_rules_df = pd.read_csv(self.data_dir / "scheme_rules.csv")
-            self.transactions_df = pd.read_csv(self.data_dir / "transactions.csv")
-            
-            print(f"✓ Loaded reference data: {len(self.farmers_df)} farmers, {len(self.dealers_df)} dealers, {len(self.transactions_df)} transactions")
-            
+            self.compiled_ensemble = compile_fraud_ensemble(
+                self.isolation_forest, self.scaler, self.xgboost_model if self.use_xgb else None
+            )
         except Exception as e:
-            print(f"Error loading reference data: {str(e)}")
+            print(f"Warning: could not compile ML models ({str(e)}), scoring with them directly")
+            self.compiled_ensemble = None
+    
+    def start_warm_up(self):
+        """Load every component concurrently in the background; returns at once."""
+        if self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(target=self._warm_up, name="ml-warm-up", daemon=True)
+            self._warm_up_thread.start()
+    
+    def _warm_up(self):
+        with ThreadPoolExecutor(max_workers=len(COMPONENTS), thread_name_prefix="ml-load") as pool:
+            list(pool.map(self._load_component, COMPONENTS))
+        self._report_loaded()
+        self._warmed_up.set()
+    
+    def _report_loaded(self):
+        if self.models_loaded:
+            print("✓ ML models loaded successfully")
+            if not self.use_xgb:
+                print("Warning: XGBoost model not found, using Isolation Forest only")
+        else:
+            print(f"Error loading ML models: {self._status['isolation_forest']['error'] or self._status['scaler']['error']}")
+        if all(self._status[name]["state"] == "ready" for name in DATA_COMPONENTS if name != 'metrics'):
+            print(f"✓ Loaded reference data: {len(self.farmers_df)} farmers, {len(self.dealers_df)} dealers, {len(self.transactions_df)} transactions")
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up has finished (started if needed); True if it did within timeout."""
+        self.start_warm_up()
+        return self._warmed_up.wait(timeout)
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Scoring mode and per-component load state."""
+        if self.models_loaded:
+            mode = "ml"
+        elif any(self._status[name]["state"] in ("pending", "loading") for name in MODEL_COMPONENTS):
+            mode = "rules_only"
+        else:
+            mode = "unavailable"
+        return {
+            "ready": self.models_loaded,
+            "warmed_up": self._warmed_up.is_set(),
+            "mode": mode,
+            "use_xgb": self.use_xgb,
+            "components": {name: dict(status) for name, status in self._status.items()}
+        }
+    
+    def load_models(self):
+        """Load pre-trained ML models now (blocking)"""
+        for name in MODEL_COMPONENTS:
+            self._load_component(name)
+        self._load_component('metrics')
+    
+    def load_reference_data(self):
+        """Load reference datasets now (blocking)"""
+        for name in DATA_COMPONENTS:
+            self._load_component(name)
     
     def engineer_features(self, application: Dict[str, Any]) -> Dict[str, Any]:
         """Engineer features from application data (32 features)"""
@@ -130,23 +243,9 @@ class MLIntegratedFraudDetector:
     def prepare_features_for_model(self, features: Dict[str, Any]) -> np.ndarray:
         """Prepare features in the correct order for model prediction (32 features)"""
         
-        # Expected feature names from training (exact order matters)
-        feature_names = [
-            'quantity_kg', 'subsidy_amount', 'geo_lat', 'geo_lon',
-            'claimed_land_area_ha', 'amount_paid_by_farmer', 'land_holding_ha',
-            'lat', 'lon', 'num_outlets', 'avg_monthly_txn', 'inventory_received_kg',
-            'suspicious_dealer', 'max_qty_per_ha', 'max_subsidy_amount',
-            'eligibility_land_min', 'eligibility_land_max', 'quantity_per_hectare',
-            'land_vs_claim_diff', 'farmer_total_transactions', 'farmer_total_quantity',
-            'dealer_total_farmers', 'dealer_total_transactions', 'dealer_total_quantity',
-            'invoice_duplicate_flag', 'allowed_quantity', 'quantity_vs_allowed',
-            'subsidy_vs_allowed', 'distance_farmer_to_dealer_km', 'txn_hour',
-            'txn_day', 'txn_month'
-        ]
-        
         # Create feature vector
         feature_vector = []
-        for name in feature_names:
+        for name in FEATURE_NAMES:
             feature_vector.append(features.get(name, 0))
         
         return np.array(feature_vector).reshape(1, -1)
@@ -155,6 +254,8 @@ class MLIntegratedFraudDetector:
         """Predict fraud probability for an application"""
         
         if not self.models_loaded:
+            if self.readiness()["mode"] == "rules_only":
+                return self.predict_rules_only(application)
             return {
                 "fraud_score": 0.0,
                 "is_fraud": False,
@@ -171,19 +272,20 @@ class MLIntegratedFraudDetector:
             # Prepare feature vector
             X = self.prepare_features_for_model(features)
             
-            # Scale features
-            X_scaled = self.scaler.transform(X)
-            
-            # Isolation Forest prediction (-1 for anomaly, 1 for normal)
-            iso_pred = self.isolation_forest.predict(X_scaled)[0]
-            iso_score = self.isolation_forest.decision_function(X_scaled)[0]
+            # Isolation Forest decision score and XGBoost probability: one
+            # traversal of the compiled ensembles, or the models themselves
+            if self.compiled_ensemble is not None:
+                iso_score, xgb_fraud_prob = self.compiled_ensemble.evaluate_one(X[0])
+            else:
+                X_scaled = self.scaler.transform(X)
+                iso_score = self.isolation_forest.decision_function(X_scaled)[0]
+                xgb_fraud_prob = self.xgboost_model.predict_proba(X_scaled)[0][1] if self.use_xgb else None
             
             # Convert to probability (higher score = more anomalous)
             iso_fraud_prob = 1 / (1 + np.exp(iso_score * 2))  # Sigmoid transformation
             
             # XGBoost prediction if available
             if self.use_xgb:
-                xgb_fraud_prob = self.xgboost_model.predict_proba(X_scaled)[0][1]
                 # Weighted average
                 fraud_score = 0.6 * xgb_fraud_prob + 0.4 * iso_fraud_prob
                 confidence = max(xgb_fraud_prob, iso_fraud_prob)
@@ -193,23 +295,9 @@ class MLIntegratedFraudDetector:
             
             # Risk level determination - Binary: SAFE or RISK
             # Consider fraud if score > 0.5 OR if there are validation warnings
-            has_warnings = False
-            warnings = []
-            
             # Check for validation warnings first
-            quantity_per_hectare = features['quantity_per_hectare']
-            if quantity_per_hectare > 200:
-                warnings.append("Unusually high quantity per hectare")
-                has_warnings = True
-            if features['quantity_vs_allowed'] > 1.0:
-                warnings.append("Requested quantity exceeds scheme limits")
-                has_warnings = True
-            if features['txn_hour'] > 22 or features['txn_hour'] < 6:
-                warnings.append("Transaction at unusual hours")
-                has_warnings = True
-            if features['distance_farmer_to_dealer_km'] > 50:
-                warnings.append("Large distance between farmer and dealer")
-                has_warnings = True
+            warnings = self.validation_warnings(features)
+            has_warnings = bool(warnings)
             
             # Binary risk determination
             if fraud_score > 0.5 or has_warnings:
@@ -248,6 +336,40 @@ class MLIntegratedFraudDetector:
                 "details": {}
             }
     
+    def validation_warnings(self, features: Dict[str, Any]) -> List[str]:
+        """Rule-based warnings for engineered features"""
+        warnings = []
+        if features['quantity_per_hectare'] > 200:
+            warnings.append("Unusually high quantity per hectare")
+        if features['quantity_vs_allowed'] > 1.0:
+            warnings.append("Requested quantity exceeds scheme limits")
+        if features['txn_hour'] > 22 or features['txn_hour'] < 6:
+            warnings.append("Transaction at unusual hours")
+        if features['distance_farmer_to_dealer_km'] > 50:
+            warnings.append("Large distance between farmer and dealer")
+        return warnings
+    
+    def predict_rules_only(self, application: Dict[str, Any]) -> Dict[str, Any]:
+        """Result from the validation rules alone, served while the ML models are still loading"""
+        features = self.engineer_features(application)
+        warnings = self.validation_warnings(features)
+        return {
+            "fraud_score": 0.0,
+            "is_fraud": bool(warnings),
+            "confidence": 0.0,
+            "risk_level": "RISK" if warnings else "SAFE",
+            "warnings": warnings,
+            "details": {
+                "mode": "rules_only",
+                "quantity_per_hectare": round(features['quantity_per_hectare'], 2),
+                "quantity_vs_allowed": round(features['quantity_vs_allowed'], 2),
+                "subsidy_amount": round(features['subsidy_amount'], 2),
+                "claimed_land_ha": round(features['claimed_land_area_ha'], 2),
+                "total_quantity_kg": round(features['quantity_kg'], 2),
+                "engineered_features": features
+            }
+        }
+    
     def get_farmer_insights(self, farmer_id: Optional[str] = None) -> Dict[str, Any]:
         """Get insights about farmers from historical data"""
         
@@ -312,26 +434,142 @@ class MLIntegratedFraudDetector:
             "all_seasons": seasons
         }
     
-    def analyze_batch(self, applications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Analyze multiple applications in batch"""
+    def engineer_features_batch(self, applications: List[Dict[str, Any]]) -> pd.DataFrame:
+        """engineer_features for many applications at once: an (n, 32) frame in FEATURE_NAMES order"""
+        n = len(applications)
+        apps = pd.DataFrame.from_records(
+            applications, columns=['fertilizer_qty', 'seed_qty', 'total_land_acres']
+        ).fillna(0)
+        
+        features = {}
+        features['quantity_kg'] = (apps['fertilizer_qty'] + apps['seed_qty']).to_numpy(dtype=float)
+        features['subsidy_amount'] = features['quantity_kg'] * 10
+        features['claimed_land_area_ha'] = apps['total_land_acres'].to_numpy(dtype=float) * 0.404686
+        features['amount_paid_by_farmer'] = features['subsidy_amount'] * 0.3
+        features['land_holding_ha'] = features['claimed_land_area_ha']
+        features['max_subsidy_amount'] = features['claimed_land_area_ha'] * 100 * 10
+        features['quantity_per_hectare'] = features['quantity_kg'] / np.maximum(features['claimed_land_area_ha'], 0.1)
+        features['farmer_total_quantity'] = features['quantity_kg']
+        features['allowed_quantity'] = features['claimed_land_area_ha'] * 100
+        features['quantity_vs_allowed'] = features['quantity_kg'] / np.maximum(features['allowed_quantity'], 1)
+        features['subsidy_vs_allowed'] = features['subsidy_amount'] / np.maximum(features['max_subsidy_amount'], 1)
+        
+        # Everything else is the same default for every application (see engineer_features)
+        now = datetime.now()
+        constants = {
+            'geo_lat': 18.5204, 'geo_lon': 73.8567, 'lat': 18.5204, 'lon': 73.8567,
+            'num_outlets': 1, 'avg_monthly_txn': 50, 'inventory_received_kg': 10000, 'suspicious_dealer': 0,
+            'max_qty_per_ha': 100, 'eligibility_land_min': 0.1, 'eligibility_land_max': 50.0,
+            'land_vs_claim_diff': 0, 'farmer_total_transactions': 1, 'dealer_total_farmers': 50,
+            'dealer_total_transactions': 100, 'dealer_total_quantity': 5000, 'invoice_duplicate_flag': 0,
+            'distance_farmer_to_dealer_km': 5.0, 'txn_hour': now.hour, 'txn_day': now.day,
+            'txn_month': now.month
+        }
+        for name, value in constants.items():
+            features[name] = np.full(n, value)
+        
+        return pd.DataFrame({name: features[name] for name in FEATURE_NAMES})
+    
+    def predict_fraud_batch(self, applications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        predict_fraud for many applications: features are built column-wise,
+        scaled once and scored with one decision_function and one
+        predict_proba call (one compiled traversal for small batches).
+        Returns one predict_fraud-style dict per application.
+        """
+        if not self.models_loaded:
+            return [self.predict_fraud(app) for app in applications]
+        if not applications:
+            return []
+        
+        features = self.engineer_features_batch(applications)
+        X = features.to_numpy(dtype=float)
+        
+        # Small batches go through the compiled ensembles; past MAX_COMPILED_ROWS
+        # the models' own compiled tree code is faster
+        if self.compiled_ensemble is not None and len(X) < MAX_COMPILED_ROWS:
+            iso_score, xgb_fraud_prob = self.compiled_ensemble.evaluate(X)
+        else:
+            X_scaled = self.scaler.transform(X)
+            iso_score = self.isolation_forest.decision_function(X_scaled)
+            xgb_fraud_prob = self.xgboost_model.predict_proba(X_scaled)[:, 1] if self.use_xgb else None
+        
+        # Isolation Forest decision scores, as a probability (higher = more anomalous)
+        iso_fraud_prob = 1 / (1 + np.exp(iso_score * 2))
         
+        if self.use_xgb:
+            fraud_score = 0.6 * xgb_fraud_prob + 0.4 * iso_fraud_prob
+            confidence = np.maximum(xgb_fraud_prob, iso_fraud_prob)
+        else:
+            xgb_fraud_prob = None
+            fraud_score = iso_fraud_prob
+            confidence = np.abs(iso_score)
+        
+        # Validation warnings as masks, in the order predict_fraud checks them
+        hour = features['txn_hour'].to_numpy()
+        warning_masks = [
+            ("Unusually high quantity per hectare", features['quantity_per_hectare'].to_numpy() > 200),
+            ("Requested quantity exceeds scheme limits", features['quantity_vs_allowed'].to_numpy() > 1.0),
+            ("Transaction at unusual hours", (hour > 22) | (hour < 6)),
+            ("Large distance between farmer and dealer", features['distance_farmer_to_dealer_km'].to_numpy() > 50),
+        ]
+        has_warnings = np.logical_or.reduce([mask for _, mask in warning_masks])
+        
+        # Binary risk determination
+        is_fraud = (fraud_score > 0.5) | has_warnings
+        
+        records = features.to_dict('records')
         results = []
-        for app in applications:
-            prediction = self.predict_fraud(app)
+        for i, engineered in enumerate(records):
             results.append({
+                "fraud_score": round(float(fraud_score[i]), 4),
+                "is_fraud": bool(is_fraud[i]),
+                "confidence": round(float(confidence[i]), 4),
+                "risk_level": "RISK" if is_fraud[i] else "SAFE",
+                "warnings": [text for text, mask in warning_masks if mask[i]],
+                "details": {
+                    "isolation_forest_score": round(float(iso_fraud_prob[i]), 4),
+                    "xgboost_score": round(float(xgb_fraud_prob[i]), 4) if xgb_fraud_prob is not None else None,
+                    "quantity_per_hectare": round(engineered['quantity_per_hectare'], 2),
+                    "quantity_vs_allowed": round(engineered['quantity_vs_allowed'], 2),
+                    "subsidy_amount": round(engineered['subsidy_amount'], 2),
+                    "claimed_land_ha": round(engineered['claimed_land_area_ha'], 2),
+                    "total_quantity_kg": round(engineered['quantity_kg'], 2),
+                    "engineered_features": engineered
+                }
+            })
+        return results
+    
+    def analyze_batch(self, applications: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze multiple applications in batch"""
+        
+        try:
+            predictions = self.predict_fraud_batch(applications)
+        except Exception as e:
+            # one bad application should not fail the rest; score them one by one
+            print(f"Batch prediction failed ({str(e)}), falling back to per-application scoring")
+            predictions = [self.predict_fraud(app) for app in applications]
+        
+        return [
+            {
                 "application_id": app.get("application_id", "N/A"),
                 "farmer_name": app.get("farmer_name", "N/A"),
                 **prediction
-            })
-        
-        return results
+            }
+            for app, prediction in zip(applications, predictions)
+        ]
 
 # Singleton instance
 _ml_detector = None
 
-def get_ml_integrated_detector():
-    """Get singleton ML detector instance"""
+def get_ml_integrated_detector(wait: bool = False):
+    """
+    Get singleton ML detector instance. The first call starts the background
+    warm-up and returns at once; pass wait=True to block until it is done.
+    """
     global _ml_detector
     if _ml_detector is None:
         _ml_detector = MLIntegratedFraudDetector()
+    if wait:
+        _ml_detector.wait_until_ready()
     return _ml_detector
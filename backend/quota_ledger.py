@@ -0,0 +1,288 @@
+"""
+Per-farmer, per-season quota ledger.
+
+Keeps cumulative requested and approved kg for every (aadhaar, season) in
+memory, so /submit_request/ can enforce a seasonal cap with a dict lookup
+instead of scanning the transaction log.
+
+The journal is the source of truth. The ledger tails it from a watermark
+(segment number, byte offset): sync() parses only rows appended since the
+last call, including rows written by other worker processes, and costs one
+stat when nothing was appended. The totals and watermark are snapshotted to
+an array_store file every few thousand rows and on shutdown, so a restart
+replays just the tail of the log.
+
+reservation() holds a per-farmer lock from the cap check until the caller's
+row is in the journal. It is a thread lock plus an fcntl byte-range lock on
+one of LOCK_STRIPES bytes of <journal>.ledger.lock, so it also excludes the
+other uvicorn workers sharing the journal and the cap holds across them.
+Without fcntl (Windows) the lock only covers one process: run one worker
+there.
+
+Seasons follow the Indian cropping calendar by transaction month:
+Kharif (Jun-Sep), Rabi (Oct-Mar, named after the year it starts) and Zaid
+(Apr-May).
+"""
+
+import csv
+import io
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from array_store import read_arrays, write_arrays
+from transaction_index import row_ends
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+LEDGER_VERSION = 1
+DEFAULT_SNAPSHOT_EVERY = 5000
+# farmers hash onto this many lock bytes; two farmers on one stripe just wait for each other
+LOCK_STRIPES = 1024
+
+
+def season_of(timestamp: str):
+    """Season label such as 'Kharif-2025' or 'Rabi-2025' for an ISO timestamp."""
+    try:
+        year, month = int(timestamp[0:4]), int(timestamp[5:7])
+    except (TypeError, ValueError):
+        ts = datetime.fromisoformat(str(timestamp))
+        year, month = ts.year, ts.month
+    if 6 <= month <= 9:
+        return f"Kharif-{year}"
+    if 4 <= month <= 5:
+        return f"Zaid-{year}"
+    return f"Rabi-{year if month >= 10 else year - 1}"
+
+
+class QuotaLedger:
+    """
+    Cumulative quota usage per farmer and season, kept in step with a
+    TransactionJournal.
+
+    Args:
+        journal: the TransactionJournal /submit_request/ appends to
+        snapshot_path: array_store file for snapshots (None disables them)
+        snapshot_every: write a snapshot after this many newly applied rows
+    """
+
+    def __init__(self, journal, snapshot_path=None, snapshot_every=DEFAULT_SNAPSHOT_EVERY):
+        self.journal = journal
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self._col = {name: i for i, name in enumerate(journal.columns)}
+        # aadhaar -> season -> [requested_kg, approved_kg, requests]
+        self._totals = {}
+        self._stripe_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # record locks belong to the process and go away with any of its fds
+        # on the file, so this one stays open for the ledger's lifetime
+        self._lock_fd = (os.open(journal.path + ".ledger.lock", os.O_RDWR | os.O_CREAT, 0o644)
+                         if fcntl is not None else None)
+        self._since_snapshot = 0
+        self._reset_watermark()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load_snapshot()
+        self.sync()
+
+    # ---------- quota checks ----------
+    def totals(self, aadhaar: str, season: str):
+        """(requested_kg, approved_kg, requests) recorded for aadhaar in season."""
+        entry = self._totals.get(str(aadhaar), {}).get(season)
+        return tuple(entry) if entry else (0.0, 0.0, 0)
+
+    def seasons(self, aadhaar: str):
+        """{season: {requested_kg, approved_kg, requests}} for one farmer."""
+        with self.lock:
+            return {
+                season: {"requested_kg": round(req, 4), "approved_kg": round(appr, 4), "requests": n}
+                for season, (req, appr, n) in sorted(self._totals.get(str(aadhaar), {}).items())
+            }
+
+    @contextmanager
+    def reservation(self, aadhaar: str, season: str, qty: float, cap: float):
+        """
+        Check qty against cap for the farmer's approved total in season and
+        hold the farmer's lock until the block exits; the caller appends the
+        transaction inside it, so no other thread or worker checks the same
+        farmer before the row is in the journal.
+        Yields (approved, approved_kg_before).
+        """
+        stripe = zlib.crc32(str(aadhaar).encode("utf-8")) % LOCK_STRIPES
+        with self._stripe_locks[stripe]:
+            if self._lock_fd is not None:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                self.sync()
+                used = self.totals(aadhaar, season)[1]
+                yield 0 <= qty and used + qty <= cap, used
+            finally:
+                if self._lock_fd is not None:
+                    fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripe)
+
+    # ---------- tailing the journal ----------
+    def _reset_watermark(self):
+        sealed = self.journal._sealed_segments()
+        self._segment_no = sealed[0][0] if sealed else 1
+        self._offset = 0
+        self._inode = None
+
+    def _rebuild(self):
+        print("Note: rebuilding quota ledger from the full transaction journal.")
+        self._totals = {}
+        self._reset_watermark()
+
+    def sync(self):
+        """Apply journal rows appended since the watermark; returns how many were applied."""
+        with self.lock:
+            applied = self._sync_active()
+            if applied is None:
+                applied = self._sync_segments()
+            self._since_snapshot += applied
+            if self.snapshot_path and self._since_snapshot >= self.snapshot_every:
+                self.save_snapshot()
+            return applied
+
+    def _sync_active(self):
+        """
+        Fast path while the watermark is in the active segment: a stat, and a
+        read of just the appended bytes. None when the segment rotated or was
+        replaced (its inode changed), which needs the full listing.
+        """
+        try:
+            st = os.stat(self.journal.path)
+        except FileNotFoundError:
+            return None
+        if self._inode is None or st.st_ino != self._inode:
+            return None
+        if st.st_size == self._offset:
+            return 0
+        return self._apply_segment(self._segment_no, self.journal.path, is_active=True)
+
+    def _sync_segments(self):
+        """Apply rows from every segment, starting at the watermark's."""
+        applied = 0
+        while True:
+            sealed = self.journal._sealed_segments()
+            active_no = sealed[-1][0] + 1 if sealed else 1
+            files = dict(sealed)
+            files[active_no] = self.journal.path
+            if self._segment_no > active_no:
+                self._rebuild()
+                continue
+            retry = False
+            for no in range(self._segment_no, active_no + 1):
+                if no not in files:
+                    continue  # removed sealed segment; its rows are already counted
+                outcome = self._apply_segment(no, files[no], is_active=no == active_no)
+                if outcome is None:
+                    retry = True
+                    break
+                applied += outcome
+                if no < active_no:
+                    self._segment_no, self._offset, self._inode = no + 1, 0, None
+            if not retry:
+                break
+        return applied
+
+    def _apply_segment(self, no, path, is_active):
+        """Rows applied from one segment, or None if it rotated under us (re-list and retry)."""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None if is_active else 0
+        with f:
+            st = os.fstat(f.fileno())
+            if no == self._segment_no and self._inode is not None and st.st_ino != self._inode:
+                # a rotation renames the active file into a sealed segment; if
+                # none appeared, the log was replaced or restored in place
+                sealed = self.journal._sealed_segments()
+                if not is_active or (sealed[-1][0] + 1 if sealed else 1) == no:
+                    self._rebuild()
+                return None
+            start = self._offset if no == self._segment_no else 0
+            if st.st_size < start:
+                self._rebuild()
+                return None
+            f.seek(start)
+            data = f.read(st.st_size - start)
+        # a partly written last row waits for the next sync
+        ends = row_ends(data)
+        complete = int(ends[-1]) if len(ends) else 0
+        applied = self._apply_rows(data[:complete], skip_header=start == 0)
+        self._segment_no, self._offset, self._inode = no, start + complete, st.st_ino
+        return applied
+
+    def _apply_rows(self, data, skip_header):
+        if skip_header and data.startswith(self.journal._header):
+            data = data[len(self.journal._header):]
+        if not data:
+            return 0
+        c = self._col
+        applied = 0
+        for values in csv.reader(io.StringIO(data.decode("utf-8"))):
+            if len(values) < len(c):
+                continue
+            try:
+                qty = float(values[c["requested_qty_kg"]])
+                season = season_of(values[c["timestamp"]])
+            except ValueError:
+                continue
+            entry = self._totals.setdefault(values[c["aadhaar"]], {}).setdefault(season, [0.0, 0.0, 0])
+            entry[0] += qty
+            if values[c["approved"]].strip().lower() == "true":
+                entry[1] += qty
+            entry[2] += 1
+            applied += 1
+        return applied
+
+    # ---------- snapshots ----------
+    def save_snapshot(self):
+        with self.lock:
+            aadhaar, seasons, values = [], [], []
+            for key, by_season in self._totals.items():
+                for season, entry in by_season.items():
+                    aadhaar.append(key)
+                    seasons.append(season)
+                    values.append(entry)
+            season_names, season_codes = np.unique(np.array(seasons, dtype=str), return_inverse=True)
+            values = np.array(values, dtype=np.float64).reshape(-1, 3)
+            arrays = {
+                "aadhaar": np.array(aadhaar, dtype=np.bytes_),
+                "season": season_codes.astype(np.int32),
+                "requested_kg": values[:, 0],
+                "approved_kg": values[:, 1],
+                "requests": values[:, 2].astype(np.int64),
+            }
+            meta = {
+                "version": LEDGER_VERSION,
+                "seasons": season_names.tolist(),
+                "watermark": [self._segment_no, self._offset, self._inode],
+            }
+            try:
+                write_arrays(self.snapshot_path, arrays, meta)
+                self._since_snapshot = 0
+            except OSError as e:
+                print(f"Warning: could not write quota ledger snapshot {self.snapshot_path} ({e})")
+
+    def _load_snapshot(self):
+        try:
+            arrays, meta = read_arrays(self.snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable quota ledger snapshot ({e})")
+            return
+        if meta.get("version") != LEDGER_VERSION:
+            return
+        seasons = meta["seasons"]
+        for key, code, req, appr, n in zip(
+                arrays["aadhaar"].tolist(), arrays["season"].tolist(), arrays["requested_kg"].tolist(),
+                arrays["approved_kg"].tolist(), arrays["requests"].tolist()):
+            self._totals.setdefault(key.decode("utf-8"), {})[seasons[code]] = [req, appr, n]
+        self._segment_no, self._offset, self._inode = meta["watermark"]
@@ -0,0 +1,128 @@
+"""
+Test that the compiled fraud ensemble matches the IsolationForest / classifiers it was built from
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, IsolationForest, RandomForestClassifier
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from compiled_fraud_ensemble import MAX_COMPILED_ROWS, compile_fraud_ensemble
+import fraud_detector
+from fraud_detector import NUMERICAL_FEATURES, SubsidyFraudDetector
+
+NORMS = str(Path(__file__).parent / "data" / "crop_norms.csv")
+
+
+def _data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(3.0, 5.0, size=(n, 12))
+    y = (X[:, 0] + X[:, 3] > 6).astype(int)
+    return X, y
+
+
+def _xgboost_classifier():
+    xgboost = pytest.importorskip("xgboost")
+    return xgboost.XGBClassifier(n_estimators=40, max_depth=4)
+
+
+@pytest.mark.parametrize("max_features", [1.0, 0.5])
+@pytest.mark.parametrize("classifier", [
+    None,
+    GradientBoostingClassifier(n_estimators=30, random_state=0),
+    "xgboost",
+])
+def test_matches_models(max_features, classifier):
+    X, y = _data(1000)
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    forest = IsolationForest(n_estimators=50, max_features=max_features, random_state=0).fit(X_scaled)
+    if classifier == "xgboost":
+        classifier = _xgboost_classifier()
+    if classifier is not None:
+        classifier.fit(X_scaled, y)
+    compiled = compile_fraud_ensemble(forest, scaler, classifier)
+
+    X_test, _ = _data(500, seed=1)
+    X_test[0, 2] = X[0, 2]  # a value that sits on a split threshold of some tree
+    decision, proba = compiled.evaluate(X_test)
+    np.testing.assert_allclose(decision, forest.decision_function(scaler.transform(X_test)), atol=1e-12)
+    if classifier is None:
+        assert proba is None
+    else:
+        # XGBoost sums its leaves in float32
+        np.testing.assert_allclose(proba, classifier.predict_proba(scaler.transform(X_test))[:, 1], atol=1e-6)
+
+    one = compiled.evaluate_one(X_test[0])
+    assert one[0] == pytest.approx(decision[0])
+    assert (one[1] is None) == (classifier is None)
+
+
+def test_without_scaler():
+    X, _ = _data(300)
+    forest = IsolationForest(n_estimators=20, random_state=0).fit(X)
+    decision, _ = compile_fraud_ensemble(forest).evaluate(X)
+    np.testing.assert_allclose(decision, forest.decision_function(X), atol=1e-12)
+
+
+def test_unsupported_models_raise():
+    X, y = _data(200)
+    forest = IsolationForest(n_estimators=5, random_state=0).fit(X)
+    with pytest.raises(NotImplementedError):
+        compile_fraud_ensemble(forest, classifier=RandomForestClassifier(n_estimators=5).fit(X, y))
+    with pytest.raises(NotImplementedError):
+        compile_fraud_ensemble(RandomForestClassifier(n_estimators=5).fit(X, y))
+    with pytest.raises(ValueError):
+        compile_fraud_ensemble(forest).evaluate(X[:, :5])
+
+
+def _trained_detector():
+    rng = np.random.default_rng(0)
+    n = 600
+    apps = pd.DataFrame({
+        'application_id': [f"APP{i}" for i in range(n)],
+        'total_land_acres': rng.uniform(0.5, 40, n).round(2),
+        'crop_type': rng.choice(['Rice', 'Wheat', 'Cotton'], n),
+        'district': rng.choice(['Pune', 'Nashik', 'Patna', 'Gaya'], n),
+        'state': rng.choice(['Maharashtra', 'Bihar'], n),
+    })
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    detector.train(apps, n_estimators=50)
+    return detector, detector.extract_features(apps)[NUMERICAL_FEATURES].fillna(0)
+
+
+def test_detector_small_frames_match_sklearn():
+    """SubsidyFraudDetector scores small frames compiled and large ones with sklearn; both agree."""
+    detector, X = _trained_detector()
+    assert len(X) >= MAX_COMPILED_ROWS
+
+    full_scores, full_flags = detector._anomaly_scores(X)
+    small_scores, small_flags = detector._anomaly_scores(X.iloc[:50])
+    np.testing.assert_allclose(small_scores, full_scores[:50], atol=1e-12)
+    np.testing.assert_array_equal(small_flags, full_flags[:50])
+
+
+def test_detector_falls_back_for_uncompilable_scaler(monkeypatch):
+    detector, X = _trained_detector()
+    detector.scaler = MinMaxScaler().fit(X)
+    detector.isolation_forest = IsolationForest(n_estimators=30, random_state=0).fit(detector.scaler.transform(X))
+    calls = []
+
+    def compile_counting(*args):
+        calls.append(args)
+        return compile_fraud_ensemble(*args)
+
+    monkeypatch.setattr(fraud_detector, "compile_fraud_ensemble", compile_counting)
+    for _ in range(2):
+        scores, flags = detector._anomaly_scores(X.iloc[:50])
+        X_scaled = detector.scaler.transform(X.iloc[:50])
+        np.testing.assert_allclose(scores, -detector.isolation_forest.score_samples(X_scaled), atol=1e-12)
+        np.testing.assert_array_equal(flags, detector.isolation_forest.predict(X_scaled) == -1)
+    # the failed compile is remembered, not retried per call
+    assert len(calls) == 1
@@ -0,0 +1,78 @@
+"""
+Test that the NumPy-compiled quota model matches the sklearn pipeline it was built from
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from compiled_quota_model import CompiledQuotaModel, compile_pipeline
+
+CAT = ["state", "crop_type", "irrigation_type"]
+NUM = ["land_size_acres", "base_qty"]
+
+
+def _frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    land = rng.uniform(0.5, 10, n).round(2)
+    return pd.DataFrame({
+        "state": rng.choice(["Bihar", "Punjab", "Kerala"], n),
+        "crop_type": rng.choice(["Rice", "Wheat", "Maize", "Cotton"], n),
+        "irrigation_type": rng.choice(["Canal", "Rainfed", "Borewell"], n),
+        "land_size_acres": land,
+        "base_qty": land * 40,
+    })
+
+
+def _fit(regressor):
+    X = _frame(400)
+    y = X["base_qty"] * np.where(X["irrigation_type"] == "Rainfed", 0.8, 1.0) + X["land_size_acres"] ** 2
+    pre = ColumnTransformer([
+        ("cat", OneHotEncoder(handle_unknown="ignore"), CAT),
+        ("num", StandardScaler(), NUM),
+    ])
+    return Pipeline([("pre", pre), ("model", regressor)]).fit(X, y)
+
+
+@pytest.mark.parametrize("regressor", [
+    RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+    GradientBoostingRegressor(n_estimators=30, random_state=0),
+    DecisionTreeRegressor(max_depth=6, random_state=0),
+    Ridge(alpha=1.0),
+])
+def test_matches_sklearn(regressor):
+    pipe = _fit(regressor)
+    compiled = compile_pipeline(pipe)
+    X = _frame(500, seed=1)
+    np.testing.assert_allclose(compiled.predict(X), pipe.predict(X), rtol=1e-9, atol=1e-9)
+
+    row = X.iloc[0].to_dict()
+    assert compiled.predict_one(row) == pytest.approx(float(pipe.predict(X.iloc[[0]])[0]))
+
+
+def test_unknown_category_is_ignored_like_sklearn():
+    pipe = _fit(RandomForestRegressor(n_estimators=10, random_state=0))
+    compiled = compile_pipeline(pipe)
+    X = _frame(5, seed=2)
+    X.loc[0, "state"] = "Goa"
+    np.testing.assert_allclose(compiled.predict(X), pipe.predict(X))
+
+
+def test_save_load_round_trip(tmp_path):
+    pipe = _fit(GradientBoostingRegressor(n_estimators=10, random_state=0))
+    path = str(tmp_path / "model.npz")
+    compile_pipeline(pipe).save(path)
+
+    X = _frame(50, seed=3)
+    np.testing.assert_allclose(CompiledQuotaModel.load(path).predict(X), pipe.predict(X))
@@ -0,0 +1,49 @@
+"""
+Test Aadhaar lookups in the columnar farmer registry
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from farmer_registry import REG_COLUMNS, FarmerRegistry
+
+
+def _registry():
+    return FarmerRegistry.from_frame(pd.DataFrame(
+        [[123456789012, "F1", "Bihar", "Patna", 2.5, "Rice", "Canal", "Alluvial"],
+         [3, "F2", "Bihar", "Gaya", 1.0, "Wheat", "Rainfed", "Loam"]],
+        columns=REG_COLUMNS,
+    ))
+
+
+def test_find_accepts_ascii_digits_only():
+    registry = _registry()
+    assert registry.find("123456789012") == 0
+    assert registry.find(" 3 ") == 1
+    # Unicode digits pass str.isdigit: '²' makes int() raise, '٣' would match Aadhaar 3
+    for key in ["²", "3²", "٣", "１２３", "", "12a", "1" * 19]:
+        assert registry.find(key) == -1
+    assert registry.get("٣") is None
+
+
+def test_find_many_matches_find():
+    registry = _registry()
+    keys = ["123456789012", "²", "٣", "3", "999", None, "1" * 19]
+    np.testing.assert_array_equal(registry.find_many(keys), [registry.find(k) for k in keys])
+    np.testing.assert_array_equal(registry.find_many(keys), [0, -1, -1, 1, -1, -1, -1])
+
+
+def test_non_ascii_farmer_id_round_trips():
+    frame = pd.DataFrame(
+        [[123456789012, "किसान-1", "Bihar", "Patna", 2.5, "Rice", "Canal", "Alluvial"],
+         [3, "F2", "Bihar", "Gaya", 1.0, "Wheat", "Rainfed", "Loam"]],
+        columns=REG_COLUMNS,
+    )
+    registry = FarmerRegistry.from_frame(frame)
+    assert registry.get("123456789012").farmer_id == "किसान-1"
+    assert list(registry.to_frame()["farmer_id"]) == ["किसान-1", "F2"]
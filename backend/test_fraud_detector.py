@@ -0,0 +1,236 @@
+"""
+Test that the vectorized SubsidyFraudDetector matches its original row-by-row behaviour
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmark_fraud_detector import (legacy_extract_features, legacy_generate_fraud_reasons, legacy_get_crop_norm,
+                                      synthetic_applications)
+from fraud_detector import StreamingFraudDetector, SubsidyFraudDetector
+
+NORMS = str(Path(__file__).parent / "data" / "crop_norms.csv")
+
+
+def test_extract_features_matches_iterrows():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(2000, seed=3)
+    # missing district/state and a non-default index
+    apps.loc[5, "district"] = np.nan
+    apps.loc[7, "state"] = np.nan
+    apps.loc[9, "total_land_acres"] = np.nan
+    apps.index = apps.index * 3 + 11
+
+    expected = legacy_extract_features(detector, apps)
+    actual = detector.extract_features(apps)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-12)
+
+
+def test_extract_features_small_frame():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = pd.DataFrame({
+        "application_id": ["A", "B", "C"],
+        "total_land_acres": [5, 2, 150],
+        "crop_type": ["Paddy", "Wheat", "Cotton"],
+        "district": ["D1", "D1", "D2"],
+        "state": ["S1", "S1", "S1"],
+    })
+    pd.testing.assert_frame_equal(detector.extract_features(apps), legacy_extract_features(detector, apps))
+    assert detector.extract_features(apps.iloc[0:0]).empty
+
+
+def test_compiled_crop_norms_match_dataframe_lookup():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    names = ["Paddy", " wheat ", "Red Gram", "gram", "Toor", "Dragonfruit", "", "cotton seed"]
+    for name in names:
+        assert detector.get_crop_norm(name) == legacy_get_crop_norm(detector.crop_norms, name)
+
+    resolved = detector.resolve_norms(pd.Series(names + [np.nan], index=range(10, 19)))
+    assert list(resolved.index) == list(range(10, 19))
+    for name, (_, row) in zip(names, resolved.iterrows()):
+        assert row["seed_per_acre"] == legacy_get_crop_norm(detector.crop_norms, name)["seed_per_acre"]
+    assert resolved["fertilizer_per_acre"].iloc[-1] == detector.crop_norms["fertilizer_kg_per_acre"].mean()
+
+
+def test_check_eligibility_batch_matches_scalar():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    rng = np.random.default_rng(0)
+    apps = synthetic_applications(500, seed=4)
+    kinds = rng.choice(["fertilizer", "seed"], len(apps))
+    allowed = [detector.calculate_allowed_quantity(c, l, k)["allowed_qty"]
+               for c, l, k in zip(apps["crop_type"], apps["total_land_acres"], kinds)]
+    requested = np.round(np.array(allowed) * rng.uniform(0, 2, len(apps)), 1)
+    requested[:10] = 0
+
+    batch = detector.check_eligibility_batch(apps["crop_type"], apps["total_land_acres"], requested, kinds)
+    assert list(batch.index) == list(apps.index)
+    for (_, row), crop, land, qty, kind in zip(batch.iterrows(), apps["crop_type"],
+                                              apps["total_land_acres"], requested, kinds):
+        assert row.to_dict() == detector.check_eligibility(crop, land, qty, kind)
+
+
+def test_score_new_matches_full_recompute():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(3000, seed=5)
+    apps.loc[3, "total_land_acres"] = np.nan
+    old, new = apps.iloc[:2500], apps.iloc[2500:]
+    detector.train(old)
+
+    # aggregates over old + new agree with a from-scratch groupby
+    chunks = [new.iloc[:1], new.iloc[1:200], new.iloc[200:]]
+    scored = pd.concat([detector.score_new(chunk) for chunk in chunks])
+    groups = apps.groupby("district")["total_land_acres"]
+    for district, entry in detector.district_stats.items():
+        assert entry[0] == groups.size()[district]
+        assert np.isclose(entry[2], groups.mean()[district])
+        assert np.isclose(detector.district_land_std(district), groups.std(ddof=0)[district])
+    assert detector.state_stats["Bihar"][0] == (apps["state"] == "Bihar").sum()
+
+    # the last chunk sees every application, so it scores like predict_anomalies
+    expected = detector.predict_anomalies(apps).set_index("application_id").loc[new.iloc[200:]["application_id"]]
+    last = scored.set_index("application_id").loc[expected.index]
+    np.testing.assert_allclose(last["anomaly_score"], expected["anomaly_score"])
+    assert len(scored) == len(new)
+
+
+def test_fraud_reason_codes_match_per_row_reasons():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(3000, seed=6)
+    apps.loc[4, "total_land_acres"] = np.nan
+    apps.loc[:40, "total_land_acres"] = 0.2
+    detector.train(apps)
+    results = detector.predict_anomalies(apps)
+    assert "fraud_indicators" not in results
+
+    described = detector.describe_fraud_reasons(results)
+    assert list(described.index) == list(results.index)
+    assert described.tolist() == results.apply(legacy_generate_fraud_reasons, axis=1).tolist()
+
+    stats = detector.get_fraud_statistics(apps)
+    top = results.nlargest(10, "anomaly_score")
+    assert [r["fraud_indicators"] for r in stats["top_risk_applications"]] == \
+        top.apply(legacy_generate_fraud_reasons, axis=1).tolist()
+
+
+def test_model_directory_round_trip(tmp_path):
+    import joblib
+
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(1500, seed=11)
+    detector.train(apps.iloc[:1000])
+    detector.score_new(apps.iloc[1000:1200])
+    path = str(tmp_path / "model")
+    detector.save_model(path)
+    detector.save_model(path)  # replaces the existing directory
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model"]
+
+    loaded = SubsidyFraudDetector(crop_norms_path=NORMS)
+    loaded.load_model(path)
+    assert loaded.district_stats == detector.district_stats and loaded.state_stats == detector.state_stats
+    assert loaded.get_crop_norm("Red Gram") == detector.get_crop_norm("Red Gram")
+    rest = apps.iloc[1200:]
+    pd.testing.assert_frame_equal(loaded.score_new(rest), detector.score_new(rest))
+
+    # single-file pickles from before the directory layout still load
+    legacy = str(tmp_path / "legacy.pkl")
+    joblib.dump({"isolation_forest": detector.isolation_forest, "scaler": detector.scaler,
+                 "crop_norms": detector.crop_norms}, legacy)
+    old = SubsidyFraudDetector(crop_norms_path=NORMS)
+    old.load_model(legacy)
+    assert old.trained and old.district_stats == {}
+    pd.testing.assert_frame_equal(old.predict_anomalies(apps), loaded.predict_anomalies(apps))
+
+
+def test_streaming_statistics_match_in_memory():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(5000, seed=12)
+    detector.train(apps)
+    expected = detector.get_fraud_statistics(apps, top_k=25)
+
+    for chunksize in (1, 700, 5000, 100000):
+        if chunksize == 1:
+            small = apps.iloc[:300]
+            actual = detector.get_fraud_statistics(small, chunksize=1)
+            reference = detector.get_fraud_statistics(small)
+        else:
+            actual = detector.get_fraud_statistics(apps, chunksize=chunksize, top_k=25)
+            reference = expected
+        top = actual.pop("top_risk_applications")
+        reference = dict(reference)
+        reference_top = reference.pop("top_risk_applications")
+        assert actual == pytest.approx(reference)
+        # equal scores may come out in either order
+        by_id = {r["application_id"]: r for r in reference_top}
+        assert set(by_id) == {r["application_id"] for r in top}
+        for r in top:
+            assert r["fraud_indicators"] == by_id[r["application_id"]]["fraud_indicators"]
+            assert r["anomaly_score"] == pytest.approx(by_id[r["application_id"]]["anomaly_score"])
+        assert [r["anomaly_score"] for r in top] == sorted((r["anomaly_score"] for r in top), reverse=True)
+
+    empty = detector.get_fraud_statistics_streaming(lambda: iter([apps.iloc[0:0]]))
+    assert empty["total_applications"] == 0 and empty["top_risk_applications"] == []
+
+
+def test_streaming_detector_follows_the_contract():
+    apps = synthetic_applications(6000, seed=16)
+    batch = SubsidyFraudDetector(crop_norms_path=NORMS)
+    batch.train(apps.iloc[:2000])
+    detector = StreamingFraudDetector(crop_norms_path=NORMS, window_size=200)
+    detector.train(apps.iloc[:2000])
+    assert detector.hst.windows == 10
+
+    expected = batch.predict_anomalies(apps.iloc[:2000])
+    results = detector.predict_anomalies(apps.iloc[:2000])
+    assert list(results.columns) == list(expected.columns)
+    assert results.dtypes.equals(expected.dtypes)
+    assert results["anomaly_score"].between(0, 1).all()
+
+    # O(1) state: the count arrays do not grow as applications stream in
+    shapes = (detector.hst.reference.shape, detector.hst.latest.shape)
+    scored = pd.concat([detector.score_new(apps.iloc[i:i + 50]) for i in range(2000, 6000, 50)])
+    assert (detector.hst.reference.shape, detector.hst.latest.shape) == shapes
+    assert detector.hst.windows == 30
+    ghost = scored["land_acres"] > 100
+    assert scored.loc[ghost, "is_anomaly"].all()
+    assert scored.loc[~ghost, "is_anomaly"].mean() < 0.2
+    assert scored.loc[ghost, "anomaly_score"].min() > scored.loc[~ghost, "anomaly_score"].median()
+
+
+def test_streaming_detector_round_trip(tmp_path):
+    apps = synthetic_applications(1000, seed=17)
+    detector = StreamingFraudDetector(crop_norms_path=NORMS)
+    detector.train(apps.iloc[:600])
+    path = str(tmp_path / "streaming")
+    detector.save_model(path)
+
+    loaded = StreamingFraudDetector(crop_norms_path=NORMS)
+    loaded.load_model(path)
+    pd.testing.assert_frame_equal(loaded.score_new(apps.iloc[600:]), detector.score_new(apps.iloc[600:]))
+    np.testing.assert_array_equal(loaded.hst.latest, detector.hst.latest)
+    with pytest.raises(ValueError):
+        SubsidyFraudDetector(crop_norms_path=NORMS).load_model(path)
+
+
+def test_streaming_scores_are_calibrated_like_isolation_forest():
+    apps = synthetic_applications(6000, seed=16)
+    batch = SubsidyFraudDetector(crop_norms_path=NORMS)
+    batch.train(apps.iloc[:3000])
+    detector = StreamingFraudDetector(crop_norms_path=NORMS)
+    detector.train(apps.iloc[:3000], contamination=0.1)
+
+    # the training applications land in the Isolation Forest's risk bands in similar proportions
+    expected = batch.predict_anomalies(apps.iloc[:3000])["risk_level"].value_counts(normalize=True)
+    actual = detector.predict_anomalies(apps.iloc[:3000])["risk_level"].value_counts(normalize=True)
+    for level in ("LOW", "MEDIUM", "HIGH"):
+        assert abs(actual.get(level, 0) - expected.get(level, 0)) <= 0.15
+
+    # in-distribution arrivals are flagged at about the contamination rate, from the first batch on
+    scored = [detector.score_new(apps.iloc[i:i + 100]) for i in range(3000, 6000, 100)]
+    assert scored[0]["is_anomaly"].mean() <= 0.2
+    assert 0.03 <= pd.concat(scored)["is_anomaly"].mean() <= 0.15
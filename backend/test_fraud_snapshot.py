@@ -0,0 +1,133 @@
+"""
+Test that the materialized fraud-analysis snapshot tracks a full recompute
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmark_fraud_detector import synthetic_applications
+from fraud_detector import SubsidyFraudDetector
+from fraud_snapshot import FraudAnalysisSnapshot
+
+NORMS = str(Path(__file__).parent / "data" / "crop_norms.csv")
+
+
+def _scores(detector, apps):
+    return detector.predict_anomalies(apps).set_index("application_id")["anomaly_score"]
+
+
+def _assert_matches_full_recompute(snapshot, detector, apps):
+    expected = _scores(detector, apps)
+    actual = snapshot.results()["anomaly_score"]
+    assert set(actual.index) == set(expected.index)
+    np.testing.assert_allclose(actual.loc[expected.index], expected, rtol=1e-12)
+
+    stats = snapshot.statistics()
+    reference = detector.get_fraud_statistics(apps)
+    for key in ("total_applications", "flagged_anomalies", "high_risk_count", "medium_risk_count",
+                "low_risk_count"):
+        assert stats[key] == reference[key]
+    assert stats["anomaly_percentage"] == pytest.approx(reference["anomaly_percentage"])
+    assert sorted(r["anomaly_score"] for r in stats["top_risk_applications"]) == \
+        pytest.approx(sorted(r["anomaly_score"] for r in reference["top_risk_applications"]))
+
+
+def test_snapshot_follows_adds_and_removes():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(3000, seed=13)
+    detector.train(apps)
+    snapshot = FraudAnalysisSnapshot()
+    snapshot.rebuild(detector, apps.iloc[:2500].to_dict("records"))
+    _assert_matches_full_recompute(snapshot, detector, apps.iloc[:2500])
+
+    for record in apps.iloc[2500:2520].to_dict("records"):
+        snapshot.upsert(record)
+    snapshot.remove("APP0000007")
+    snapshot.remove("no-such-application")
+    moved = dict(apps.iloc[11], district="Kerala-D3", state="Kerala", total_land_acres=250.0)
+    snapshot.upsert(moved)
+
+    current = pd.concat([apps.iloc[:2520], pd.DataFrame([moved])])
+    current = current.drop_duplicates("application_id", keep="last")
+    current = current[current["application_id"] != "APP0000007"]
+    assert len(snapshot) == len(current)
+    _assert_matches_full_recompute(snapshot, detector, current)
+
+
+def test_statistics_cached_per_version():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(500, seed=14)
+    detector.train(apps)
+    snapshot = FraudAnalysisSnapshot(top_k=5)
+    snapshot.rebuild(detector, [])
+    assert snapshot.statistics()["total_applications"] == 0
+    assert snapshot.statistics()["top_risk_applications"] == []
+
+    snapshot.rebuild(detector, apps.to_dict("records"))
+    etag, stats = snapshot.etag, snapshot.statistics()
+    assert snapshot.statistics() is stats and snapshot.etag == etag
+    assert len(stats["top_risk_applications"]) == 5
+
+    snapshot.upsert(apps.iloc[0].to_dict())
+    assert snapshot.etag != etag and snapshot.statistics() is not stats
+
+
+def test_rescored_rows_reported_and_looked_up():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(800, seed=15)
+    detector.train(apps)
+    batches = []
+    snapshot = FraudAnalysisSnapshot(on_rescore=batches.append)
+    snapshot.rebuild(detector, apps.iloc[:700].to_dict("records"))
+    assert len(batches) == 1 and len(batches[0]) == 700
+
+    # the district is rescored on write, the rest of the state before the next read
+    record = apps.iloc[750].to_dict()
+    snapshot.upsert(record)
+    existing = apps.iloc[:700]
+    district = existing[existing["district"] == record["district"]]
+    assert set(batches[-1].index) == set(district["application_id"]) | {record["application_id"]}
+    state = existing[existing["state"] == record["state"]]
+    snapshot.upsert(apps.iloc[751].to_dict())
+    reported = len(batches)
+
+    result = snapshot.result(record["application_id"])
+    expected = detector.predict_anomalies(pd.concat([apps.iloc[:700], apps.iloc[750:752]]))
+    row = expected[expected["application_id"] == record["application_id"]]
+    assert result["anomaly_score"] == round(float(row["anomaly_score"].iloc[0]), 3)
+    assert result["fraud_indicators"] == detector.describe_fraud_reasons(row).iloc[0]
+    assert snapshot.result("no-such-application") is None
+    assert len(batches) == reported + 1
+    assert set(state["application_id"]) <= set(batches[-1].index)
+
+
+def test_on_rescore_runs_outside_the_lock():
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    apps = synthetic_applications(300, seed=16)
+    detector.train(apps)
+    held = []
+
+    def try_lock():
+        acquired = snapshot._lock.acquire(blocking=False)
+        held.append(not acquired)
+        if acquired:
+            snapshot._lock.release()
+
+    def on_rescore(batch):
+        # another thread must be able to take the snapshot lock meanwhile
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    snapshot = FraudAnalysisSnapshot(on_rescore=on_rescore)
+    snapshot.rebuild(detector, apps.iloc[:250].to_dict("records"))
+    snapshot.upsert(apps.iloc[260].to_dict())
+    snapshot.statistics()
+    assert held and not any(held)
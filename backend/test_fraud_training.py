@@ -0,0 +1,127 @@
+"""
+Test background fraud-model training and versioned publishing
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmark_fraud_detector import synthetic_applications
+from fraud_detector import StreamingFraudDetector, SubsidyFraudDetector
+from fraud_training import FraudModelStore, TrainingJob
+
+NORMS = str(Path(__file__).parent / "data" / "crop_norms.csv")
+
+
+def test_progress_training_matches_single_fit():
+    apps = synthetic_applications(2000, seed=7)
+    plain = SubsidyFraudDetector(crop_norms_path=NORMS)
+    plain.train(apps, n_estimators=35)
+    stages = []
+    stepped = SubsidyFraudDetector(crop_norms_path=NORMS)
+    stepped.train(apps, n_estimators=35, n_jobs=2, progress=lambda stage, fraction: stages.append((stage, fraction)))
+
+    assert stages[0] == ("features", 0.0) and stages[-1] == ("trees", 1.0)
+    assert len(stepped.isolation_forest.estimators_) == 35
+    np.testing.assert_array_equal(plain.predict_anomalies(apps)["anomaly_score"],
+                                  stepped.predict_anomalies(apps)["anomaly_score"])
+
+
+def test_store_versions_and_current(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    assert store.current_version() is None and store.load(crop_norms_path=NORMS) is None
+    apps = synthetic_applications(500, seed=8)
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    detector.train(apps)
+
+    assert store.publish(detector) == 1
+    assert store.publish(detector) == 2
+    assert store.versions() == [1, 2] and store.current_version() == 2
+    loaded = store.load(crop_norms_path=NORMS)
+    np.testing.assert_array_equal(loaded.predict_anomalies(apps)["anomaly_score"],
+                                  detector.predict_anomalies(apps)["anomaly_score"])
+    assert sorted(p.name for p in (tmp_path / "models").iterdir()) == \
+        ["CURRENT", "fraud_model_v0001", "fraud_model_v0002"]
+
+    store.rollback(1)
+    assert store.current_version() == 1 and store.versions() == [1, 2]
+
+
+def test_background_job_publishes_and_reports(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    apps = synthetic_applications(3000, seed=9)
+    published = []
+    job = TrainingJob(apps, store, crop_norms_path=NORMS, on_published=published.append,
+                      contamination=0.05, max_samples=512, n_jobs=2).start()
+    assert job.wait(120)
+
+    status = job.status()
+    assert status["state"] == "published", status["error"]
+    assert status["version"] == 1 and published == [1] and status["progress"] == 1.0
+    assert store.current_version() == 1
+    served = store.load(crop_norms_path=NORMS)
+    assert served.isolation_forest.max_samples == 512
+
+
+def test_background_job_reports_failure(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    apps = synthetic_applications(100, seed=10).drop(columns=["district"])
+    job = TrainingJob(apps, store, crop_norms_path=NORMS).start()
+    assert job.wait(120)
+    assert job.status()["state"] == "failed" and "district" in job.status()["error"]
+    assert store.current_version() is None
+
+
+def test_background_job_trains_streaming_detector(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    apps = synthetic_applications(800, seed=11)
+    with pytest.raises(ValueError, match="n_jobs"):
+        TrainingJob(apps, store, crop_norms_path=NORMS, detector="half_space_trees", n_jobs=2)
+    with pytest.raises(ValueError, match="Unknown detector"):
+        TrainingJob(apps, store, crop_norms_path=NORMS, detector="lof")
+
+    job = TrainingJob(apps, store, crop_norms_path=NORMS, detector="half_space_trees", contamination=0.05).start()
+    assert job.wait(120)
+    status = job.status()
+    assert status["state"] == "published", status["error"]
+    assert status["detector"] == "half_space_trees" and status["progress"] == 1.0
+    assert isinstance(store.load(crop_norms_path=NORMS), StreamingFraudDetector)
+
+
+def test_store_loads_streaming_models(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    apps = synthetic_applications(800, seed=9)
+    detector = StreamingFraudDetector(crop_norms_path=NORMS)
+    detector.train(apps.iloc[:600])
+    version = store.publish(detector)
+
+    loaded = store.load(crop_norms_path=NORMS)
+    assert isinstance(loaded, StreamingFraudDetector) and loaded.model_version == version
+    pd.testing.assert_frame_equal(loaded.score_new(apps.iloc[600:]), detector.score_new(apps.iloc[600:]))
+
+
+def test_concurrent_publishers_claim_distinct_versions(tmp_path):
+    store = FraudModelStore(str(tmp_path / "models"))
+    detector = SubsidyFraudDetector(crop_norms_path=NORMS)
+    detector.train(synthetic_applications(300, seed=11), n_estimators=10)
+    # a version claimed by another publisher that has not finished writing
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "fraud_model_v0001").mkdir()
+    assert store.versions() == []
+
+    published = []
+    threads = [threading.Thread(target=lambda: published.append(store.publish(detector))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(published) == [2, 3, 4, 5] and store.versions() == [2, 3, 4, 5]
+    assert store.current_version() in published
+    for version in published:
+        assert store.load(version, crop_norms_path=NORMS).model_version == version
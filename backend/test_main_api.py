@@ -0,0 +1,312 @@
+"""
+Test the quota API endpoints of main against a small registry and a fresh journal
+"""
+
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+pytest.importorskip("fastapi")
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fastapi.testclient import TestClient
+
+import main
+from quota_ledger import QuotaLedger
+from transaction_index import TransactionIndex
+from transaction_journal import TransactionJournal, TX_COLUMNS
+
+REGISTRY_CSV = Path(__file__).parent / "farmer_registry_10000.csv"
+
+
+def _write_model(path, factor, handle_unknown="ignore"):
+    """Pickle a quota pipeline fitted to factor x base_qty on made-up farmers."""
+    rng = np.random.default_rng(0)
+    farmers = pd.DataFrame({
+        "state": rng.choice(["Haryana", "Goa", "Bihar"], 300),
+        "usual_crop": rng.choice(["Wheat", "Paddy", "Maize", "Cashew"], 300),
+        "irrigation_type": rng.choice(["Rainfed", "Canal", "Borewell"], 300),
+        "soil_type": "Loam",
+        "land_size_acres": rng.uniform(0.5, 10, 300).round(2),
+    })
+    X = main.build_feature_frame(farmers)
+    pre = ColumnTransformer([("cat", OneHotEncoder(handle_unknown=handle_unknown),
+                             ["state", "crop_type", "season", "irrigation_type", "soil_type"])],
+                            remainder="passthrough")
+    model = GradientBoostingRegressor(n_estimators=30, random_state=0)
+    joblib.dump(Pipeline([("pre", pre), ("model", model)]).fit(X, X["base_qty"] * factor), path)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """First 50 registry rows, served by main from tmp_path with the rule-based model."""
+    farmers = pd.read_csv(REGISTRY_CSV, dtype=str, nrows=50)
+    path = tmp_path / "farmer_registry.csv"
+    farmers.to_csv(path, index=False)
+    monkeypatch.setattr(main, "REG_PATH", str(path))
+    monkeypatch.setattr(main, "MODEL_PATH", str(tmp_path / "max_qty_model.pkl"))
+    monkeypatch.setattr(main, "COMPILED_MODEL_PATH", str(tmp_path / "max_qty_model.npz"))
+    monkeypatch.setattr(main, "QUOTA_CACHE_PATH", str(tmp_path / "farmer_registry.csv.quota.bin"))
+    monkeypatch.setattr(main, "_snapshot", main.build_snapshot(main.source_fingerprint()))
+    return farmers
+
+
+@pytest.fixture
+def client(registry, tmp_path, monkeypatch):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS, fsync=False)
+    monkeypatch.setattr(main, "journal", journal)
+    monkeypatch.setattr(main, "transaction_index", TransactionIndex(journal))
+    monkeypatch.setattr(main, "quota_ledger", QuotaLedger(journal))
+    # no `with`: the reload watcher is not started
+    yield TestClient(main.app)
+    journal.close()
+
+
+def test_get_farmer(client, registry):
+    response = client.post("/get_farmer/", params={"aadhaar": " 100000000002 "})
+    assert response.status_code == 200
+    assert response.json() == {**registry.iloc[1].to_dict(), "land_size_acres": 1.63}
+    for missing in ["999999999999", "abc", "١٠٠٠٠٠٠٠٠٠٠٢"]:
+        assert client.post("/get_farmer/", params={"aadhaar": missing}).status_code == 404
+
+
+def test_get_farmers(client, registry, monkeypatch):
+    wanted = ["100000000003", "999999999999", "100000000001", "²", "100000000003"]
+    body = client.post("/get_farmers/", json={"aadhaar": wanted}).json()
+    assert body["count"] == 3
+    assert [f["aadhaar"] for f in body["farmers"]] == ["100000000003", "100000000001", "100000000003"]
+    assert body["farmers"][1]["farmer_id"] == registry.iloc[0]["farmer_id"]
+    assert body["not_found"] == ["999999999999", "²"]
+
+    monkeypatch.setattr(main, "MAX_BULK_LOOKUP", 2)
+    assert client.post("/get_farmers/", json={"aadhaar": wanted}).status_code == 400
+
+
+QUOTA_FIELDS = ["predicted_max_qty_kg", "predicted_max_qty_kg_clamped", "rule_max_qty_kg", "upper_bound_kg"]
+
+
+def test_predict_batch_matches_single_predictions(client, monkeypatch):
+    overrides = [
+        {"state": "Bihar", "crop_type": "Paddy", "land_size_acres": 2.5},
+        {"aadhaar": "999999999999", "state": "Punjab", "crop_type": "Wheat", "land_size_acres": 4.0,
+         "irrigation_type": "Canal"},
+        {"aadhaar": "999999999999"},  # unknown and no overrides: 404 detail
+        {"state": "Kerala"},  # incomplete overrides: 400 detail
+    ]
+    body = client.post("/predict_max_qty/batch",
+                       json={"aadhaar": ["100000000004", "100000000010"], "rows": overrides}).json()
+    assert body["count"] == 4 and [r["index"] for r in body["results"]] == [0, 1, 2, 3]
+    assert [e["index"] for e in body["errors"]] == [4, 5]
+    assert "Aadhaar not found" in body["errors"][0]["detail"]
+
+    singles = [{"aadhaar": "100000000004"}, {"aadhaar": "100000000010"}] + overrides[:2]
+    for result, single in zip(body["results"], singles):
+        expected = client.post("/predict_max_qty/", json=single).json()
+        assert {k: result[k] for k in QUOTA_FIELDS} == pytest.approx({k: expected[k] for k in QUOTA_FIELDS})
+
+    monkeypatch.setattr(main, "MAX_BATCH_PREDICT", 3)
+    assert client.post("/predict_max_qty/batch", json={"rows": overrides}).status_code == 400
+
+
+def test_registry_predictions_come_from_quota_table(client, registry, monkeypatch):
+    _write_model(main.MODEL_PATH, factor=1.1)
+    snap = main.build_snapshot(main.source_fingerprint())
+    monkeypatch.setattr(main, "_snapshot", snap)
+    assert snap.model_pipe is not None
+
+    for aadhaar in registry["aadhaar"][:10]:
+        body = client.post("/predict_max_qty/", json={"aadhaar": aadhaar}).json()
+        feat = main.build_feature_row(snap.registry.get(aadhaar).to_dict())
+        pred, pred_clamped, rule_max, upper_bound = main.predict_quota_one(feat, snap.model_pipe)
+        assert [body[k] for k in QUOTA_FIELDS] == \
+            pytest.approx([round(pred, 2), pred_clamped, rule_max, round(upper_bound, 2)], abs=1e-6)
+
+    # another worker maps the table the first one stored instead of scoring again
+    shared = main.build_quota_table(snap.registry, None, snap.fingerprint)
+    np.testing.assert_array_equal(shared.predicted, snap.quota.predicted)
+    # a different fingerprint scores the registry again (here with the rule fallback)
+    rescored = main.build_quota_table(snap.registry, None, ("registry", "other model"))
+    np.testing.assert_array_equal(rescored.predicted, rescored.rule_max)
+    assert not np.array_equal(rescored.predicted, snap.quota.predicted)
+
+
+def test_reload_watcher_swaps_in_changed_files(client, registry, monkeypatch):
+    watcher = main.ReloadWatcher()
+    first = main.current_snapshot()
+    override = {"state": "Bihar", "crop_type": "Maize", "land_size_acres": 3.0}
+    rule_based = client.post("/predict_max_qty/", json=override).json()
+    assert not watcher.check() and main.current_snapshot() is first
+
+    # a new model is loaded once it looks the same on two polls; its cache starts empty
+    _write_model(main.MODEL_PATH, factor=0.9)
+    assert not watcher.check() and main.current_snapshot() is first
+    assert watcher.check()
+    second = main.current_snapshot()
+    assert second.version == 2 and second.model_pipe is not None and second.registry is first.registry
+    assert len(second.prediction_cache) == 0
+    assert client.post("/predict_max_qty/", json=override).json()["predicted_max_qty_kg"] != \
+        rule_based["predicted_max_qty_kg"]
+
+    # a registry change keeps the model and its cached override predictions
+    with open(main.REG_PATH, "a") as f:
+        f.write("100000009999,F009999,Bihar,BDist1,4.5,Maize,Canal,Loam\n")
+    assert client.post("/get_farmer/", params={"aadhaar": "100000009999"}).status_code == 404
+    assert not watcher.check() and watcher.check()
+    third = main.current_snapshot()
+    assert third.model_pipe is second.model_pipe and third.prediction_cache is second.prediction_cache
+    assert client.post("/get_farmer/", params={"aadhaar": "100000009999"}).json()["district"] == "BDist1"
+
+    # a failed reload keeps serving the current snapshot
+    def fail(fingerprint, previous=None):
+        raise OSError("model half-copied")
+
+    monkeypatch.setattr(main, "build_snapshot", fail)
+    _write_model(main.MODEL_PATH, factor=1.2)
+    assert not watcher.check() and not watcher.check()
+    assert main.current_snapshot() is third
+
+
+def test_override_predictions_are_cached(client):
+    override = {"state": " Bihar", "crop_type": "Maize ", "land_size_acres": 3.0}
+    first = client.post("/predict_max_qty/", json=override).json()
+    # the same farmer after normalization, and one from the registry (never cached)
+    again = client.post("/predict_max_qty/", json={**override, "state": "Bihar", "irrigation_type": " "}).json()
+    client.post("/predict_max_qty/", json={"aadhaar": "100000000001"})
+    assert again == first
+    stats = client.get("/predict_max_qty/cache_stats").json()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_unscorable_rows_fall_back_to_rules(client, monkeypatch):
+    _write_model(main.MODEL_PATH, factor=1.1, handle_unknown="error")
+    snap = main.build_snapshot(main.source_fingerprint())
+    monkeypatch.setattr(main, "_snapshot", snap)
+    assert isinstance(snap.model_pipe, main.CompiledQuotaModel)
+    known = {"state": "Bihar", "crop_type": "Paddy", "land_size_acres": 2.5}
+    unseen = {"state": "Bihar", "crop_type": "Sugarcane", "land_size_acres": 2.5}
+
+    body = client.post("/predict_max_qty/", json=unseen).json()
+    assert body["fallback"] == "rule_based"
+    assert body["predicted_max_qty_kg"] == pytest.approx(body["rule_max_qty_kg"], abs=0.01)
+    model_based = client.post("/predict_max_qty/", json=known).json()
+    assert "fallback" not in model_based
+    assert model_based["predicted_max_qty_kg"] != pytest.approx(model_based["rule_max_qty_kg"], abs=0.01)
+
+    # only the unseen row of a batch falls back
+    batch = client.post("/predict_max_qty/batch", json={"rows": [known, unseen]}).json()
+    assert [r.get("fallback") for r in batch["results"]] == [None, "rule_based"]
+    for result, single in zip(batch["results"], [model_based, body]):
+        assert {k: result[k] for k in QUOTA_FIELDS} == pytest.approx({k: single[k] for k in QUOTA_FIELDS})
+
+
+def _tx(i, aadhaar="100000000001", approved=True, qty=10.0):
+    return {
+        "timestamp": f"2025-07-{1 + i:02d}T10:00:00",
+        "transaction_id": f"T{i}",
+        "aadhaar": aadhaar,
+        "farmer_id": f"F{aadhaar[-6:]}",
+        "state": "Haryana",
+        "district": "HDist140",
+        "crop": "Wheat",
+        "requested_qty_kg": qty,
+        "predicted_max_kg": 120.0,
+        "rule_max_kg": 121.95,
+        "approved": approved,
+    }
+
+
+def test_transactions_query(client):
+    for i in range(6):
+        main.journal.append(_tx(i, aadhaar="100000000001" if i % 2 else "100000000002", approved=i != 3))
+
+    body = client.get("/transactions", params={"aadhaar": "100000000001"}).json()
+    assert (body["count"], body["returned"]) == (3, 3)
+    assert [t["transaction_id"] for t in body["transactions"]] == ["T5", "T3", "T1"]
+    assert body["transactions"][0]["approved"] is True and body["transactions"][0]["requested_qty_kg"] == 10.0
+
+    body = client.get("/transactions", params={"approved": "false"}).json()
+    assert [t["transaction_id"] for t in body["transactions"]] == ["T3"]
+    body = client.get("/transactions", params={"since": "2025-07-02", "until": "2025-07-04T10:00:00",
+                                               "limit": 2}).json()
+    assert body["count"] == 3 and [t["transaction_id"] for t in body["transactions"]] == ["T3", "T2"]
+
+    assert client.get("/transactions", params={"limit": 0}).status_code == 400
+    assert client.get("/transactions", params={"limit": main.MAX_TRANSACTION_QUERY + 1}).status_code == 400
+    assert client.get("/transactions", params={"since": "not a time"}).status_code == 400
+
+
+def test_submit_request_caps_season_and_fills_ledger(client):
+    # Wheat on 2.71 acres: rule max 121.95 kg, so 140.24 kg per season
+    results = [
+        client.post("/submit_request/", json={"aadhaar": "100000000001", "requested_qty_kg": qty}).json()
+        for qty in (100.0, 50.0, 40.0)
+    ]
+    assert [r["approved"] for r in results] == [True, False, True]
+    assert results[-1]["season_approved_kg"] == 140.0 and results[-1]["season_remaining_kg"] == 0.24
+    unknown = client.post("/submit_request/", json={"aadhaar": "999999999999", "requested_qty_kg": 1.0})
+    assert unknown.status_code == 404
+
+    body = client.get("/quota_ledger/", params={"aadhaar": "100000000001"}).json()
+    assert body["seasons"] == {results[0]["season"]: {"requested_kg": 190.0, "approved_kg": 140.0, "requests": 3}}
+    assert client.get("/quota_ledger/", params={"aadhaar": "100000000002"}).json()["seasons"] == {}
+
+
+def test_submit_request_logs_inside_the_farmer_lock(client, monkeypatch):
+    ledger, calls = main.quota_ledger, []
+    reservation, append = ledger.reservation, main.journal.append
+
+    @contextmanager
+    def recorded_reservation(*args):
+        try:
+            with reservation(*args) as decision:
+                calls.append("check")
+                yield decision
+        finally:
+            calls.append("unlock")
+
+    def logged_append(tx, timeout=None):
+        calls.append("append")
+        return append(tx, timeout)
+
+    monkeypatch.setattr(ledger, "reservation", recorded_reservation)
+    monkeypatch.setattr(main.journal, "append", logged_append)
+    response = client.post("/submit_request/", json={"aadhaar": "100000000001", "requested_qty_kg": 60.0})
+    assert response.json()["approved"]
+    assert calls == ["check", "append", "unlock"]
+    # rejected requests are logged the same way
+    calls.clear()
+    response = client.post("/submit_request/", json={"aadhaar": "100000000001", "requested_qty_kg": 500.0})
+    assert not response.json()["approved"]
+    assert calls == ["check", "append", "unlock"]
+
+    # a failed write still unlocks the farmer
+    def failing_append(tx, timeout=None):
+        raise OSError("disk full")
+
+    calls.clear()
+    monkeypatch.setattr(main.journal, "append", failing_append)
+    response = TestClient(main.app, raise_server_exceptions=False).post(
+        "/submit_request/", json={"aadhaar": "100000000001", "requested_qty_kg": 10.0})
+    assert response.status_code == 500
+    assert calls == ["check", "unlock"]
+    # the farmer can be checked again from another request thread
+    def check_again():
+        with reservation("100000000001", "Kharif-2025", 1.0, 100.0):
+            pass
+
+    thread = threading.Thread(target=check_again)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert [s["approved_kg"] for s in ledger.seasons("100000000001").values()] == [60.0]
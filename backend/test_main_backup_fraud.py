@@ -0,0 +1,245 @@
+"""
+Test the fraud-analysis endpoints of main_backup against an SQLite database
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+# database builds its engine at import; point it at a throwaway SQLite file
+DB_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_DIR}/farmer_portal.db"
+
+from fastapi.testclient import TestClient
+
+import database
+import main_backup
+import ml_integrated_fraud_detector
+from benchmark_fraud_detector import synthetic_applications
+from database import Application, SessionLocal
+from fraud_detector import StreamingFraudDetector, SubsidyFraudDetector
+from fraud_training import FraudModelStore
+
+NORMS = str(Path(__file__).parent / "data" / "crop_norms.csv")
+
+
+@pytest.fixture
+def apps(monkeypatch):
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.init_db()
+    apps = synthetic_applications(300, seed=21)
+    with SessionLocal() as db:
+        for record in apps.to_dict("records"):
+            db.add(Application(farmer_name="Test Farmer", aadhaar_number="1234-5678-9012",
+                               mobile_number="9876543210", address="Test address, village",
+                               fertilizer_qty=100.0, seed_qty=20.0, **record))
+        db.commit()
+    # untrained detector and an empty snapshot, as on a fresh deployment
+    monkeypatch.setattr(main_backup, "fraud_detector", SubsidyFraudDetector(crop_norms_path=NORMS))
+    main_backup.fraud_snapshot.invalidate()
+    return apps
+
+
+def test_fraud_score_trains_on_database_applications(apps):
+    client = TestClient(main_backup.app)
+    response = client.get("/api/fraud-analysis/APP0000005")
+    assert response.status_code == 200
+    assert main_backup.fraud_detector.trained
+
+    expected = main_backup.fraud_detector.predict_anomalies(apps).set_index("application_id")
+    body = response.json()
+    assert body["application_id"] == "APP0000005"
+    assert body["anomaly_score"] == round(float(expected.loc["APP0000005", "anomaly_score"]), 3)
+    assert body["risk_level"] == expected.loc["APP0000005", "risk_level"]
+
+    # the snapshot was rebuilt from the table and its scores written back
+    assert len(main_backup.fraud_snapshot) == len(apps)
+    with SessionLocal() as db:
+        stored = db.query(Application).filter(Application.application_id == "APP0000005").one()
+        assert stored.fraud_score == pytest.approx(expected.loc["APP0000005", "anomaly_score"])
+
+    assert client.get("/api/fraud-analysis/no-such-application").status_code == 404
+
+
+def test_fraud_analysis_reads_database_applications(apps):
+    client = TestClient(main_backup.app)
+    # untrained: trains on the table
+    assert client.get("/api/fraud-analysis").json()["statistics"]["total_applications"] == len(apps)
+    # trained: served from the snapshot, with an ETag
+    response = client.get("/api/fraud-analysis")
+    assert response.json()["statistics"]["total_applications"] == len(apps)
+    etag = response.headers["etag"]
+    assert client.get("/api/fraud-analysis", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_training_waits_for_running_background_job(apps, monkeypatch, tmp_path):
+    monkeypatch.setattr(main_backup, "fraud_model_store", FraudModelStore(str(tmp_path / "models")))
+    monkeypatch.setattr(main_backup, "training_jobs", {"job": type("Job", (), {"state": "running"})()})
+    client = TestClient(main_backup.app)
+    for background in ("false", "true"):
+        response = client.post(f"/api/train-fraud-model?background={background}&n_jobs=1")
+        assert response.status_code == 409
+    assert main_backup.fraud_model_store.versions() == []
+
+    main_backup.training_jobs["job"].state = "published"
+    response = client.post("/api/train-fraud-model?n_jobs=1")
+    assert response.status_code == 200 and response.json()["version"] == 1
+    assert main_backup.fraud_detector.model_version == 1
+
+
+def test_training_serves_the_chosen_detector(apps, monkeypatch, tmp_path):
+    monkeypatch.setattr(main_backup, "fraud_model_store", FraudModelStore(str(tmp_path / "models")))
+    client = TestClient(main_backup.app)
+    assert client.post("/api/train-fraud-model?detector=lof").status_code == 400
+    assert client.post("/api/train-fraud-model?detector=half_space_trees&max_samples=64").status_code == 400
+
+    response = client.post("/api/train-fraud-model?detector=half_space_trees")
+    assert response.status_code == 200
+    assert response.json()["detector"] == "half_space_trees" and response.json()["version"] == 1
+    assert isinstance(main_backup.fraud_detector, StreamingFraudDetector)
+    body = client.get("/api/fraud-analysis").json()
+    assert body["statistics"]["total_applications"] == len(apps)
+
+
+def test_rollback_swaps_the_served_detector(apps, monkeypatch, tmp_path):
+    monkeypatch.setattr(main_backup, "fraud_model_store", FraudModelStore(str(tmp_path / "models")))
+    client = TestClient(main_backup.app)
+    for contamination in (0.05, 0.2):
+        assert client.post(f"/api/train-fraud-model?contamination={contamination}&n_jobs=1").status_code == 200
+    newest = main_backup.fraud_detector
+    flagged = client.get("/api/fraud-analysis").json()["statistics"]["flagged_anomalies"]
+
+    response = client.post("/api/fraud-model/rollback/7")
+    assert response.status_code == 404
+    assert main_backup.fraud_detector is newest and main_backup.fraud_model_store.current_version() == 2
+
+    response = client.post("/api/fraud-model/rollback/1")
+    assert response.status_code == 200 and response.json()["versions"] == [1, 2]
+    assert main_backup.fraud_detector is not newest and main_backup.fraud_detector.model_version == 1
+    assert main_backup.fraud_model_store.current_version() == 1
+    # the analysis is rescored with the rolled-back model
+    assert client.get("/api/fraud-analysis").json()["statistics"]["flagged_anomalies"] < flagged
+
+
+def test_background_training_is_polled_until_published(apps, monkeypatch, tmp_path):
+    monkeypatch.setattr(main_backup, "fraud_model_store", FraudModelStore(str(tmp_path / "models")))
+    monkeypatch.setattr(main_backup, "training_jobs", {})
+    client = TestClient(main_backup.app)
+    response = client.post("/api/train-fraud-model?background=true&n_jobs=1")
+    assert response.status_code == 200
+    job_id = response.json()["job_id"]
+
+    deadline = time.monotonic() + 120
+    while True:
+        status = client.get(f"/api/train-fraud-model/{job_id}").json()
+        if status["state"] != "running" or time.monotonic() > deadline:
+            break
+        time.sleep(0.2)
+    assert status["state"] == "published", status
+    assert status["version"] == 1 and status["progress"] == 1.0 and status["rows"] == len(apps)
+    assert main_backup.fraud_detector.model_version == 1
+    assert client.get("/api/train-fraud-model/no-such-job").status_code == 404
+
+
+def test_deleted_application_leaves_fraud_analysis(apps):
+    client = TestClient(main_backup.app)
+    client.get("/api/fraud-analysis")  # trains the model
+    before = client.get("/api/fraud-analysis")
+    riskiest = before.json()["flagged_applications"][0]["application_id"]
+
+    assert client.delete(f"/api/applications/{riskiest}").status_code == 200
+    assert client.delete(f"/api/applications/{riskiest}").status_code == 404
+    after = client.get("/api/fraud-analysis", headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200 and after.headers["etag"] != before.headers["etag"]
+    body = after.json()
+    assert body["statistics"]["total_applications"] == len(apps) - 1
+    assert riskiest not in [a["application_id"] for a in body["flagged_applications"]]
+    with SessionLocal() as db:
+        assert db.query(Application).filter(Application.application_id == riskiest).count() == 0
+
+
+def test_status_update_is_stored(apps):
+    client = TestClient(main_backup.app)
+    client.get("/api/fraud-analysis")
+    etag = client.get("/api/fraud-analysis").headers["etag"]
+
+    response = client.put("/api/applications/APP0000003/status", params={"status": "Approved"})
+    assert response.status_code == 200 and response.json()["application_id"] == "APP0000003"
+    with SessionLocal() as db:
+        assert db.query(Application).filter(Application.application_id == "APP0000003").one().status == "Approved"
+    assert client.put("/api/applications/no-such-application/status", params={"status": "Rejected"}).status_code == 404
+    assert client.put("/api/applications/APP0000003/status", params={"status": "Lost"}).status_code == 422
+    # status is not a fraud feature: the analysis is unchanged
+    assert client.get("/api/fraud-analysis", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_batch_eligibility_matches_single_checks(apps):
+    client = TestClient(main_backup.app)
+    items = [
+        {"crop_type": "Wheat", "land_size_acres": 2.0},  # 0 kg: just the allowed quantities
+        {"crop_type": "Rice", "land_size_acres": 1.5, "fertilizer_qty": 10000.0, "seed_qty": 5.0},
+    ]
+    response = client.post("/api/check-eligibility/batch", json={"items": items})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 2 and len(body["results"]) == 2
+
+    # the frontend reads results[i].fertilizer / results[i].seed
+    for item, result in zip(items, body["results"]):
+        assert (result["crop_type"], result["land_size_acres"]) == (item["crop_type"], item["land_size_acres"])
+        for kind in ("fertilizer", "seed"):
+            single = client.post("/api/check-eligibility", json={
+                "crop_type": item["crop_type"], "land_size_acres": item["land_size_acres"],
+                "requested_qty": item.get(f"{kind}_qty", 0.0), "subsidy_type": kind,
+            }).json()
+            for key in ("approved", "reason", "risk_flag", "allowed_qty", "fraud_indicators"):
+                assert result[kind][key] == single[key]
+
+    # one item's excess fails that check only
+    over = body["results"][1]
+    assert over["fertilizer"]["approved"] is False and over["fertilizer"]["reason"] == "ABOVE_MAX_LIMIT"
+    assert over["fertilizer"]["risk_flag"] == "HIGH" and over["fertilizer"]["fraud_indicators"]
+    assert body["results"][0]["fertilizer"]["approved"] is True
+
+    invalid = [{"crop_type": "Wheat", "land_size_acres": 0}]
+    assert client.post("/api/check-eligibility/batch", json={"items": invalid}).status_code == 422
+    assert client.post("/api/check-eligibility/batch", json={"items": []}).json() == {"count": 0, "results": []}
+
+
+def test_ml_readiness_switches_from_rules_only_to_ml(monkeypatch):
+    loaded = threading.Event()
+
+    def stub_loader(path):
+        loaded.wait(30)  # held "loading" until the test lets it finish
+        return {"path": str(path)}
+
+    for name, (filename, _) in ml_integrated_fraud_detector.COMPONENTS.items():
+        monkeypatch.setitem(ml_integrated_fraud_detector.COMPONENTS, name, (filename, stub_loader))
+    # the stubs are not real models: keep scoring uncompiled
+    monkeypatch.setattr(ml_integrated_fraud_detector.MLIntegratedFraudDetector, "compile_models", lambda self: None)
+    monkeypatch.setattr(ml_integrated_fraud_detector, "_ml_detector", None)
+    client = TestClient(main_backup.app)
+
+    response = client.get("/api/ml/readiness")  # starts the warm-up
+    assert response.status_code == 503
+    body = response.json()
+    assert body["mode"] == "rules_only" and not body["ready"]
+    assert set(body["components"]) == set(ml_integrated_fraud_detector.COMPONENTS)
+
+    loaded.set()
+    assert ml_integrated_fraud_detector.get_ml_integrated_detector().wait_until_ready(timeout=30)
+    response = client.get("/api/ml/readiness")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["mode"] == "ml" and body["ready"] and body["warmed_up"]
+    assert all(c["state"] == "ready" for c in body["components"].values())
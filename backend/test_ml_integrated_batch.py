@@ -0,0 +1,88 @@
+"""
+Test that MLIntegratedFraudDetector.analyze_batch matches per-application predict_fraud
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ml_integrated_fraud_detector import FEATURE_NAMES, MLIntegratedFraudDetector
+
+
+def _detector(use_xgb):
+    """Detector with small models fitted on engineered features (the Hackathon_Nitro models are not in the repo)."""
+    detector = MLIntegratedFraudDetector(warm_up=False)
+    rng = np.random.default_rng(0)
+    apps = _applications(400, rng)
+    X = detector.engineer_features_batch(apps).to_numpy(dtype=float)
+    detector.scaler = StandardScaler().fit(X)
+    X_scaled = detector.scaler.transform(X)
+    detector.isolation_forest = IsolationForest(n_estimators=20, random_state=0).fit(X_scaled)
+    labels = (X[:, FEATURE_NAMES.index('quantity_vs_allowed')] > 1).astype(int)
+    detector.xgboost_model = GradientBoostingClassifier(n_estimators=10, random_state=0).fit(X_scaled, labels)
+    detector.use_xgb = use_xgb
+    detector.models_loaded = True
+    return detector
+
+
+def _applications(n, rng):
+    return [
+        {
+            "application_id": f"APP{i}",
+            "farmer_name": f"Farmer {i}",
+            "total_land_acres": float(rng.choice([0.1, 1.0, 2.5, 10.0, 40.0])),
+            "fertilizer_qty": float(rng.integers(0, 800)),
+            "seed_qty": float(rng.integers(0, 200)),
+        }
+        for i in range(n)
+    ]
+
+
+def test_analyze_batch_matches_predict_fraud():
+    rng = np.random.default_rng(1)
+    apps = _applications(300, rng)
+    apps.append({"application_id": "APPX", "total_land_acres": 3.0})  # no quantities, no name
+    for use_xgb in (True, False):
+        detector = _detector(use_xgb)
+        batch = detector.analyze_batch(apps)
+        assert len(batch) == len(apps)
+        for app, result in zip(apps, batch):
+            expected = detector.predict_fraud(app)
+            assert result["application_id"] == app["application_id"]
+            assert result["farmer_name"] == app.get("farmer_name", "N/A")
+            assert result["warnings"] == expected["warnings"]
+            assert result["risk_level"] == expected["risk_level"]
+            assert result["details"]["engineered_features"] == expected["details"]["engineered_features"]
+            for key in ("fraud_score", "confidence"):
+                assert abs(result[key] - expected[key]) <= 1e-4
+        assert detector.analyze_batch([]) == []
+
+
+def test_analyze_batch_without_models(tmp_path):
+    detector = _detector(True)
+    detector.models_loaded = False
+    detector.data_dir = tmp_path  # nothing to load: the models fail
+    detector.load_models()
+    result = detector.analyze_batch([{"application_id": "APP1"}])
+    assert result[0]["risk_level"] == "UNKNOWN" and result[0]["application_id"] == "APP1"
+
+
+def test_compiled_models_match_models():
+    rng = np.random.default_rng(2)
+    apps = _applications(100, rng)
+    for use_xgb in (True, False):
+        direct = _detector(use_xgb)
+        compiled = _detector(use_xgb)
+        compiled.compile_models()
+        assert compiled.compiled_ensemble is not None and direct.compiled_ensemble is None
+        for app, result in zip(apps, compiled.analyze_batch(apps)):
+            expected = direct.predict_fraud(app)
+            assert compiled.predict_fraud(app)["fraud_score"] == pytest.approx(expected["fraud_score"], abs=1e-4)
+            assert result["risk_level"] == expected["risk_level"]
+            assert abs(result["fraud_score"] - expected["fraud_score"]) <= 1e-4
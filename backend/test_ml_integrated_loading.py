@@ -0,0 +1,97 @@
+"""
+Test background warm-up, lazy loading and the rules-only fallback of MLIntegratedFraudDetector
+"""
+
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ml_integrated_fraud_detector import COMPONENTS, MLIntegratedFraudDetector
+
+APPLICATION = {"application_id": "APP1", "total_land_acres": 1.0, "fertilizer_qty": 500.0, "seed_qty": 0.0}
+
+
+def _write_components(data_dir, with_xgb=False):
+    """Small fitted models and reference CSVs laid out like Hackathon_Nitro."""
+    detector = MLIntegratedFraudDetector(warm_up=False)
+    rng = np.random.default_rng(0)
+    apps = [{"total_land_acres": float(rng.uniform(0.5, 20)), "fertilizer_qty": float(rng.integers(0, 800)),
+             "seed_qty": float(rng.integers(0, 200))} for _ in range(200)]
+    X = detector.engineer_features_batch(apps).to_numpy(dtype=float)
+    scaler = StandardScaler().fit(X)
+    (data_dir / "models").mkdir()
+    joblib.dump(scaler, data_dir / "models" / "feature_scaler.pkl")
+    joblib.dump(IsolationForest(n_estimators=10, random_state=0).fit(scaler.transform(X)),
+                data_dir / "models" / "isolation_forest.pkl")
+    (data_dir / "models" / "metrics_summary.json").write_text('{"auc": 0.9}')
+    for name in ("farmers", "dealers", "scheme_rules", "transactions"):
+        pd.DataFrame({"id": [1, 2, 3]}).to_csv(data_dir / f"{name}.csv", index=False)
+
+
+def _detector(data_dir):
+    detector = MLIntegratedFraudDetector(warm_up=False)
+    detector.data_dir = data_dir
+    return detector
+
+
+def test_rules_only_before_warm_up(tmp_path):
+    _write_components(tmp_path)
+    detector = _detector(tmp_path)
+    readiness = detector.readiness()
+    assert readiness["mode"] == "rules_only" and not readiness["ready"]
+    assert all(c["state"] == "pending" for c in readiness["components"].values())
+
+    result = detector.predict_fraud(APPLICATION)
+    assert result["details"]["mode"] == "rules_only"
+    assert result["risk_level"] == "RISK"
+    assert "Requested quantity exceeds scheme limits" in result["warnings"]
+    # nothing was loaded to answer it
+    assert all(c["state"] == "pending" for c in detector.readiness()["components"].values())
+
+
+def test_warm_up_loads_every_component(tmp_path):
+    _write_components(tmp_path)
+    detector = _detector(tmp_path)
+    detector.start_warm_up()
+    assert detector.wait_until_ready(timeout=30)
+
+    readiness = detector.readiness()
+    assert readiness["ready"] and readiness["mode"] == "ml"
+    assert not readiness["use_xgb"]
+    components = readiness["components"]
+    assert set(components) == set(COMPONENTS)
+    assert components["xgboost_model"]["state"] == "failed" and components["xgboost_model"]["error"]
+    assert all(components[name]["state"] == "ready" for name in COMPONENTS if name != "xgboost_model")
+    assert len(detector.farmers_df) == 3
+
+    result = detector.predict_fraud(APPLICATION)
+    assert "mode" not in result["details"] and result["details"]["xgboost_score"] is None
+
+
+def test_components_load_lazily(tmp_path):
+    _write_components(tmp_path)
+    detector = _detector(tmp_path)
+    assert len(detector.dealers_df) == 3
+    components = detector.readiness()["components"]
+    assert components["dealers_df"]["state"] == "ready"
+    assert components["farmers_df"]["state"] == "pending"
+    assert not detector.models_loaded
+
+    detector.load_models()
+    assert detector.models_loaded and detector.readiness()["mode"] == "ml"
+
+
+def test_missing_models_are_unavailable(tmp_path):
+    detector = _detector(tmp_path)
+    assert detector.wait_until_ready(timeout=30)
+    readiness = detector.readiness()
+    assert readiness["mode"] == "unavailable" and not readiness["ready"]
+    assert detector.predict_fraud(APPLICATION)["risk_level"] == "UNKNOWN"
+    assert not hasattr(detector, "farmers_df")
@@ -27,7 +27,7 @@ def test_ml_integration():
     
     # Initialize detector
     print("\n1. Initializing ML Integrated Fraud Detector...")
-    detector = get_ml_integrated_detector()
+    detector = get_ml_integrated_detector(wait=True)
     
     if not detector.models_loaded:
         print("❌ Models failed to load!")
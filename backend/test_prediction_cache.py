@@ -0,0 +1,53 @@
+"""
+Test eviction and expiry in the prediction LRU cache
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from prediction_cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=3, ttl=None)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"  # a is now the most recently used
+    cache.put("d", "D")
+    assert cache.get("b") is None and len(cache) == 3
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+
+    cache.put("c", "C2")  # overwriting refreshes too
+    cache.put("e", "E")
+    assert cache.get("a") is None and cache.get("c") == "C2"
+    assert cache.stats()["size"] == 3
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5.0, clock=clock)
+    cache.put("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    cache.put("b", 2)
+    clock.now = 5.0
+    assert cache.get("a") is None and len(cache) == 1  # expired entries are dropped on lookup
+    assert cache.get("b") == 2
+    cache.put("a", 3)  # re-put restarts the clock
+    clock.now = 9.0
+    assert cache.get("a") == 3
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (3, 1, 0.75)
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["hits"] == 0
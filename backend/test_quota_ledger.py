@@ -0,0 +1,168 @@
+"""
+Test the seasonal quota ledger kept in step with the transaction journal
+"""
+
+import multiprocessing
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from quota_ledger import QuotaLedger, season_of
+from transaction_journal import TransactionJournal, TX_COLUMNS
+
+
+def _tx(i, aadhaar="100000000001", month=7, approved=True):
+    return {
+        "timestamp": f"2025-{month:02d}-01T10:00:{i % 60:02d}",
+        "transaction_id": f"T{i}",
+        "aadhaar": aadhaar,
+        "farmer_id": "F000001",
+        "state": "Bihar",
+        "district": "BDist75",
+        "crop": "Maize",
+        "requested_qty_kg": 10.0,
+        "predicted_max_kg": 37.77,
+        "rule_max_kg": 40.2,
+        "approved": approved,
+    }
+
+
+def test_season_of():
+    assert season_of("2025-07-15T10:00:00") == "Kharif-2025"
+    assert season_of("2025-04-02T00:00:00") == "Zaid-2025"
+    assert season_of("2025-11-30T23:59:59") == "Rabi-2025"
+    assert season_of("2026-02-01T08:00:00") == "Rabi-2025"
+
+
+def test_totals_follow_journal_across_rotation_and_restart(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    snapshot = str(tmp_path / "ledger.bin")
+    journal = TransactionJournal(path, TX_COLUMNS, max_segment_bytes=1024, fsync=False)
+    ledger = QuotaLedger(journal, snapshot, snapshot_every=7)
+
+    for i in range(30):
+        journal.append(_tx(i, approved=i % 3 != 0))
+    journal.append(_tx(30, month=11))
+    ledger.sync()
+    assert len(journal.segments()) > 2
+    assert ledger.totals("100000000001", "Kharif-2025") == (300.0, 200.0, 30)
+    assert ledger.totals("100000000001", "Rabi-2025") == (10.0, 10.0, 1)
+
+    # restart from the last snapshot, then replay what came after it
+    for i in range(31, 35):
+        journal.append(_tx(i, aadhaar="100000000002"))
+    journal.close()
+    restarted = QuotaLedger(journal, snapshot)
+    assert restarted.totals("100000000001", "Kharif-2025") == (300.0, 200.0, 30)
+    assert restarted.totals("100000000002", "Kharif-2025") == (40.0, 40.0, 4)
+
+
+def test_reservation_holds_farmer_until_logged(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS, fsync=False)
+    journal.append(_tx(0))
+    ledger = QuotaLedger(journal)
+    events = []
+
+    def second():
+        with ledger.reservation("100000000001", "Kharif-2025", 10.0, cap=40.0) as decision:
+            events.append(decision)
+
+    with ledger.reservation("100000000001", "Kharif-2025", 25.0, cap=40.0) as decision:
+        assert decision == (True, 10.0)
+        thread = threading.Thread(target=second)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()  # waits for the first row to reach the journal
+        journal.append(_tx(1) | {"requested_qty_kg": 25.0})
+    thread.join()
+    assert events == [(False, 35.0)]
+    # other farmers are not held up
+    with ledger.reservation("100000000001", "Kharif-2025", 5.0, cap=40.0) as decision:
+        assert decision == (True, 35.0)
+        with ledger.reservation("100000000002", "Kharif-2025", 5.0, cap=40.0) as other:
+            assert other == (True, 0.0)
+    journal.close()
+
+
+def _submit_many(path, n, start):
+    journal = TransactionJournal(path, TX_COLUMNS, fsync=False)
+    ledger = QuotaLedger(journal)
+    start.wait()
+    for i in range(n):
+        with ledger.reservation("100000000001", "Kharif-2025", 10.0, cap=100.0) as (approved, _):
+            journal.append(_tx(i, approved=approved))
+    journal.close()
+
+
+def test_cap_holds_across_worker_processes(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    workers = [context.Process(target=_submit_many, args=(path, 50, start)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    journal = TransactionJournal(path, TX_COLUMNS, fsync=False)
+    assert QuotaLedger(journal).totals("100000000001", "Kharif-2025") == (2000.0, 100.0, 200)
+    journal.close()
+
+
+def test_sync_without_rotation_skips_listing(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS, fsync=False)
+    ledger = QuotaLedger(journal)
+    journal.append(_tx(0))
+    assert ledger.sync() == 1
+
+    def no_listing():
+        raise AssertionError("segments listed")
+
+    listing = journal._sealed_segments
+    journal._sealed_segments = no_listing
+    assert ledger.sync() == 0
+    journal.append(_tx(1))
+    assert ledger.sync() == 1
+    journal._sealed_segments = listing
+    journal.close()
+
+
+def test_partial_row_with_quoted_newline_waits(tmp_path):
+    path = tmp_path / "transaction_log.csv"
+    journal = TransactionJournal(str(path), TX_COLUMNS, fsync=False)
+    journal.append(_tx(0))
+    journal.close()
+    ledger = QuotaLedger(journal)
+    row = journal._encode([_tx(1) | {"crop": "Maize\nlate sown"}])
+    cut = row.index(b"\n") + 1  # written up to the newline inside the quoted crop
+    with open(path, "ab") as f:
+        f.write(row[:cut])
+    assert ledger.sync() == 0
+    with open(path, "ab") as f:
+        f.write(row[cut:])
+    assert ledger.sync() == 1
+    assert ledger.totals("100000000001", "Kharif-2025") == (20.0, 20.0, 2)
+
+
+def test_replaced_log_triggers_rebuild(tmp_path):
+    path = tmp_path / "transaction_log.csv"
+    journal = TransactionJournal(str(path), TX_COLUMNS, fsync=False)
+    for i in range(3):
+        journal.append(_tx(i))
+    journal.close()
+    ledger = QuotaLedger(journal)
+    assert ledger.totals("100000000001", "Kharif-2025") == (30.0, 30.0, 3)
+
+    # restore an older copy of the log over it: same segment number, new inode
+    lines = path.read_bytes().splitlines(keepends=True)
+    restored = tmp_path / "restored.csv"
+    restored.write_bytes(b"".join(lines[:2]))
+    restored.replace(path)
+
+    assert ledger.sync() == 1
+    assert ledger.totals("100000000001", "Kharif-2025") == (10.0, 10.0, 1)
+    assert QuotaLedger(journal).totals("100000000001", "Kharif-2025") == (10.0, 10.0, 1)
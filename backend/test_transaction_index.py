@@ -0,0 +1,140 @@
+"""
+Test /transactions filtering against a plain pandas scan of every journal segment
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from transaction_index import TransactionIndex
+from transaction_journal import TransactionJournal, TX_COLUMNS
+
+STATES = ["Bihar", "Punjab", "Kerala"]
+
+
+def _tx(i):
+    return {
+        "timestamp": f"2025-12-{1 + i // 100:02d}T10:{(i // 60) % 60:02d}:{i % 60:02d}",
+        "transaction_id": f"T{i}",
+        "aadhaar": str(100000000000 + i % 37),
+        "farmer_id": f"F{i % 37:06d}",
+        "state": STATES[i % 3],
+        "district": f"D{i % 5}",
+        "crop": "Maize",
+        "requested_qty_kg": float(i),
+        "predicted_max_kg": 37.77,
+        "rule_max_kg": 40.2,
+        "approved": i % 4 != 0,
+    }
+
+
+def _expected(journal, **filters):
+    log = pd.concat([pd.read_csv(p, dtype=str) for p in journal.segments()], ignore_index=True)
+    mask = pd.Series(True, index=log.index)
+    for name in ("aadhaar", "farmer_id", "state", "district"):
+        if filters.get(name) is not None:
+            mask &= log[name] == filters[name]
+    if filters.get("approved") is not None:
+        mask &= log["approved"] == str(filters["approved"])
+    ts = pd.to_datetime(log["timestamp"])
+    if filters.get("since"):
+        mask &= ts >= pd.Timestamp(filters["since"])
+    if filters.get("until"):
+        mask &= ts <= pd.Timestamp(filters["until"])
+    return list(log.loc[mask, "transaction_id"][::-1])
+
+
+def _query(index, limit=10000, **filters):
+    keys = {k: filters.get(k) for k in ("aadhaar", "farmer_id", "state", "district")}
+    count, rows = index.query(keys, filters.get("since"), filters.get("until"),
+                              filters.get("approved"), limit)
+    return count, [r["transaction_id"] for r in rows]
+
+
+def test_queries_match_full_scan_across_segments(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS,
+                                 max_segment_bytes=4096, fsync=False)
+    index = TransactionIndex(journal)
+    cases = [
+        {},
+        {"state": "Bihar"},
+        {"aadhaar": "100000000005", "approved": True},
+        {"district": "D2", "state": "Kerala", "approved": False},
+        {"since": "2025-12-02T10:00:00", "until": "2025-12-03T10:00:30"},
+        {"farmer_id": "F000003", "since": "2025-12-02"},
+        {"state": "Goa"},
+    ]
+    for i in range(150):
+        journal.append(_tx(i))
+    for case in cases:  # builds the indexes
+        _query(index, **case)
+    for i in range(150, 400):  # rotates, and grows the active segment in deltas
+        journal.append(_tx(i))
+        if i % 40 == 0:
+            _query(index, state="Bihar")
+    journal.close()
+
+    assert len(journal.segments()) > 2
+    for case in cases:
+        expected = _expected(journal, **case)
+        assert _query(index, **case) == (len(expected), expected)
+
+
+def test_limit_returns_newest_first_and_counts_all(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS,
+                                 max_segment_bytes=2048, fsync=False)
+    for i in range(100):
+        journal.append(_tx(i))
+    journal.close()
+
+    count, rows = TransactionIndex(journal).query({"state": "Punjab"}, limit=3)
+    assert count == 33
+    assert [r["transaction_id"] for r in rows] == ["T97", "T94", "T91"]
+    assert rows[0]["approved"] is True and rows[0]["requested_qty_kg"] == 97.0
+
+
+def test_quoted_newlines_do_not_split_rows(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS,
+                                 max_segment_bytes=4096, fsync=False)
+    index = TransactionIndex(journal)
+    for i in range(60):
+        tx = _tx(i)
+        if i % 7 == 3:
+            tx["crop"] = 'Maize\n"hybrid", late\nsown'
+        journal.append(tx)
+        if i % 25 == 0:
+            _query(index, state="Bihar")  # index the active segment in deltas
+    journal.close()
+
+    for case in [{}, {"state": "Bihar"}, {"farmer_id": "F000010"}, {"approved": False}]:
+        expected = _expected(journal, **case)
+        assert _query(index, **case) == (len(expected), expected)
+    _, rows = index.query({"farmer_id": "F000003"})
+    assert rows[-1]["transaction_id"] == "T3" and rows[-1]["crop"] == 'Maize\n"hybrid", late\nsown'
+    # sealed segments are indexed from scratch as well
+    _, rows = TransactionIndex(journal).query({"state": "Punjab"}, limit=100)
+    assert [r["transaction_id"] for r in rows] == [f"T{i}" for i in range(58, -1, -3)]
+
+
+def test_non_ascii_keys_are_indexed(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "transaction_log.csv"), TX_COLUMNS,
+                                 max_segment_bytes=2048, fsync=False)
+    index = TransactionIndex(journal)
+    for i in range(60):
+        tx = _tx(i)
+        if i % 4 == 1:
+            tx["state"], tx["district"] = "बिहार", "पटना"
+        journal.append(tx)
+        if i % 25 == 0:
+            _query(index, district="पटना")
+    journal.close()
+
+    assert len(journal.segments()) > 1
+    for case in [{"district": "पटना"}, {"state": "बिहार", "approved": True}, {"district": "D0"}]:
+        expected = _expected(journal, **case)
+        assert _query(index, **case) == (len(expected), expected)
+    _, rows = TransactionIndex(journal).query({"district": "पटना"}, limit=1)
+    assert rows[0]["transaction_id"] == "T57" and rows[0]["state"] == "बिहार"
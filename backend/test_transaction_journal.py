@@ -0,0 +1,104 @@
+"""
+Test the append-only transaction journal used by /submit_request/
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from transaction_journal import TransactionJournal, TX_COLUMNS
+
+
+def _tx(i):
+    return {
+        "timestamp": f"2025-12-04T10:00:{i % 60:02d}",
+        "transaction_id": f"T{i}",
+        "aadhaar": str(100000000000 + i),
+        "farmer_id": f"F{i:06d}",
+        "state": "Bihar",
+        "district": "BDist75",
+        "crop": "Maize",
+        "requested_qty_kg": float(i),
+        "predicted_max_kg": 37.77,
+        "rule_max_kg": 40.2,
+        "approved": i % 2 == 0,
+    }
+
+
+def test_concurrent_appends_are_not_lost(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    journal = TransactionJournal(path, TX_COLUMNS, fsync=False)
+
+    threads = [
+        threading.Thread(target=lambda k=k: [journal.append(_tx(k * 50 + j)) for j in range(50)])
+        for k in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    journal.close()
+
+    log = pd.read_csv(path)
+    assert list(log.columns) == TX_COLUMNS
+    assert len(log) == 400
+    assert sorted(log["transaction_id"]) == sorted(f"T{i}" for i in range(400))
+
+
+def test_rotation_keeps_every_row(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    journal = TransactionJournal(path, TX_COLUMNS, max_segment_bytes=2048, fsync=False)
+    for i in range(100):
+        journal.append(_tx(i))
+    journal.close()
+
+    segments = journal.segments()
+    assert len(segments) > 1
+    assert segments[-1] == path
+    log = pd.concat([pd.read_csv(p) for p in segments], ignore_index=True)
+    assert list(log["transaction_id"]) == [f"T{i}" for i in range(100)]
+
+
+def test_existing_log_is_appended_to(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    pd.DataFrame([_tx(0)]).to_csv(path, index=False)
+
+    journal = TransactionJournal(path, TX_COLUMNS, fsync=False)
+    journal.append(_tx(1))
+    journal.close()
+
+    log = pd.read_csv(path, dtype={"aadhaar": str})
+    assert list(log["transaction_id"]) == ["T0", "T1"]
+    assert list(log["approved"]) == [True, False]
+
+
+
+def test_close_waits_for_append_already_queuing(tmp_path):
+    path = str(tmp_path / "transaction_log.csv")
+    journal = TransactionJournal(path, TX_COLUMNS, fsync=False)
+    queuing = threading.Event()
+    put = journal._queue.put
+
+    def slow_put(item):
+        if item is not None:
+            queuing.set()
+            time.sleep(0.2)  # close() arrives between the closed check and the put
+        put(item)
+
+    journal._queue.put = slow_put
+    appender = threading.Thread(target=journal.append, args=(_tx(1),), daemon=True)
+    appender.start()
+    queuing.wait()
+    journal.close()
+    appender.join(timeout=5)
+    assert not appender.is_alive()
+
+    assert list(pd.read_csv(path)["transaction_id"]) == ["T1"]
+    with pytest.raises(RuntimeError):
+        journal.append(_tx(2))
@@ -0,0 +1,325 @@
+"""
+Offset indexes over the transaction journal.
+
+Every journal segment gets a SegmentIndex: the byte offset and length of
+each row, its timestamp, approval flag, and an inverted index (sorted keys
+-> row postings) for aadhaar, farmer_id, state and district. A query looks
+up the postings of each key it filters on, narrows by time with the
+segment's sorted timestamps, and then reads only the matching rows from
+disk. Row boundaries are newlines outside quoted fields, so a field with
+an embedded newline stays one row.
+
+Sealed segments never change, so their index is persisted next to them
+(transaction_log.000001.csv.idx, see array_store) and mapped on later
+starts. The active segment is indexed incrementally: each refresh parses
+just the bytes appended since the last one into a small delta index, and
+deltas are merged once enough of them pile up.
+"""
+
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from array_store import load_or_build
+
+KEY_COLUMNS = ["aadhaar", "farmer_id", "state", "district"]
+INDEX_VERSION = 1
+# timestamp stored for rows whose timestamp cannot be parsed
+MISSING_TS = np.iinfo(np.int64).min
+# merge the active segment's delta indexes once there are this many
+MAX_DELTAS = 8
+
+
+def parse_timestamp(value):
+    """Naive-UTC int64 nanoseconds for an ISO timestamp (as written by /submit_request/)."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.value
+
+
+def row_ends(data):
+    """
+    End offsets (just past the newline) of the complete CSV rows in data.
+    A newline only ends a row when an even number of quote characters
+    precede it, i.e. it is not inside a quoted field ("" escapes keep
+    the count even).
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(raw == ord("\n"))
+    quotes = np.flatnonzero(raw == ord('"'))
+    if len(quotes):
+        newlines = newlines[np.searchsorted(quotes, newlines) % 2 == 0]
+    return newlines + 1
+
+
+class SegmentIndex:
+    """Index over a run of complete rows of one segment file."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.offsets = arrays["offsets"]
+        self.lengths = arrays["lengths"]
+        self.ts = arrays["ts"]
+        self.approved = arrays["approved"]
+        self.ts_order = arrays["ts_order"]
+        self.ts_sorted = self.ts[self.ts_order]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # ---------- construction ----------
+    @classmethod
+    def from_bytes(cls, data, base_offset, columns):
+        """Index the complete CSV rows in data, which starts at base_offset in the file."""
+        ends = row_ends(data)
+        starts = np.concatenate(([0], ends[:-1]))
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=columns, dtype=str,
+                            keep_default_na=False, skip_blank_lines=False)
+        ts = pd.to_datetime(frame["timestamp"], errors="coerce", format="ISO8601")
+        if ts.dt.tz is not None:
+            ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+        # NaT is int64 min, i.e. MISSING_TS
+        ts = ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        arrays = {
+            "offsets": (starts + base_offset).astype(np.int64),
+            "lengths": (ends - starts).astype(np.int32),
+            "ts": ts,
+            "approved": frame["approved"].str.strip().str.lower().eq("true").to_numpy(dtype=np.bool_),
+            "ts_order": np.argsort(ts, kind="stable"),
+        }
+        for name in KEY_COLUMNS:
+            # UTF-8, matching rows_for_key: to_numpy(dtype=np.bytes_) alone is ASCII-only
+            values = frame[name].str.strip().str.encode("utf-8").to_numpy(dtype=np.bytes_)
+            keys, codes = np.unique(values, return_inverse=True)
+            # postings: rows of key i are order[starts[i]:starts[i + 1]], in file order
+            arrays["keys." + name] = keys
+            arrays["order." + name] = np.argsort(codes, kind="stable")
+            arrays["starts." + name] = np.searchsorted(codes[arrays["order." + name]],
+                                                       np.arange(len(keys) + 1)).astype(np.int64)
+        return cls(arrays)
+
+    @classmethod
+    def concat(cls, parts, columns, path):
+        """Merge delta indexes of the same file by re-indexing their byte range."""
+        start = int(parts[0].offsets[0])
+        last = parts[-1]
+        end = int(last.offsets[-1] + last.lengths[-1])
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return cls.from_bytes(data, start, columns)
+
+    # ---------- queries ----------
+    def rows_for_key(self, name, value):
+        keys = self.arrays["keys." + name]
+        key = str(value).strip().encode("utf-8")
+        i = int(np.searchsorted(keys, key))
+        if i >= len(keys) or keys[i] != key:
+            return np.empty(0, dtype=np.int64)
+        starts = self.arrays["starts." + name]
+        return self.arrays["order." + name][starts[i]:starts[i + 1]]
+
+    def rows_in_range(self, since=None, until=None):
+        # rows without a parseable timestamp sort first and never match a range
+        lo = int(np.searchsorted(self.ts_sorted, MISSING_TS if since is None else since,
+                                 side="right" if since is None else "left"))
+        hi = len(self) if until is None else int(np.searchsorted(self.ts_sorted, until, side="right"))
+        return np.sort(self.ts_order[lo:hi])
+
+    def overlaps(self, since=None, until=None):
+        if not len(self):
+            return False
+        valid = self.ts_sorted[self.ts_sorted != MISSING_TS]
+        if not len(valid):
+            return since is None and until is None
+        return ((since is None or valid[-1] >= since) and (until is None or valid[0] <= until))
+
+    def select(self, filters, since=None, until=None, approved=None):
+        """Matching row numbers (ascending = file order)."""
+        if (since is not None or until is not None) and not self.overlaps(since, until):
+            return np.empty(0, dtype=np.int64)
+        postings = [self.rows_for_key(name, value) for name, value in filters.items()]
+        if since is not None or until is not None:
+            postings.append(self.rows_in_range(since, until))
+        if postings:
+            postings.sort(key=len)
+            rows = postings[0]
+            for other in postings[1:]:
+                if not len(rows):
+                    break
+                rows = np.intersect1d(rows, other, assume_unique=True)
+        else:
+            rows = np.arange(len(self))
+        if approved is not None and len(rows):
+            rows = rows[self.approved[rows] == approved]
+        return rows
+
+
+class _SegmentState:
+    """Index parts for one segment file and how far into the file they reach."""
+
+    def __init__(self, inode, fingerprint=None):
+        self.inode = inode
+        self.fingerprint = fingerprint
+        self.parts = []
+        self.indexed_bytes = 0
+
+
+class _SegmentMoved(Exception):
+    """A segment was rotated between indexing and reading it."""
+
+
+class TransactionIndex:
+    """
+    Query interface over every segment of a TransactionJournal. Safe to
+    share between request threads; refresh() runs under a lock and is cheap
+    when nothing was appended.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.columns = journal.columns
+        self._header = journal._header
+        self._states = {}
+        self._lock = threading.Lock()
+
+    # ---------- maintenance ----------
+    def refresh(self):
+        """Bring the index up to date with the segments on disk; returns the segment list."""
+        with self._lock:
+            paths = self.journal.segments()
+            active = paths[-1]
+            for path in list(self._states):
+                if path not in paths:
+                    del self._states[path]
+            for path in paths[:-1]:
+                self._refresh_sealed(path)
+            self._refresh_active(active)
+            return [(path, self._states[path].inode, list(self._states[path].parts))
+                    for path in paths if path in self._states]
+
+    def _refresh_sealed(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        fingerprint = (st.st_size, st.st_mtime_ns)
+        state = self._states.get(path)
+        if state is not None and state.fingerprint == fingerprint and state.inode == st.st_ino:
+            return
+        state = _SegmentState(st.st_ino, fingerprint)
+
+        def is_current(meta):
+            return meta.get("version") == INDEX_VERSION and meta.get("fingerprint") == list(fingerprint)
+
+        def build():
+            with open(path, "rb") as f:
+                data = f.read()
+            start = self._data_start(data)
+            data = data[start:]
+            ends = row_ends(data)
+            data = data[:ends[-1] if len(ends) else 0]
+            index = SegmentIndex.from_bytes(data, start, self.columns) if data else None
+            arrays = index.arrays if index is not None else {}
+            return arrays, {"version": INDEX_VERSION, "fingerprint": list(fingerprint)}
+
+        arrays, _ = load_or_build(path + ".idx", is_current, build)
+        if arrays:
+            state.parts.append(SegmentIndex(arrays))
+        self._states[path] = state
+
+    def _refresh_active(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._states.pop(path, None)
+            return
+        state = self._states.get(path)
+        if state is None or state.inode != st.st_ino or st.st_size < state.indexed_bytes:
+            # new file, rotated, or truncated: index from the start
+            state = _SegmentState(st.st_ino)
+            self._states[path] = state
+        if st.st_size == state.indexed_bytes:
+            return
+        with open(path, "rb") as f:
+            f.seek(state.indexed_bytes)
+            data = f.read(st.st_size - state.indexed_bytes)
+        start = state.indexed_bytes
+        if start == 0:
+            skip = self._data_start(data)
+            data, start = data[skip:], skip
+        # a partly written last row waits for the next refresh
+        ends = row_ends(data)
+        complete = int(ends[-1]) if len(ends) else 0
+        if complete:
+            state.parts.append(SegmentIndex.from_bytes(data[:complete], start, self.columns))
+        state.indexed_bytes = start + complete
+        if len(state.parts) > MAX_DELTAS:
+            state.parts = [SegmentIndex.concat(state.parts, self.columns, path)]
+
+    def _data_start(self, data):
+        """Byte offset of the first data row (past the header line, if there is one)."""
+        return len(self._header) if data.startswith(self._header) else 0
+
+    # ---------- queries ----------
+    def query(self, filters=None, since=None, until=None, approved=None, limit=100):
+        """
+        Transactions matching every given filter, newest first.
+
+        Args:
+            filters: {column: value} for any of KEY_COLUMNS
+            since, until: inclusive ISO timestamp bounds
+            approved: True/False to filter on the approval flag
+            limit: most rows returned; `count` still reports every match
+        Returns:
+            (count, rows) where rows are dicts with the journal columns
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        unknown = set(filters) - set(KEY_COLUMNS)
+        if unknown:
+            raise ValueError(f"cannot filter on {sorted(unknown)}")
+        since = parse_timestamp(since) if since is not None else None
+        until = parse_timestamp(until) if until is not None else None
+
+        for attempt in range(3):
+            count, picked, wanted = 0, [], limit
+            for path, inode, parts in reversed(self.refresh()):
+                for part in reversed(parts):
+                    rows = part.select(filters, since, until, approved)
+                    count += len(rows)
+                    if wanted > 0 and len(rows):
+                        picked.append((path, inode, part, rows[::-1][:wanted]))
+                        wanted -= len(picked[-1][3])
+            try:
+                return count, [row for item in picked for row in self._read(*item)]
+            except _SegmentMoved:
+                continue  # the active segment rotated under us; re-index and retry
+        raise RuntimeError("transaction log kept rotating during the query")
+
+    def _read(self, path, inode, part, rows):
+        out = []
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != inode:
+                raise _SegmentMoved(path)
+            for row in rows:
+                f.seek(int(part.offsets[row]))
+                line = f.read(int(part.lengths[row])).decode("utf-8")
+                values = next(csv.reader(io.StringIO(line, newline="")))
+                out.append(self._decode(dict(zip(self.columns, values))))
+        return out
+
+    @staticmethod
+    def _decode(row):
+        for name in ("requested_qty_kg", "predicted_max_kg", "rule_max_kg"):
+            try:
+                row[name] = float(row[name])
+            except (KeyError, ValueError):
+                pass
+        if "approved" in row:
+            row["approved"] = row["approved"].strip().lower() == "true"
+        return row
@@ -0,0 +1,183 @@
+"""
+Append-only transaction journal for the quota API.
+
+Submissions are queued to a single writer thread which appends everything
+that is waiting as one write + fsync (group commit), so cost per request
+stays flat no matter how large the log grows. The active segment keeps the
+original transaction_log.csv name; once it passes max_segment_bytes it is
+renamed to transaction_log.000001.csv, transaction_log.000002.csv, ... and a
+fresh active segment is started.
+
+Several uvicorn workers may share one journal: appends use O_APPEND and a
+flock on a sidecar lock file, so batches from different processes never
+interleave or overwrite each other.
+"""
+
+import csv
+import io
+import os
+import queue
+import threading
+
+from array_store import FileLock
+
+TX_COLUMNS = [
+    "timestamp", "transaction_id", "aadhaar", "farmer_id", "state", "district",
+    "crop", "requested_qty_kg", "predicted_max_kg", "rule_max_kg", "approved"
+]
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_BATCH = 1024
+
+
+class _PendingWrite:
+    """One queued row and the event its caller waits on."""
+    __slots__ = ("row", "done", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+
+
+class TransactionJournal:
+    """
+    Group-committed CSV journal with segment rotation.
+
+    Args:
+        path: active segment (e.g. transaction_log.csv)
+        columns: CSV header, also the order rows are written in
+        max_segment_bytes: rotate the active segment once it would grow past this
+        max_batch: most rows written by a single commit
+        fsync: flush each commit to stable storage before acknowledging it
+    """
+
+    def __init__(self, path, columns=TX_COLUMNS, max_segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 max_batch=DEFAULT_MAX_BATCH, fsync=True):
+        self.path = path
+        self.columns = list(columns)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self._header = self._encode([dict(zip(self.columns, self.columns))])
+        self._lock_path = path + ".lock"
+        self._thread_lock = threading.Lock()
+        self._queue = queue.Queue()
+        # guards _closed and the queue puts, so no row is queued behind the stop sentinel
+        self._queue_lock = threading.Lock()
+        self._closed = False
+        self._ensure_active_segment()
+        self._writer = threading.Thread(target=self._run, name="transaction-journal", daemon=True)
+        self._writer.start()
+
+    # ---------- public API ----------
+    def append(self, row: dict, timeout: float = None):
+        """Queue one row and block until the batch holding it is on disk."""
+        pending = _PendingWrite(row)
+        with self._queue_lock:
+            if self._closed:
+                raise RuntimeError("Transaction journal is closed.")
+            self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for transaction journal commit.")
+        if pending.error is not None:
+            raise pending.error
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        with self._queue_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+
+    def segments(self):
+        """All segment paths, oldest first; the active segment is last."""
+        return [path for _, path in self._sealed_segments()] + [self.path]
+
+    # ---------- writer thread ----------
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # everything that queued up while the previous fsync ran goes in this commit
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._commit([p.row for p in batch])
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            for p in batch:
+                p.done.set()
+
+    def _commit(self, rows):
+        data = self._encode(rows)
+        with self._locked():
+            self._maybe_rotate(len(data))
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    data = self._header + data
+                os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _encode(self, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        for row in rows:
+            writer.writerow([row.get(col, "") for col in self.columns])
+        return buf.getvalue().encode("utf-8")
+
+    # ---------- segments ----------
+    def _ensure_active_segment(self):
+        with self._locked():
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                with open(self.path, "wb") as f:
+                    f.write(self._header)
+
+    def _maybe_rotate(self, incoming):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if size <= len(self._header) or size + incoming <= self.max_segment_bytes:
+            return
+        sealed = self._sealed_segments()
+        next_no = sealed[-1][0] + 1 if sealed else 1
+        os.rename(self.path, self._segment_path(next_no))
+
+    def _segment_path(self, number):
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.{number:06d}{ext}"
+
+    def _sealed_segments(self):
+        base, ext = os.path.splitext(self.path)
+        folder = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(base) + "."
+        found = []
+        for name in os.listdir(folder):
+            if not (name.startswith(prefix) and name.endswith(ext)):
+                continue
+            number = name[len(prefix):len(name) - len(ext)]
+            if number.isdigit():
+                found.append((int(number), os.path.join(folder, name)))
+        return sorted(found)
+
+    def _locked(self):
+        return FileLock(self._lock_path, self._thread_lock)
+
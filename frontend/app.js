@@ -169,36 +169,26 @@ document.addEventListener('DOMContentLoaded', () => {
                 `;
             }
 
-            // Check fertilizer eligibility
-            const fertilizerResponse = await fetch(`${API_URL}/api/check-eligibility`, {
+            // Check fertilizer and seed eligibility in one request
+            const eligibilityResponse = await fetch(`${API_URL}/api/check-eligibility/batch`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
-                    crop_type: cropType,
-                    land_size_acres: landSize,
-                    requested_qty: 1,  // Dummy value to get allowed quantity
-                    subsidy_type: 'fertilizer'
+                    items: [{
+                        crop_type: cropType,
+                        land_size_acres: landSize,
+                        fertilizer_qty: 1,  // Dummy values to get allowed quantities
+                        seed_qty: 1
+                    }]
                 })
             });
 
-            const fertilizerData = await fertilizerResponse.json();
-
-            // Check seed eligibility
-            const seedResponse = await fetch(`${API_URL}/api/check-eligibility`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    crop_type: cropType,
-                    land_size_acres: landSize,
-                    requested_qty: 1,  // Dummy value to get allowed quantity
-                    subsidy_type: 'seed'
-                })
-            });
-
-            const seedData = await seedResponse.json();
+            const eligibilityData = await eligibilityResponse.json();
+            const fertilizerData = eligibilityResponse.ok ? eligibilityData.results[0].fertilizer : null;
+            const seedData = eligibilityResponse.ok ? eligibilityData.results[0].seed : null;
 
             // Display allowed quantities and auto-set hidden field values
-            if (fertilizerResponse.ok && seedResponse.ok && section) {
+            if (eligibilityResponse.ok && section) {
                 // Display the calculated quantities
                 section.innerHTML = `
                     <h4 style="margin: 0 0 15px 0; color: #1e3a8a;">